@@ -0,0 +1,62 @@
+"""
+import mmos 的耗时基准
+
+在全新的解释器中多次执行 import mmos，取最快一次的耗时与预算比较，
+并检查导入后没有加载 NumPy、pydantic 等较重的依赖。超出预算时以非零状态退出。
+
+用法:
+    python benchmarks/import_time.py [--budget-ms 50] [--repeat 5]
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+# 只有真正用到相应功能时才允许加载的模块
+HEAVY_MODULES = ["numpy", "pydantic", "openai", "chromadb", "sklearn", "dotenv"]
+
+_PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import mmos
+elapsed = time.perf_counter() - start
+print(json.dumps({"ms": elapsed * 1000, "loaded": [m for m in %r if m in sys.modules]}))
+""" % (HEAVY_MODULES,)
+
+
+def measure(repeat: int) -> dict:
+    """在子进程中测量 import mmos，返回最快一次的结果"""
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ, PYTHONPATH=root + os.pathsep + os.environ.get("PYTHONPATH", ""))
+    best = None
+    for _ in range(repeat):
+        output = subprocess.run([sys.executable, "-c", _PROBE], env=env, check=True,
+                                capture_output=True, text=True).stdout
+        result = json.loads(output)
+        if best is None or result["ms"] < best["ms"]:
+            best = result
+    return best
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="import mmos 耗时基准")
+    parser.add_argument("--budget-ms", type=float, default=50.0, help="允许的最长导入耗时（毫秒）")
+    parser.add_argument("--repeat", type=int, default=5, help="测量次数，取最快一次")
+    args = parser.parse_args()
+
+    result = measure(args.repeat)
+    print(f"import mmos: {result['ms']:.1f} ms（预算 {args.budget_ms:.0f} ms）")
+    ok = True
+    if result["ms"] > args.budget_ms:
+        print("超出导入耗时预算")
+        ok = False
+    if result["loaded"]:
+        print(f"导入时加载了较重的依赖: {', '.join(result['loaded'])}")
+        ok = False
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,21 +1,61 @@
 """
 MMOS - AI记忆管理系统
+
+包内的类在首次访问时才导入对应的模块（PEP 562），
+import mmos 本身不会加载 NumPy、pydantic 等较重的依赖。
 """
 
-from .memory_manager import MemoryManager
-from .models import Memory
-from .vector_store import SimpleVectorStore
-from .config import MMOSConfig, ModuleConfig, StorageConfig
-from .memory_factory import MMOSMemorySystem, MemoryModuleFactory
+import importlib
+from typing import Any, List, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from .memory_manager import MemoryManager
+    from .models import Memory
+    from .filters import MemoryFilter
+    from .vector_store import SimpleVectorStore
+    from .config import MMOSConfig, ModuleConfig, StorageConfig
+    from .memory_factory import MMOSMemorySystem, MemoryModuleFactory
+    from .tenancy import TenantMemorySystem, QuotaExceededError
 
 __version__ = "0.1.0"
 __all__ = [
-    "MemoryManager", 
-    "Memory", 
-    "SimpleVectorStore", 
-    "MMOSConfig", 
-    "ModuleConfig", 
-    "StorageConfig", 
+    "MemoryManager",
+    "Memory",
+    "MemoryFilter",
+    "SimpleVectorStore",
+    "MMOSConfig",
+    "ModuleConfig",
+    "StorageConfig",
     "MMOSMemorySystem",
-    "MemoryModuleFactory"
-] 
\ No newline at end of file
+    "MemoryModuleFactory",
+    "TenantMemorySystem",
+    "QuotaExceededError"
+]
+
+# 公开名称 -> 所在的子模块
+_LAZY_ATTRIBUTES = {
+    "MemoryManager": ".memory_manager",
+    "Memory": ".models",
+    "MemoryFilter": ".filters",
+    "SimpleVectorStore": ".vector_store",
+    "MMOSConfig": ".config",
+    "ModuleConfig": ".config",
+    "StorageConfig": ".config",
+    "MMOSMemorySystem": ".memory_factory",
+    "MemoryModuleFactory": ".memory_factory",
+    "TenantMemorySystem": ".tenancy",
+    "QuotaExceededError": ".tenancy",
+}
+
+
+def __getattr__(name: str) -> Any:
+    module_name = _LAZY_ATTRIBUTES.get(name)
+    if module_name is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(module_name, __name__), name)
+    globals()[name] = value  # 之后的访问不再经过 __getattr__
+    return value
+
+
+def __dir__() -> List[str]:
+    return sorted(set(globals()) | set(__all__))
@@ -0,0 +1,119 @@
+"""
+asyncio 辅助工具
+
+把阻塞调用放到线程池中执行，并提供协程间的读写锁。
+asyncio 的锁、信号量等同步原语绑定到首次使用它们的事件循环，
+需要在多个事件循环中使用的对象通过 LoopLocal 为每个循环各建一份。
+"""
+
+import asyncio
+import functools
+import threading
+import weakref
+from concurrent.futures import Executor
+from contextlib import asynccontextmanager
+from typing import Any, Callable, Generic, Optional, AsyncIterator, TypeVar
+
+T = TypeVar("T")
+
+
+async def run_blocking(executor: Optional[Executor], func: Callable[..., Any],
+                       *args: Any, **kwargs: Any) -> Any:
+    """
+    在线程池中执行阻塞函数并等待结果
+
+    参数:
+        executor: 线程池，为None时使用事件循环的默认线程池
+        func: 阻塞函数
+        *args, **kwargs: 传给 func 的参数
+
+    返回:
+        func 的返回值
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(executor, functools.partial(func, *args, **kwargs))
+
+
+class LoopLocal(Generic[T]):
+    """按事件循环分别创建的对象
+
+    get() 返回当前运行中的事件循环对应的实例，首次在某个循环中调用时由 factory 创建；
+    事件循环被回收后其实例随之释放。
+    """
+
+    def __init__(self, factory: Callable[[], T]):
+        """
+        初始化
+
+        参数:
+            factory: 创建实例的无参函数
+        """
+        self._factory = factory
+        self._values: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, T]" = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()  # 不同线程中的事件循环可能同时调用 get()
+
+    def get(self) -> T:
+        """当前事件循环的实例，只能在协程中调用"""
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            value = self._values.get(loop)
+            if value is None:
+                value = self._values[loop] = self._factory()
+            return value
+
+
+class AsyncReadWriteLock:
+    """协程读写锁
+
+    读者之间可以并发，写者独占；有写者在等待时新的读者需要排队，避免写者饥饿。
+    一个实例只能在一个事件循环中使用，多个循环各自需要一把锁时使用 LoopLocal。
+    """
+
+    def __init__(self):
+        self._readers = 0
+        self._writing = False
+        self._waiting_writers = 0
+        self._condition: Optional[asyncio.Condition] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def _get_condition(self) -> asyncio.Condition:
+        # 在事件循环内首次使用时才创建，之后不允许在其他事件循环中使用
+        loop = asyncio.get_running_loop()
+        if self._condition is None:
+            self._condition = asyncio.Condition()
+            self._loop = loop
+        elif loop is not self._loop:
+            raise RuntimeError("AsyncReadWriteLock 已绑定到另一个事件循环")
+        return self._condition
+
+    @asynccontextmanager
+    async def read(self) -> AsyncIterator[None]:
+        """以读者身份持有锁"""
+        condition = self._get_condition()
+        async with condition:
+            await condition.wait_for(lambda: not self._writing and not self._waiting_writers)
+            self._readers += 1
+        try:
+            yield
+        finally:
+            async with condition:
+                self._readers -= 1
+                condition.notify_all()
+
+    @asynccontextmanager
+    async def write(self) -> AsyncIterator[None]:
+        """以写者身份独占锁"""
+        condition = self._get_condition()
+        async with condition:
+            self._waiting_writers += 1
+            try:
+                await condition.wait_for(lambda: not self._writing and not self._readers)
+            finally:
+                self._waiting_writers -= 1
+            self._writing = True
+        try:
+            yield
+        finally:
+            async with condition:
+                self._writing = False
+                condition.notify_all()
@@ -0,0 +1,514 @@
+"""
+近似最近邻（ANN）向量索引
+
+在 SimpleVectorStore 的矩阵存储之上提供 IVF-Flat（纯 NumPy）与可选的 HNSW 实现，
+通过 create_vector_store 按模块参数选择。
+"""
+
+import logging
+import threading
+from typing import List, Dict, Any, Optional, Tuple, Callable, Set
+
+import numpy as np
+
+from .models import Memory
+from .vector_store import SimpleVectorStore
+
+logger = logging.getLogger(__name__)
+
+
+def kmeans(data: np.ndarray, k: int, iterations: int = 20, seed: int = 0,
+           spherical: bool = True) -> np.ndarray:
+    """
+    k-means 聚类
+
+    参数:
+        data: (N×D) 训练数据
+        k: 聚类数，超过 N 时取 N
+        iterations: 迭代次数
+        seed: 随机种子
+        spherical: True 时为球面 k-means（内积度量，质心归一化），
+            False 时为欧氏距离 k-means（质心取均值）
+
+    返回:
+        (k×D) 的 float32 质心矩阵
+    """
+    data = np.asarray(data, dtype=np.float32)
+    k = min(k, data.shape[0])
+    rng = np.random.RandomState(seed)
+    centroids = data[rng.choice(data.shape[0], k, replace=False)].copy()
+    for _ in range(iterations):
+        if spherical:
+            labels = np.argmax(data @ centroids.T, axis=1)
+        else:
+            # argmin ||x - c||² 等价于 argmax (x·c - ||c||²/2)
+            half_norms = 0.5 * (centroids * centroids).sum(axis=1)
+            labels = np.argmax(data @ centroids.T - half_norms, axis=1)
+        counts = np.bincount(labels, minlength=k)
+        # 按簇排序后分段求和，比 np.add.at 快得多
+        order = np.argsort(labels, kind="stable")
+        present = np.flatnonzero(counts)
+        starts = np.concatenate([[0], np.cumsum(counts[present])[:-1]])
+        sums = np.zeros_like(centroids)
+        sums[present] = np.add.reduceat(data[order], starts, axis=0)
+        # 空簇重新随机取一个样本作为质心
+        empty = np.flatnonzero(counts == 0)
+        if empty.shape[0]:
+            sums[empty] = data[rng.choice(data.shape[0], empty.shape[0], replace=False)]
+        if spherical:
+            norms = np.linalg.norm(sums, axis=1, keepdims=True)
+            norms[norms == 0] = 1.0
+            centroids = sums / norms
+        else:
+            centroids = sums / np.maximum(counts, 1)[:, None]
+    return centroids.astype(np.float32)
+
+
+class IVFVectorStore(SimpleVectorStore):
+    """IVF-Flat 向量存储
+
+    用 k-means 把向量划分到 nlist 个倒排桶，查询时只扫描与查询最接近的 nprobe 个桶。
+    向量数达到 train_threshold 后才训练质心，之前以及集合小于 exact_threshold 时
+    退回精确搜索。训练后新增的向量直接分配到最近的桶；向量数增长到上次训练时的
+    retrain_factor 倍后重新训练。
+
+    训练由写入触发，默认在后台线程中对启动时矩阵的副本运行 k-means 并分桶，
+    查询不会等待训练：首次训练完成前使用精确搜索，重新训练期间继续使用旧质心。
+    训练结果在下一次持锁的写入或查询时整体替换进来，训练期间写入的行届时单独分桶。
+    """
+
+    # 后台分桶时每次打分的行数，控制临时内存
+    _ASSIGN_CHUNK_ROWS = 8192
+
+    def __init__(self,
+                 embedding_function: Optional[Callable[[str], np.ndarray]] = None,
+                 dimension: int = 384,
+                 batch_embedding_function: Optional[Callable[[List[str]], np.ndarray]] = None,
+                 nlist: int = 100,
+                 nprobe: int = 8,
+                 train_threshold: Optional[int] = None,
+                 exact_threshold: Optional[int] = None,
+                 retrain_factor: float = 4.0,
+                 max_train_samples: Optional[int] = None,
+                 background_training: bool = True,
+                 keep_exact: bool = False):
+        """
+        初始化 IVF 向量存储
+
+        参数:
+            embedding_function: 同 SimpleVectorStore
+            dimension: 同 SimpleVectorStore
+            batch_embedding_function: 同 SimpleVectorStore
+            nlist: 倒排桶数量
+            nprobe: 查询时扫描的桶数，越大召回越高、延迟越高
+            train_threshold: 开始训练所需的最少向量数，默认 nlist * 39
+            exact_threshold: 向量数低于该值时使用精确搜索，默认等于 train_threshold
+            retrain_factor: 向量数增长到上次训练时的多少倍后重新训练
+            max_train_samples: 训练 k-means 时最多采样的向量数，默认 nlist * 256
+            background_training: 是否在后台线程中训练；False 时在触发训练的写入中同步训练
+            keep_exact: 同 SimpleVectorStore
+        """
+        super().__init__(embedding_function, dimension, batch_embedding_function, keep_exact)
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.train_threshold = train_threshold if train_threshold is not None else nlist * 39
+        self.exact_threshold = exact_threshold if exact_threshold is not None else self.train_threshold
+        self.retrain_factor = retrain_factor
+        self.max_train_samples = max_train_samples if max_train_samples is not None else nlist * 256
+        self.background_training = background_training
+        self._assign = np.zeros(0, dtype=np.int32)  # 行号 -> 桶编号
+        self._centroids: Optional[np.ndarray] = None
+        self._trained_size = 0
+        # 按桶排好序的行号缓存；_indexed_size 之后新增的行尚未进入缓存
+        self._list_rows = np.zeros(0, dtype=np.int64)
+        self._list_offsets = np.zeros(1, dtype=np.int64)
+        self._indexed_size = 0
+        self._lists_dirty = True
+        # 后台训练状态：_training_rows 不为None表示有训练尚未生效，记录期间写入的行；
+        # 行号重排或同步训练时递增 _training_token，作废进行中的训练
+        self._training_thread: Optional[threading.Thread] = None
+        self._training_token = 0
+        self._training_rows: Optional[Set[int]] = None
+        self._training_result: Optional[tuple] = None
+
+    @property
+    def is_trained(self) -> bool:
+        return self._centroids is not None
+
+    def _ensure_capacity(self, rows: int, dimension: int) -> None:
+        super()._ensure_capacity(rows, dimension)
+        capacity = self._matrix.shape[0]
+        if self._assign.shape[0] < capacity:
+            assign = np.zeros(capacity, dtype=np.int32)
+            assign[:self._assign.shape[0]] = self._assign
+            self._assign = assign
+
+    def _compact(self) -> None:
+        keep = np.flatnonzero(self._alive[:self._size])
+        self._assign[:keep.shape[0]] = self._assign[keep]
+        super()._compact()
+        self._lists_dirty = True
+        self._cancel_training()  # 行号已变化，进行中的训练结果不再适用
+
+    def _set_vector(self, memory_id: str, vector: np.ndarray) -> None:
+        super()._set_vector(memory_id, vector)
+        row = self._id_to_row[memory_id]
+        if self._training_rows is not None:
+            self._training_rows.add(row)
+        if self._centroids is not None:
+            bucket = int(np.argmax(self._centroids @ self._matrix[row]))
+            if row < self._indexed_size and bucket != self._assign[row]:
+                self._lists_dirty = True
+            self._assign[row] = bucket
+
+    def _training_sample(self, rows: np.ndarray) -> np.ndarray:
+        """训练用的样本向量（副本）"""
+        if rows.shape[0] > self.max_train_samples:
+            rng = np.random.RandomState(0)
+            rows = np.sort(rng.choice(rows, self.max_train_samples, replace=False))
+        return self._matrix[rows]
+
+    def train(self) -> None:
+        """用当前向量同步训练质心并重新分桶，进行中的后台训练会被作废"""
+        with self._lock:
+            self._cancel_training()
+            rows = np.flatnonzero(self._alive[:self._size])
+            if rows.shape[0] == 0:
+                return
+            self._centroids = kmeans(self._training_sample(rows), self.nlist)
+            self._assign[:self._size] = np.argmax(self._matrix[:self._size] @ self._centroids.T, axis=1)
+            self._trained_size = rows.shape[0]
+            self._lists_dirty = True
+
+    def _start_training(self) -> None:
+        """在后台线程中训练质心，并为启动时已有的行分桶；调用方需持有 self._lock"""
+        rows = np.flatnonzero(self._alive[:self._size])
+        self._training_token += 1
+        self._training_rows = set()
+        self._training_result = None
+        # 训练线程只读取副本，之后的写入、压缩与扩容不会影响它
+        matrix = self._matrix[:self._size].copy()
+        self._training_thread = threading.Thread(
+            target=self._train_in_background,
+            args=(self._training_token, self._training_sample(rows), matrix, rows.shape[0]),
+            name="mmos-ivf-train", daemon=True,
+        )
+        self._training_thread.start()
+
+    def _train_in_background(self, token: int, sample: np.ndarray, matrix: np.ndarray,
+                             trained_size: int) -> None:
+        size = matrix.shape[0]
+        try:
+            centroids = kmeans(sample, self.nlist)
+            assign = np.empty(size, dtype=np.int32)
+            for start in range(0, size, self._ASSIGN_CHUNK_ROWS):
+                end = min(start + self._ASSIGN_CHUNK_ROWS, size)
+                assign[start:end] = np.argmax(matrix[start:end] @ centroids.T, axis=1)
+        except Exception:
+            logger.exception("训练 IVF 质心失败")
+            return
+        with self._lock:
+            if token == self._training_token:
+                self._training_result = (token, centroids, assign, trained_size)
+
+    def _cancel_training(self) -> None:
+        self._training_token += 1
+        self._training_rows = None
+        self._training_result = None
+
+    def _apply_training(self) -> None:
+        """让已完成的后台训练生效：训练期间写入或新增的行用新质心重新分桶；调用方需持有 self._lock"""
+        result = self._training_result
+        if result is None:
+            return
+        self._training_result = None
+        token, centroids, assign, trained_size = result
+        if token != self._training_token or self._training_rows is None:
+            return
+        size = assign.shape[0]
+        rows = np.union1d(np.fromiter(self._training_rows, dtype=np.int64, count=len(self._training_rows)),
+                          np.arange(size, self._size, dtype=np.int64))
+        self._training_rows = None
+        self._assign[:size] = assign
+        if rows.shape[0]:
+            self._assign[rows] = np.argmax(self._matrix[rows] @ centroids.T, axis=1)
+        self._centroids = centroids
+        self._trained_size = trained_size
+        self._lists_dirty = True
+
+    def wait_for_training(self) -> None:
+        """等待后台训练完成并让结果生效"""
+        thread = self._training_thread
+        if thread:
+            thread.join()
+        with self._lock:
+            self._apply_training()
+
+    def _build_lists(self) -> None:
+        """重建按桶排序的行号缓存"""
+        assign = self._assign[:self._size]
+        self._list_rows = np.argsort(assign, kind="stable")
+        self._list_offsets = np.searchsorted(assign[self._list_rows],
+                                             np.arange(self._centroids.shape[0] + 1))
+        self._indexed_size = self._size
+        self._lists_dirty = False
+
+    def _maybe_train(self) -> None:
+        """写入后检查是否需要训练或重新训练；调用方需持有 self._lock"""
+        self._apply_training()
+        alive = len(self._id_to_row)
+        if self._centroids is None:
+            needed = alive >= self.train_threshold
+        else:
+            needed = alive >= self._trained_size * self.retrain_factor
+        if not needed:
+            return
+        if not self.background_training:
+            self.train()
+        elif self._training_rows is None and not (self._training_thread and self._training_thread.is_alive()):
+            self._start_training()
+
+    def _add_vectors(self, memories: List[Memory], vectors: np.ndarray) -> None:
+        super()._add_vectors(memories, vectors)
+        self._maybe_train()
+
+    def remove_memory(self, memory_id: str) -> bool:
+        with self._lock:
+            removed = super().remove_memory(memory_id)
+            if removed:
+                self._maybe_train()
+            return removed
+
+    def _probe_rows(self, query_vector: np.ndarray) -> np.ndarray:
+        """与查询最接近的 nprobe 个桶中的有效行号"""
+        centroid_scores = self._centroids @ query_vector
+        nprobe = min(self.nprobe, self._centroids.shape[0])
+        probes = np.argpartition(-centroid_scores, nprobe - 1)[:nprobe]
+        tail = self._size - self._indexed_size
+        if self._lists_dirty or tail > max(1024, self._indexed_size // 8):
+            self._build_lists()
+        offsets = self._list_offsets
+        parts = [self._list_rows[offsets[p]:offsets[p + 1]] for p in probes]
+        if self._size > self._indexed_size:
+            tail_rows = np.arange(self._indexed_size, self._size)
+            parts.append(tail_rows[np.isin(self._assign[tail_rows], probes)])
+        rows = np.concatenate(parts)
+        rows = rows[self._alive[rows]]
+        rows.sort()  # 保持行号顺序，同分时先插入的在前
+        return rows
+
+    def _search_vector(self, query_vector: np.ndarray, top_k: int) -> List[Tuple[str, float]]:
+        self._apply_training()
+        if self._centroids is None or len(self._id_to_row) < self.exact_threshold:
+            return super()._search_vector(query_vector, top_k)
+
+        query32 = np.asarray(query_vector, dtype=np.float32).ravel()
+        rows = self._probe_rows(query32)
+        if rows.shape[0] == 0:
+            return []
+        scores = self._matrix[rows] @ query32
+        picked = self._select_candidates(scores, min(top_k + self._RERANK_PADDING, rows.shape[0]),
+                                         query_vector)
+        rows, exact = self._rerank(rows[picked], query_vector, min(top_k, rows.shape[0]))
+        return [(self._row_ids[row], float(score)) for row, score in zip(rows, exact)]
+
+    def _search_batch(self, query_matrix: np.ndarray, top_k: int) -> List[List[Tuple[str, float]]]:
+        self._apply_training()
+        if self._centroids is None or len(self._id_to_row) < self.exact_threshold:
+            return super()._search_batch(query_matrix, top_k)
+        return [self._search_vector(query_vector, top_k) for query_vector in query_matrix]
+
+    def clear(self) -> None:
+        with self._lock:
+            super().clear()
+            self._cancel_training()
+            self._assign = np.zeros(0, dtype=np.int32)
+            self._centroids = None
+            self._trained_size = 0
+            self._list_rows = np.zeros(0, dtype=np.int64)
+            self._list_offsets = np.zeros(1, dtype=np.int64)
+            self._indexed_size = 0
+            self._lists_dirty = True
+
+
+class HNSWVectorStore(SimpleVectorStore):
+    """基于 hnswlib 的 HNSW 向量存储
+
+    向量同时保存在 SimpleVectorStore 的矩阵中，集合小于 exact_threshold 时使用精确搜索。
+    需要安装 hnswlib。
+    """
+
+    def __init__(self,
+                 embedding_function: Optional[Callable[[str], np.ndarray]] = None,
+                 dimension: int = 384,
+                 batch_embedding_function: Optional[Callable[[List[str]], np.ndarray]] = None,
+                 ef: int = 64,
+                 ef_construction: int = 200,
+                 m: int = 16,
+                 exact_threshold: int = 10000,
+                 keep_exact: bool = False):
+        """
+        初始化 HNSW 向量存储
+
+        参数:
+            embedding_function: 同 SimpleVectorStore
+            dimension: 同 SimpleVectorStore
+            batch_embedding_function: 同 SimpleVectorStore
+            ef: 查询时的候选列表大小，越大召回越高、延迟越高
+            ef_construction: 建图时的候选列表大小
+            m: 每个节点的最大连接数
+            exact_threshold: 向量数低于该值时使用精确搜索
+            keep_exact: 同 SimpleVectorStore
+        """
+        import hnswlib  # 可选依赖，仅在使用 HNSW 时需要
+
+        super().__init__(embedding_function, dimension, batch_embedding_function, keep_exact)
+        self._hnswlib = hnswlib
+        self.ef = ef
+        self.ef_construction = ef_construction
+        self.m = m
+        self.exact_threshold = exact_threshold
+        self._graph = None
+        self._labels: Dict[str, int] = {}     # memory_id -> 图节点标签
+        self._label_ids: Dict[int, str] = {}  # 图节点标签 -> memory_id
+        self._next_label = 0
+
+    def _ensure_graph(self, dimension: int) -> None:
+        if self._graph is None:
+            self._graph = self._hnswlib.Index(space="ip", dim=dimension)
+            self._graph.init_index(max_elements=self._INITIAL_CAPACITY,
+                                   ef_construction=self.ef_construction, M=self.m,
+                                   allow_replace_deleted=False)
+        if self._next_label >= self._graph.get_max_elements():
+            self._graph.resize_index(self._graph.get_max_elements() * self._GROWTH_FACTOR)
+
+    def _set_vector(self, memory_id: str, vector: np.ndarray) -> None:
+        super()._set_vector(memory_id, vector)
+        self._ensure_graph(self._matrix.shape[1])
+        old_label = self._labels.pop(memory_id, None)
+        if old_label is not None:
+            self._graph.mark_deleted(old_label)
+            del self._label_ids[old_label]
+        label = self._next_label
+        self._next_label += 1
+        self._graph.add_items(self._matrix[self._id_to_row[memory_id]][None, :], [label])
+        self._labels[memory_id] = label
+        self._label_ids[label] = memory_id
+
+    def remove_memory(self, memory_id: str) -> bool:
+        with self._lock:
+            label = self._labels.pop(memory_id, None)
+            if label is not None:
+                self._graph.mark_deleted(label)
+                del self._label_ids[label]
+            return super().remove_memory(memory_id)
+
+    def _search_vector(self, query_vector: np.ndarray, top_k: int) -> List[Tuple[str, float]]:
+        alive = len(self._id_to_row)
+        if self._graph is None or alive < self.exact_threshold:
+            return super()._search_vector(query_vector, top_k)
+        k = min(top_k + self._RERANK_PADDING, alive)
+        self._graph.set_ef(max(self.ef, k))
+        labels, _ = self._graph.knn_query(np.asarray(query_vector, dtype=np.float32)[None, :], k=k)
+        rows = np.array([self._id_to_row[self._label_ids[label]] for label in labels[0]],
+                        dtype=np.int64)
+        rows, exact = self._rerank(rows, query_vector, min(top_k, alive))
+        return [(self._row_ids[row], float(score)) for row, score in zip(rows, exact)]
+
+    def _search_batch(self, query_matrix: np.ndarray, top_k: int) -> List[List[Tuple[str, float]]]:
+        if self._graph is None or len(self._id_to_row) < self.exact_threshold:
+            return super()._search_batch(query_matrix, top_k)
+        return [self._search_vector(query_vector, top_k) for query_vector in query_matrix]
+
+    def clear(self) -> None:
+        with self._lock:
+            super().clear()
+            self._graph = None
+            self._labels = {}
+            self._label_ids = {}
+            self._next_label = 0
+
+
+def create_vector_store(params: Optional[Dict[str, Any]] = None,
+                        embedding_function: Optional[Callable[[str], np.ndarray]] = None,
+                        batch_embedding_function: Optional[Callable[[List[str]], np.ndarray]] = None
+                        ) -> Any:
+    """
+    根据模块参数创建向量存储
+
+    参数:
+        params: 模块参数，支持的键：
+            index: "flat"（精确搜索，默认）、"ivf" 或 "hnsw"
+            persist_directory: 指定时使用磁盘分段存储（精确搜索），重启后无需重新嵌入
+            seal_threshold / max_segments: 分段存储参数
+            dimension: 向量维度
+            nlist / nprobe / train_threshold / exact_threshold / retrain_factor /
+                max_train_samples / background_training: IVF 参数
+            ef / ef_construction / m / exact_threshold: HNSW 参数
+            keep_exact: flat（float32）、ivf 与 hnsw 是否另存原始精度的向量用于精排，默认 False
+            precision: 精确搜索的存储精度，"float32"（默认）、"float16"、"int8" 或 "pq"
+            pq_m / pq_train_threshold / rerank_factor: 量化存储参数
+        embedding_function: 嵌入函数
+        batch_embedding_function: 批量嵌入函数
+
+    返回:
+        向量存储实例
+    """
+    params = params or {}
+    index = params.get("index", "flat")
+    common = {
+        "embedding_function": embedding_function,
+        "dimension": params.get("dimension", 384),
+        "batch_embedding_function": batch_embedding_function,
+    }
+
+    if params.get("persist_directory"):
+        from .segments import SegmentedVectorStore
+        return SegmentedVectorStore(
+            params["persist_directory"],
+            seal_threshold=params.get("seal_threshold", 10000),
+            max_segments=params.get("max_segments", 8),
+            **common,
+        )
+
+    if index == "hnsw":
+        try:
+            return HNSWVectorStore(
+                ef=params.get("ef", 64),
+                ef_construction=params.get("ef_construction", 200),
+                m=params.get("m", 16),
+                exact_threshold=params.get("exact_threshold", 10000),
+                keep_exact=params.get("keep_exact", False),
+                **common,
+            )
+        except ImportError:
+            logger.warning("未安装 hnswlib，使用 IVF 索引代替")
+            index = "ivf"
+
+    if index == "ivf":
+        return IVFVectorStore(
+            nlist=params.get("nlist", 100),
+            nprobe=params.get("nprobe", 8),
+            train_threshold=params.get("train_threshold"),
+            exact_threshold=params.get("exact_threshold"),
+            retrain_factor=params.get("retrain_factor", 4.0),
+            max_train_samples=params.get("max_train_samples"),
+            background_training=params.get("background_training", True),
+            keep_exact=params.get("keep_exact", False),
+            **common,
+        )
+
+    if index == "flat":
+        precision = params.get("precision", "float32")
+        if precision == "float32":
+            return SimpleVectorStore(keep_exact=params.get("keep_exact", False), **common)
+        from .quantization import QuantizedVectorStore
+        return QuantizedVectorStore(
+            precision=precision,
+            pq_m=params.get("pq_m", 8),
+            pq_train_threshold=params.get("pq_train_threshold"),
+            rerank_factor=params.get("rerank_factor", 4),
+            **common,
+        )
+
+    raise ValueError(f"不支持的向量索引类型: {index}")
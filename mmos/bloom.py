@@ -0,0 +1,164 @@
+"""
+布隆过滤器
+
+用于在昂贵的相似度计算之前快速排除明显无关的内容：判定为不存在时一定不存在，
+判定为存在时有可配置的误判率。可序列化为字典，随会话状态一起保存。
+"""
+
+import base64
+import hashlib
+import math
+from typing import List, Dict, Any
+
+
+class BloomFilter:
+    """固定容量的布隆过滤器
+
+    k 个哈希位置由一次 blake2b 摘要的两半按增强双重哈希生成
+    （每步 h1 += h2, h2 += i），避免普通双重哈希在小位数组上的误判率偏高。
+    """
+
+    def __init__(self, capacity: int = 1024, error_rate: float = 0.01):
+        """
+        初始化
+
+        参数:
+            capacity: 预计写入的元素数，超过后误判率会高于 error_rate
+            error_rate: 写满 capacity 个元素时的误判率，取值 (0, 1)
+        """
+        if capacity <= 0:
+            raise ValueError("capacity 必须大于0")
+        if not 0 < error_rate < 1:
+            raise ValueError("error_rate 必须在 (0, 1) 之间")
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.bit_count = max(8, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hash_count = max(1, round(self.bit_count / capacity * math.log(2)))
+        self.count = 0
+        self._bits = bytearray((self.bit_count + 7) // 8)
+
+    def __len__(self) -> int:
+        """已写入的不同元素数（近似值，误判为已存在的元素不计入）"""
+        return self.count
+
+    def _positions(self, item: str) -> List[int]:
+        digest = hashlib.blake2b(item.encode("utf-8"), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little")
+        bit_count = self.bit_count
+        positions = []
+        for i in range(self.hash_count):
+            positions.append(h1 % bit_count)
+            h1 += h2
+            h2 += i + 1
+        return positions
+
+    def add(self, item: str) -> bool:
+        """
+        写入一个元素
+
+        参数:
+            item: 元素
+
+        返回:
+            元素此前是否不在过滤器中
+        """
+        added = False
+        bits = self._bits
+        for position in self._positions(item):
+            mask = 1 << (position & 7)
+            if not bits[position >> 3] & mask:
+                bits[position >> 3] |= mask
+                added = True
+        if added:
+            self.count += 1
+        return added
+
+    def __contains__(self, item: str) -> bool:
+        bits = self._bits
+        return all(bits[position >> 3] & (1 << (position & 7)) for position in self._positions(item))
+
+    def is_full(self) -> bool:
+        """写入的元素数是否已达到容量"""
+        return self.count >= self.capacity
+
+    def to_dict(self) -> Dict[str, Any]:
+        """转换为可 JSON 序列化的字典"""
+        return {
+            "capacity": self.capacity,
+            "error_rate": self.error_rate,
+            "count": self.count,
+            "bits": base64.b64encode(bytes(self._bits)).decode("ascii"),
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "BloomFilter":
+        """从 to_dict 的结果恢复"""
+        bloom = cls(data["capacity"], data["error_rate"])
+        bits = base64.b64decode(data["bits"])
+        if len(bits) != len(bloom._bits):
+            raise ValueError("布隆过滤器数据长度与参数不一致")
+        bloom._bits = bytearray(bits)
+        bloom.count = data["count"]
+        return bloom
+
+
+class ScalableBloomFilter:
+    """可增长的布隆过滤器
+
+    当前层写满后追加一层容量翻倍、误判率减半的过滤器，各层误判率之和
+    约为 error_rate，因此无需预先知道元素总数。
+    """
+
+    def __init__(self, error_rate: float = 0.01, initial_capacity: int = 64):
+        """
+        初始化
+
+        参数:
+            error_rate: 整体误判率，取值 (0, 1)
+            initial_capacity: 第一层的容量
+        """
+        if not 0 < error_rate < 1:
+            raise ValueError("error_rate 必须在 (0, 1) 之间")
+        self.error_rate = error_rate
+        self.initial_capacity = initial_capacity
+        self._layers = [BloomFilter(initial_capacity, error_rate / 2)]
+
+    def __len__(self) -> int:
+        return sum(len(layer) for layer in self._layers)
+
+    def __contains__(self, item: str) -> bool:
+        return any(item in layer for layer in self._layers)
+
+    def add(self, item: str) -> bool:
+        """
+        写入一个元素
+
+        参数:
+            item: 元素
+
+        返回:
+            元素此前是否不在过滤器中
+        """
+        if item in self:
+            return False
+        layer = self._layers[-1]
+        if layer.is_full():
+            layer = BloomFilter(layer.capacity * 2, layer.error_rate / 2)
+            self._layers.append(layer)
+        return layer.add(item)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """转换为可 JSON 序列化的字典"""
+        return {
+            "error_rate": self.error_rate,
+            "initial_capacity": self.initial_capacity,
+            "layers": [layer.to_dict() for layer in self._layers],
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "ScalableBloomFilter":
+        """从 to_dict 的结果恢复"""
+        bloom = cls(data["error_rate"], data["initial_capacity"])
+        bloom._layers = [BloomFilter.from_dict(layer) for layer in data["layers"]]
+        return bloom
@@ -0,0 +1,278 @@
+"""
+BM25 稀疏检索模块
+
+与 SimpleVectorStore 并列的关键词检索实现，适合日期、人名等需要精确命中的查询。
+"""
+
+import math
+import threading
+from array import array
+from typing import List, Dict, Optional, Tuple, Callable, Iterable
+
+import numpy as np
+
+from .index import tokenize
+from .models import Memory
+from .vector_store import _top_k_rows
+
+
+def _tokenize_with_unigrams(text: str) -> List[str]:
+    return tokenize(text, cjk_unigrams=True)
+
+
+class BM25Index:
+    """可增量更新的 BM25 索引
+
+    倒排表按词存放在紧凑的 array 中（文档编号 uint32、词频 uint16），
+    文档编号单调递增，因此每个倒排表天然有序。删除只标记失效，失效文档过多时
+    统一重建编号。查询采用 MaxScore 式的提前终止：当剩余词的得分上界之和
+    已不足以让新文档进入 top-k 时，后续词只对现有候选打分。
+
+    查询期间以 numpy 视图直接读取倒排表，写入与查询由一把锁互斥，可在多线程中使用。
+    """
+
+    # 失效文档超过该比例时重建
+    _COMPACT_RATIO = 0.25
+    _MAX_TF = 65535
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75,
+                 tokenizer: Optional[Callable[[str], List[str]]] = None):
+        """
+        初始化 BM25 索引
+
+        参数:
+            k1: 词频饱和参数
+            b: 文档长度归一化参数
+            tokenizer: 分词函数，默认使用 mmos.index.tokenize（含中文单字）
+        """
+        self.k1 = k1
+        self.b = b
+        self.tokenizer = tokenizer or _tokenize_with_unigrams
+        self._lock = threading.Lock()
+        self.clear()
+
+    def clear(self) -> None:
+        """清空索引"""
+        with self._lock:
+            self._clear()
+
+    def _clear(self) -> None:
+        self._vocab: Dict[str, int] = {}           # 词 -> 词编号
+        self._post_docs: List[array] = []          # 词编号 -> 文档编号数组
+        self._post_tfs: List[array] = []           # 词编号 -> 词频数组
+        self._df = array("I")                      # 词编号 -> 有效文档频率
+        self._max_tf = array("H")                  # 词编号 -> 最大词频（得分上界用）
+        self._doc_ids: List[Optional[str]] = []    # 文档编号 -> memory_id
+        self._doc_terms: List[Optional[array]] = []  # 文档编号 -> 词编号数组
+        self._doc_lengths = array("I")
+        self._alive = bytearray()
+        self._id_to_doc: Dict[str, int] = {}
+        self._total_length = 0
+        self._min_length = 0
+        self._dead = 0
+
+    def __len__(self) -> int:
+        return len(self._id_to_doc)
+
+    def __contains__(self, memory_id: str) -> bool:
+        return memory_id in self._id_to_doc
+
+    def add(self, memory_id: str, text: str) -> None:
+        """
+        索引一条文本，已存在时替换
+
+        参数:
+            memory_id: 记忆ID
+            text: 记忆内容
+        """
+        tokens = self.tokenizer(text)
+        with self._lock:
+            self._add(memory_id, tokens)
+
+    def _add(self, memory_id: str, tokens: List[str]) -> None:
+        if memory_id in self._id_to_doc:
+            self._remove(memory_id)
+
+        counts: Dict[int, int] = {}
+        for token in tokens:
+            term = self._vocab.get(token)
+            if term is None:
+                term = self._vocab[token] = len(self._post_docs)
+                self._post_docs.append(array("I"))
+                self._post_tfs.append(array("H"))
+                self._df.append(0)
+                self._max_tf.append(0)
+            counts[term] = counts.get(term, 0) + 1
+
+        first = not self._id_to_doc
+        doc = len(self._doc_ids)
+        for term, tf in counts.items():
+            tf = min(tf, self._MAX_TF)
+            self._post_docs[term].append(doc)
+            self._post_tfs[term].append(tf)
+            self._df[term] += 1
+            if tf > self._max_tf[term]:
+                self._max_tf[term] = tf
+
+        length = len(tokens)
+        self._doc_ids.append(memory_id)
+        self._doc_terms.append(array("I", counts))
+        self._doc_lengths.append(length)
+        self._alive.append(1)
+        self._id_to_doc[memory_id] = doc
+        self._min_length = length if first else min(self._min_length, length)
+        self._total_length += length
+
+    def remove(self, memory_id: str) -> bool:
+        """移除一条文本"""
+        with self._lock:
+            return self._remove(memory_id)
+
+    def _remove(self, memory_id: str) -> bool:
+        doc = self._id_to_doc.pop(memory_id, None)
+        if doc is None:
+            return False
+        for term in self._doc_terms[doc]:
+            self._df[term] -= 1
+        self._total_length -= self._doc_lengths[doc]
+        self._alive[doc] = 0
+        self._doc_ids[doc] = None
+        self._doc_terms[doc] = None
+        self._dead += 1
+        if self._dead >= len(self._doc_ids) * self._COMPACT_RATIO:
+            self._compact()
+        return True
+
+    def add_memory(self, memory: Memory) -> None:
+        """将记忆加入索引"""
+        self.add(memory.id, memory.content)
+
+    def update_memory(self, memory: Memory) -> None:
+        """更新记忆的索引"""
+        self.add(memory.id, memory.content)
+
+    def remove_memory(self, memory_id: str) -> bool:
+        """从索引中移除记忆"""
+        return self.remove(memory_id)
+
+    def _compact(self) -> None:
+        """丢弃失效文档并重新编号，保持文档的相对顺序"""
+        alive = np.frombuffer(self._alive, dtype=np.uint8).astype(bool)
+        remap = np.cumsum(alive, dtype=np.int64) - 1
+        for term in range(len(self._post_docs)):
+            docs = np.frombuffer(self._post_docs[term], dtype=np.uint32)
+            if docs.shape[0] == 0:
+                continue
+            keep = alive[docs]
+            if keep.all():
+                self._post_docs[term] = array("I", remap[docs].astype(np.uint32).tobytes())
+                continue
+            tfs = np.frombuffer(self._post_tfs[term], dtype=np.uint16)
+            new_docs = array("I")
+            new_docs.frombytes(remap[docs[keep]].astype(np.uint32).tobytes())
+            new_tfs = array("H")
+            new_tfs.frombytes(tfs[keep].tobytes())
+            self._post_docs[term] = new_docs
+            self._post_tfs[term] = new_tfs
+
+        keep_docs = np.flatnonzero(alive)
+        self._doc_ids = [self._doc_ids[doc] for doc in keep_docs]
+        self._doc_terms = [self._doc_terms[doc] for doc in keep_docs]
+        lengths = array("I")
+        lengths.frombytes(np.frombuffer(self._doc_lengths, dtype=np.uint32)[keep_docs].tobytes())
+        self._doc_lengths = lengths
+        self._alive = bytearray(b"\x01" * len(self._doc_ids))
+        self._id_to_doc = {memory_id: doc for doc, memory_id in enumerate(self._doc_ids)}
+        self._dead = 0
+
+    def _idf(self, df: int, n: int) -> float:
+        return math.log(1.0 + (n - df + 0.5) / (df + 0.5))
+
+    def search(self, query: str, top_k: int = 5,
+               allowed_ids: Optional[Iterable[str]] = None) -> List[Tuple[str, float]]:
+        """
+        BM25 检索
+
+        参数:
+            query: 查询字符串
+            top_k: 返回的最大结果数
+            allowed_ids: 只在这些记忆中检索（如结构化过滤的结果），None表示不限制；
+                idf 等统计量仍按全部文档计算
+
+        返回:
+            包含(memory_id, BM25分数)的列表，按分数从高到低排序，同分按插入顺序
+        """
+        tokens = self.tokenizer(query)
+        with self._lock:
+            return self._search(tokens, top_k, allowed_ids)
+
+    def _search(self, tokens: List[str], top_k: int,
+                allowed_ids: Optional[Iterable[str]]) -> List[Tuple[str, float]]:
+        n = len(self._id_to_doc)
+        if n == 0 or top_k <= 0:
+            return []
+        terms = {self._vocab[token] for token in tokens if token in self._vocab}
+        terms = [term for term in terms if self._df[term] > 0]
+        if not terms:
+            return []
+
+        k1, b = self.k1, self.b
+        avgdl = self._total_length / n or 1.0
+        lengths = np.frombuffer(self._doc_lengths, dtype=np.uint32)
+        alive = np.frombuffer(self._alive, dtype=np.uint8)
+        if allowed_ids is not None:
+            docs = [self._id_to_doc[memory_id] for memory_id in allowed_ids if memory_id in self._id_to_doc]
+            if not docs:
+                return []
+            alive = np.zeros(len(self._doc_ids), dtype=np.uint8)
+            alive[docs] = 1
+
+        # 每个词的 idf 与得分上界，按上界从大到小处理
+        plan = []
+        for term in terms:
+            idf = self._idf(self._df[term], n)
+            max_tf = self._max_tf[term]
+            bound = idf * max_tf * (k1 + 1) / (max_tf + k1 * (1 - b + b * self._min_length / avgdl))
+            plan.append((bound, idf, term))
+        plan.sort(key=lambda item: (-item[0], item[2]))
+        remaining = [0.0] * (len(plan) + 1)
+        for i in range(len(plan) - 1, -1, -1):
+            remaining[i] = remaining[i + 1] + plan[i][0]
+
+        def contribution(idf: float, docs: np.ndarray, tfs: np.ndarray) -> np.ndarray:
+            tf = tfs.astype(np.float64)
+            norm = k1 * (1 - b + b * lengths[docs] / avgdl)
+            return idf * tf * (k1 + 1) / (tf + norm)
+
+        cand_docs = np.empty(0, dtype=np.int64)
+        cand_scores = np.empty(0, dtype=np.float64)
+        open_set = True  # 新文档是否还可能进入 top-k
+        for i, (_, idf, term) in enumerate(plan):
+            docs = np.frombuffer(self._post_docs[term], dtype=np.uint32).astype(np.int64)
+            tfs = np.frombuffer(self._post_tfs[term], dtype=np.uint16)
+            if open_set:
+                live = alive[docs].astype(bool)
+                docs, tfs = docs[live], tfs[live]
+                merged = np.concatenate([cand_docs, docs])
+                weights = np.concatenate([cand_scores, contribution(idf, docs, tfs)])
+                cand_docs, inverse = np.unique(merged, return_inverse=True)
+                cand_scores = np.bincount(inverse, weights=weights, minlength=cand_docs.shape[0])
+            else:
+                # 只为现有候选补充得分
+                pos = np.searchsorted(docs, cand_docs)
+                pos[pos >= docs.shape[0]] = 0
+                hit = docs[pos] == cand_docs if docs.shape[0] else np.zeros(cand_docs.shape[0], bool)
+                cand_scores[hit] += contribution(idf, cand_docs[hit], tfs[pos[hit]])
+
+            if cand_docs.shape[0] > top_k:
+                threshold = np.partition(cand_scores, -top_k)[-top_k]
+                rest = remaining[i + 1]
+                if open_set and rest < threshold:
+                    open_set = False
+                if not open_set:
+                    # 即使拿满剩余上界也追不上第k名的候选可以直接丢弃
+                    keep = cand_scores + rest >= threshold
+                    cand_docs, cand_scores = cand_docs[keep], cand_scores[keep]
+
+        order = _top_k_rows(cand_scores, min(top_k, cand_docs.shape[0]))
+        return [(self._doc_ids[cand_docs[i]], float(cand_scores[i])) for i in order]
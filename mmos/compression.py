@@ -0,0 +1,291 @@
+"""
+上下文压缩
+
+按 token 预算压缩 OpenAI 格式的 messages：系统消息与最近几轮对话原样保留，
+更早的对话按句子做抽取式压缩，再由贪心分配器在预算内挑选信息量最高的句子。
+
+每条消息的分句与打分只取决于消息本身，结果按消息内容的哈希缓存，
+同一会话反复压缩时只需分析新增的消息。
+"""
+
+import hashlib
+import math
+import re
+from collections import OrderedDict
+from typing import List, Dict, Any, Optional, Callable, Tuple
+
+from .index import _CJK_RANGES, tokenize
+
+# 每条消息在 chat 格式中的固定开销（角色与分隔符）
+MESSAGE_OVERHEAD_TOKENS = 4
+# 压缩后不相邻的句子之间插入的省略号
+_ELLIPSIS = "…"
+
+_TOKEN_PIECES = re.compile(rf"[{_CJK_RANGES}]|[^\W_{_CJK_RANGES}]+|[^\s\w]", re.UNICODE)
+# 句子以中英文句末标点、换行或文本结尾结束；英文句号后需跟空白，避免切开小数
+_SENTENCE = re.compile(r".+?(?:[。！？；!?;…]+[”’\"')）]*|\.(?=\s)|\n+|$)", re.S)
+_CJK_END = re.compile(rf"[{_CJK_RANGES}。！？；，、：”’）…]$")
+_DIGIT = re.compile(r"\d")
+# 否定词与疑问词所在的句子优先保留
+_KEY_WORDS = re.compile(r"不|没|无|非|别|吗|呢|什么|怎么|为什么|哪|几|多少|是否|\b(?:not|no|never|why|how|what|which|when|where|who)\b",
+                        re.IGNORECASE)
+
+
+def count_tokens(text: str) -> int:
+    """
+    快速估算文本的 token 数
+
+    中日韩字符每字计1，字母数字串每4个字符计1（至少为1），其余符号每个计1。
+    不依赖分词器，结果与 tiktoken 在中英文混合文本上的数量级一致。
+
+    参数:
+        text: 文本
+
+    返回:
+        token 数估计
+    """
+    total = 0
+    for piece in _TOKEN_PIECES.findall(text):
+        total += (len(piece) + 3) // 4 if len(piece) > 1 else 1
+    return total
+
+
+def split_sentences(text: str) -> List[str]:
+    """按中英文句末标点与换行切分句子，去掉首尾空白"""
+    return [sentence for sentence in (match.strip() for match in _SENTENCE.findall(text)) if sentence]
+
+
+class _Analysis:
+    """一条消息的分句、各句 token 数与重要性得分"""
+
+    __slots__ = ("sentences", "costs", "scores", "tokens")
+
+    def __init__(self, sentences: List[str], costs: List[int], scores: List[float]):
+        self.sentences = sentences
+        self.costs = costs
+        self.scores = scores
+        self.tokens = sum(costs)
+
+
+class ContextCompressor:
+    """按 token 预算压缩对话上下文"""
+
+    def __init__(self, token_counter: Optional[Callable[[str], int]] = None,
+                 tokenizer: Optional[Callable[[str], List[str]]] = None,
+                 keep_last_rounds: int = 2,
+                 recency_decay: float = 0.85,
+                 cache_size: int = 10000):
+        """
+        初始化
+
+        参数:
+            token_counter: 计算文本 token 数的函数，默认为 count_tokens；
+                需要精确计数时可传入基于 tiktoken 的函数
+            tokenizer: 句子打分用的分词函数，默认为 mmos.index.tokenize；
+                可传入 mmos.tokenizer.get_tokenizer(...).keywords 按词典分词并去掉停用词
+            keep_last_rounds: 原样保留的最近对话轮数（一轮从一条用户消息开始）
+            recency_decay: 历史每早一轮，句子得分乘以该系数
+            cache_size: 缓存的消息分析结果条数
+        """
+        self.token_counter = token_counter or count_tokens
+        self.tokenizer = tokenizer or tokenize
+        self.keep_last_rounds = keep_last_rounds
+        self.recency_decay = recency_decay
+        self.cache_size = cache_size
+        self._cache: "OrderedDict[bytes, _Analysis]" = OrderedDict()
+
+    def _message_tokens(self, message: Dict[str, Any]) -> int:
+        content = message.get("content")
+        if isinstance(content, str):
+            return self._analyze(message).tokens + MESSAGE_OVERHEAD_TOKENS
+        return self.token_counter(str(content or "")) + MESSAGE_OVERHEAD_TOKENS
+
+    def _analyze(self, message: Dict[str, Any]) -> _Analysis:
+        """分句并为每句打分，结果按角色与内容的哈希缓存"""
+        content = message["content"]
+        key = hashlib.blake2b(f"{message.get('role')}\0{content}".encode("utf-8"), digest_size=16).digest()
+        analysis = self._cache.get(key)
+        if analysis is not None:
+            self._cache.move_to_end(key)
+            return analysis
+
+        sentences = split_sentences(content)
+        costs = [self.token_counter(sentence) for sentence in sentences]
+        terms = [set(self.tokenizer(sentence)) for sentence in sentences]
+        # 以句子为文档计算 TF-IDF：在消息中反复出现的词是主题词，但出现在每一句中的词区分度低
+        frequency: Dict[str, int] = {}
+        for sentence_terms in terms:
+            for term in sentence_terms:
+                frequency[term] = frequency.get(term, 0) + 1
+        count = len(sentences)
+        scores = []
+        for position, (sentence, sentence_terms) in enumerate(zip(sentences, terms)):
+            weight = sum(frequency[term] * math.log(1 + count / frequency[term]) for term in sentence_terms)
+            score = weight / math.sqrt(len(sentence_terms)) if sentence_terms else 0.0
+            if _DIGIT.search(sentence):
+                score += 1.0  # 数字通常是价格、时间、数量等结论
+            if _KEY_WORDS.search(sentence):
+                score += 1.0
+            if position == 0:
+                score += 0.5  # 首句往往点明主题
+            scores.append(score)
+
+        analysis = _Analysis(sentences, costs, scores)
+        self._cache[key] = analysis
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return analysis
+
+    def _content_tokens(self, content: str) -> int:
+        """按分句计数的 token 数，与 _analyze 的计数方式一致，不写入缓存"""
+        return sum(self.token_counter(sentence) for sentence in split_sentences(content))
+
+    def count_message_tokens(self, messages: List[Dict[str, Any]]) -> int:
+        """messages 的 token 总数（含每条消息的固定开销）"""
+        return sum(self._message_tokens(message) for message in messages)
+
+    def _protected(self, messages: List[Dict[str, Any]]) -> List[bool]:
+        """原样保留的消息：系统消息、非纯文本消息、最近 keep_last_rounds 轮"""
+        protected = [False] * len(messages)
+        rounds = 0
+        boundary = 0
+        for index in range(len(messages) - 1, -1, -1):
+            if messages[index].get("role") == "user":
+                rounds += 1
+                if rounds == self.keep_last_rounds:
+                    boundary = index
+                    break
+        if rounds < self.keep_last_rounds:
+            boundary = 0
+        for index, message in enumerate(messages):
+            protected[index] = (
+                index >= boundary
+                or message.get("role") not in ("user", "assistant")
+                or not isinstance(message.get("content"), str)
+                or bool(message.get("tool_calls"))
+            )
+        return protected
+
+    def compress(self, messages: List[Dict[str, Any]], token_budget: int) -> List[Dict[str, Any]]:
+        """
+        把 messages 压缩到 token 预算以内
+
+        历史消息的每个句子是一个候选单元，价值为句子得分乘以按轮次的时间衰减，
+        代价为句子的 token 数（消息的第一个句子另计消息开销，与已选句子都不相邻时
+        另计一个“…”）。分配器按价值密度从高到低贪心选取放得下的句子，每条消息
+        保留选中的句子并按原顺序拼接，中间省略的部分以“…”表示，一个句子都没选中的
+        消息被整条移除。拼接后按 count_message_tokens 的方式重新计数，token_counter
+        不可加（如 tiktoken 在句子边界合并）而超出预算时，按选中的逆序撤销句子。
+        原样保留的部分本身超出预算时，历史消息全部移除。
+
+        参数:
+            messages: OpenAI 格式的消息列表
+            token_budget: token 预算
+
+        返回:
+            压缩后的消息列表（新列表，输入不会被修改），结果只取决于输入
+        """
+        costs = [self._message_tokens(message) for message in messages]
+        if sum(costs) <= token_budget:
+            return [dict(message) for message in messages]
+
+        protected = self._protected(messages)
+        budget = token_budget - sum(cost for cost, keep in zip(costs, protected) if keep)
+        remaining = budget
+        separator_cost = self.token_counter(_ELLIPSIS)
+
+        # 候选单元: (价值密度, 消息序号, 句子序号)
+        units: List[Tuple[float, int, int]] = []
+        analyses: Dict[int, _Analysis] = {}
+        age = 0
+        for index in range(len(messages) - 1, -1, -1):
+            message = messages[index]
+            if message.get("role") == "user":
+                age += 1
+            if protected[index]:
+                continue
+            analysis = self._analyze(message)
+            analyses[index] = analysis
+            decay = self.recency_decay ** age
+            for position, (score, cost) in enumerate(zip(analysis.scores, analysis.costs)):
+                units.append((score * decay / max(cost, 1), index, position))
+        # 同等密度时优先较新的消息与靠前的句子，保证结果确定
+        units.sort(key=lambda unit: (-unit[0], -unit[1], unit[2]))
+
+        selected: Dict[int, set] = {}
+        picked: List[Tuple[int, int]] = []  # 选中顺序，超出预算时从末尾撤销
+        for _, index, position in units:
+            if remaining <= 0:
+                break
+            cost = analyses[index].costs[position]
+            kept = selected.get(index)
+            if kept is None:
+                cost += MESSAGE_OVERHEAD_TOKENS
+            elif position - 1 not in kept and position + 1 not in kept:
+                # 不与已选句子相邻时至少多出一处省略（填补单句空缺时反而少一处，不退还）
+                cost += separator_cost
+            if cost > remaining:
+                continue
+            selected.setdefault(index, set()).add(position)
+            picked.append((index, position))
+            remaining -= cost
+
+        contents: Dict[int, str] = {}
+        spent: Dict[int, int] = {}
+        for index, positions in selected.items():
+            contents[index] = self._join(analyses[index].sentences, sorted(positions))
+            spent[index] = self._content_tokens(contents[index]) + MESSAGE_OVERHEAD_TOKENS
+        while picked and sum(spent.values()) > budget:
+            index, position = picked.pop()
+            selected[index].discard(position)
+            if selected[index]:
+                contents[index] = self._join(analyses[index].sentences, sorted(selected[index]))
+                spent[index] = self._content_tokens(contents[index]) + MESSAGE_OVERHEAD_TOKENS
+            else:
+                del selected[index], contents[index], spent[index]
+
+        result = []
+        for index, message in enumerate(messages):
+            if protected[index]:
+                result.append(dict(message))
+            elif index in contents:
+                compressed = dict(message)
+                compressed["content"] = contents[index]
+                result.append(compressed)
+        return result
+
+    @staticmethod
+    def _join(sentences: List[str], positions: List[int]) -> str:
+        """按原顺序拼接选中的句子，不相邻的句子之间以“…”连接"""
+        parts = []
+        previous = None
+        for position in positions:
+            sentence = sentences[position]
+            if previous is not None:
+                if position != previous + 1:
+                    parts.append(_ELLIPSIS)
+                elif not _CJK_END.search(sentences[previous]):
+                    parts.append(" ")
+            parts.append(sentence)
+            previous = position
+        return "".join(parts)
+
+
+_default_compressor: Optional[ContextCompressor] = None
+
+
+def compress(messages: List[Dict[str, Any]], token_budget: int) -> List[Dict[str, Any]]:
+    """
+    使用默认配置把 messages 压缩到 token 预算以内，见 ContextCompressor.compress
+
+    参数:
+        messages: OpenAI 格式的消息列表
+        token_budget: token 预算
+
+    返回:
+        压缩后的消息列表
+    """
+    global _default_compressor
+    if _default_compressor is None:
+        _default_compressor = ContextCompressor()
+    return _default_compressor.compress(messages, token_budget)
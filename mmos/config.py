@@ -71,6 +71,10 @@ class ModuleConfig(BaseModel):
         default_factory=list,
         description="该模块依赖的其他模块"
     )
+    lazy: bool = Field(
+        default=False,
+        description="是否延迟到首次使用时才初始化（被其他模块依赖时随依赖方一起初始化）"
+    )
 
 class AIConfig(BaseModel):
     """
@@ -0,0 +1,455 @@
+"""
+嵌入服务模块
+
+在嵌入模型之上提供统一的调用层：
+1. 按条数与 token 数上限合并请求为批次
+2. 以内容哈希为键的 LRU 缓存（内存，可选磁盘）
+3. 合并并发中的重复请求，同一文本同一时刻只请求一次
+4. 同步与 asyncio 两套调用接口
+"""
+
+import asyncio
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import zlib
+from array import array
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import List, Dict, Any, Optional, Callable, Sequence, Tuple, Awaitable
+
+from .aio import LoopLocal
+from .index import _CJK_RANGES
+
+# 嵌入函数：一次接收多条文本，返回等长的向量列表
+Embedder = Callable[[List[str]], List[List[float]]]
+AsyncEmbedder = Callable[[List[str]], Awaitable[List[List[float]]]]
+
+_CJK_PATTERN = re.compile(rf"[{_CJK_RANGES}]")
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    粗略估计文本的 token 数
+
+    中日韩字符按每字 1 个 token 计算，其余字符按每 4 个字符 1 个 token 计算。
+
+    参数:
+        text: 输入文本
+
+    返回:
+        估计的 token 数（至少为1）
+    """
+    cjk = len(_CJK_PATTERN.findall(text))
+    return max(1, cjk + (len(text) - cjk + 3) // 4)
+
+
+class LocalEmbedder:
+    """本地嵌入函数
+
+    基于字符 n-gram 哈希生成确定性的归一化向量，无需网络，
+    用于测试和离线环境。共享较多字符片段的文本得到的向量也更接近。
+    """
+
+    def __init__(self, dimension: int = 384, ngram_range: Tuple[int, int] = (1, 2)):
+        """
+        初始化本地嵌入函数
+
+        参数:
+            dimension: 向量维度
+            ngram_range: 参与哈希的字符 n-gram 长度范围
+        """
+        self.dimension = dimension
+        self.ngram_range = ngram_range
+
+    def _embed_one(self, text: str) -> List[float]:
+        vector = [0.0] * self.dimension
+        text = text.lower()
+        low, high = self.ngram_range
+        for n in range(low, high + 1):
+            for i in range(len(text) - n + 1):
+                digest = zlib.crc32(text[i:i + n].encode("utf-8"))
+                sign = 1.0 if digest & 1 else -1.0
+                vector[(digest >> 1) % self.dimension] += sign
+        norm = sum(value * value for value in vector) ** 0.5
+        if norm == 0:
+            return vector
+        return [value / norm for value in vector]
+
+    def __call__(self, texts: List[str]) -> List[List[float]]:
+        return [self._embed_one(text) for text in texts]
+
+
+class OpenAIEmbedder:
+    """OpenAI 嵌入接口的封装"""
+
+    def __init__(self, client: Any = None, model: str = "text-embedding-3-small",
+                 api_key: Optional[str] = None, base_url: Optional[str] = None):
+        """
+        初始化 OpenAI 嵌入函数
+
+        参数:
+            client: 已创建的 OpenAI 客户端，为None时按需创建
+            model: 嵌入模型名称
+            api_key: API密钥，仅在自动创建客户端时使用
+            base_url: 自定义API端点，仅在自动创建客户端时使用
+        """
+        self._client = client
+        self.model = model
+        self.api_key = api_key
+        self.base_url = base_url
+
+    @property
+    def client(self) -> Any:
+        if self._client is None:
+            from openai import OpenAI
+            self._client = OpenAI(api_key=self.api_key, base_url=self.base_url)
+        return self._client
+
+    def __call__(self, texts: List[str]) -> List[List[float]]:
+        response = self.client.embeddings.create(model=self.model, input=texts)
+        # 接口按 index 返回，排序后与输入一一对应
+        data = sorted(response.data, key=lambda item: item.index)
+        return [item.embedding for item in data]
+
+
+class AsyncOpenAIEmbedder:
+    """OpenAI 异步嵌入接口的封装"""
+
+    def __init__(self, client: Any = None, model: str = "text-embedding-3-small",
+                 api_key: Optional[str] = None, base_url: Optional[str] = None):
+        """
+        初始化 OpenAI 异步嵌入函数
+
+        参数:
+            client: 已创建的 AsyncOpenAI 客户端，为None时按需创建
+            model: 嵌入模型名称
+            api_key: API密钥，仅在自动创建客户端时使用
+            base_url: 自定义API端点，仅在自动创建客户端时使用
+        """
+        self._client = client
+        self.model = model
+        self.api_key = api_key
+        self.base_url = base_url
+
+    @property
+    def client(self) -> Any:
+        if self._client is None:
+            from openai import AsyncOpenAI
+            self._client = AsyncOpenAI(api_key=self.api_key, base_url=self.base_url)
+        return self._client
+
+    async def __call__(self, texts: List[str]) -> List[List[float]]:
+        response = await self.client.embeddings.create(model=self.model, input=texts)
+        data = sorted(response.data, key=lambda item: item.index)
+        return [item.embedding for item in data]
+
+
+class EmbeddingCache:
+    """以内容哈希为键的嵌入向量 LRU 缓存
+
+    内存中保留最近使用的 max_entries 条，以 float32 的 array 存放，
+    每个分量占 4 字节（Python float 列表约为其 8 倍）；指定 path 时同时写入
+    SQLite 文件，内存未命中时回落到磁盘查找，进程重启后依然有效。
+    """
+
+    def __init__(self, max_entries: int = 10000, path: Optional[str] = None):
+        """
+        初始化缓存
+
+        参数:
+            max_entries: 内存中保留的最大条目数
+            path: 磁盘缓存文件路径，为None时仅使用内存
+        """
+        self.max_entries = max_entries
+        self.path = path
+        self._entries: "OrderedDict[str, array]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._db: Optional[sqlite3.Connection] = None
+        if path:
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB)"
+            )
+            self._db.commit()
+
+    @staticmethod
+    def make_key(text: str, model: str = "") -> str:
+        """根据模型名与文本内容生成缓存键"""
+        return hashlib.sha256(f"{model}\0{text}".encode("utf-8")).hexdigest()
+
+    def _remember(self, key: str, vector: Sequence[float]) -> array:
+        if not (isinstance(vector, array) and vector.typecode == "f"):
+            vector = array("f", vector)
+        self._entries[key] = vector
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        return vector
+
+    def get(self, key: str) -> Optional[array]:
+        """读取缓存，未命中返回None"""
+        with self._lock:
+            vector = self._entries.get(key)
+            if vector is not None:
+                self._entries.move_to_end(key)
+                return vector
+            if self._db is None:
+                return None
+            row = self._db.execute(
+                "SELECT vector FROM embeddings WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            return self._remember(key, array("d", row[0]))
+
+    def put_many(self, items: List[Tuple[str, Sequence[float]]]) -> None:
+        """批量写入缓存"""
+        with self._lock:
+            for key, vector in items:
+                self._remember(key, vector)
+            if self._db is not None:
+                self._db.executemany(
+                    "INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)",
+                    [(key, array("d", vector).tobytes()) for key, vector in items],
+                )
+                self._db.commit()
+
+    def put(self, key: str, vector: Sequence[float]) -> None:
+        """写入缓存"""
+        self.put_many([(key, vector)])
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def clear(self) -> None:
+        """清空缓存（包括磁盘）"""
+        with self._lock:
+            self._entries.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM embeddings")
+                self._db.commit()
+
+    def close(self) -> None:
+        """关闭磁盘缓存连接"""
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+
+class EmbeddingService:
+    """嵌入服务
+
+    对同一批输入先去重、查缓存，再把未命中的文本按条数和 token 上限切成批次
+    调用嵌入函数。多个线程（或协程）同时请求同一文本时，只有一个真正发起请求，
+    其余的等待其结果。
+    """
+
+    def __init__(self, embedder: Embedder, model_name: str = "",
+                 cache: Optional[EmbeddingCache] = None,
+                 max_batch_size: int = 256, max_batch_tokens: int = 8000,
+                 async_embedder: Optional[AsyncEmbedder] = None,
+                 max_concurrent_requests: int = 8):
+        """
+        初始化嵌入服务
+
+        参数:
+            embedder: 批量嵌入函数
+            model_name: 模型名称，参与缓存键的计算
+            cache: 嵌入缓存，为None时创建一个仅内存的缓存
+            max_batch_size: 每批最多的文本条数
+            max_batch_tokens: 每批最多的估计 token 数
+            async_embedder: aembed 使用的异步批量嵌入函数，为None时在线程池中调用 embedder
+            max_concurrent_requests: aembed 同时进行中的嵌入请求数上限
+        """
+        self.embedder = embedder
+        self.async_embedder = async_embedder
+        self.model_name = model_name
+        self.cache = cache if cache is not None else EmbeddingCache()
+        self.max_batch_size = max_batch_size
+        self.max_batch_tokens = max_batch_tokens
+        self.max_concurrent_requests = max_concurrent_requests
+        self._inflight: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+        # 每个事件循环各自的请求信号量，asyncio 原语不能跨循环使用
+        self._request_slots = LoopLocal(lambda: asyncio.Semaphore(self.max_concurrent_requests))
+        self.stats = {"requests": 0, "cache_hits": 0, "inflight_hits": 0,
+                      "embedded": 0, "batches": 0}
+
+    def _make_batches(self, texts: List[str]) -> List[List[int]]:
+        """将文本按条数与 token 上限切分为批次，返回每批的下标"""
+        batches: List[List[int]] = []
+        current: List[int] = []
+        tokens = 0
+        for i, text in enumerate(texts):
+            cost = estimate_tokens(text)
+            if current and (len(current) >= self.max_batch_size
+                            or tokens + cost > self.max_batch_tokens):
+                batches.append(current)
+                current, tokens = [], 0
+            current.append(i)
+            tokens += cost
+        if current:
+            batches.append(current)
+        return batches
+
+    def embed(self, texts: List[str]) -> List[array]:
+        """
+        获取多条文本的嵌入向量
+
+        参数:
+            texts: 文本列表
+
+        返回:
+            与输入一一对应的向量列表，每个向量为 float32 的 array
+        """
+        keys = [EmbeddingCache.make_key(text, self.model_name) for text in texts]
+        found, waiting, owned = self._claim(keys, texts)
+
+        if owned:
+            self._embed_owned(owned, found)
+
+        for key, future in waiting.items():
+            found[key] = future.result()
+
+        return [found[key] for key in keys]
+
+    def _claim(self, keys: List[str], texts: List[str]
+               ) -> Tuple[Dict[str, array], Dict[str, Future], Dict[str, str]]:
+        """
+        查缓存并登记进行中的请求
+
+        返回:
+            (缓存命中的 key -> 向量, 需要等待其他调用的 key -> Future,
+             由当前调用负责请求的 key -> 文本)
+        """
+        found: Dict[str, array] = {}
+        waiting: Dict[str, Future] = {}
+        owned: Dict[str, str] = {}
+
+        with self._lock:
+            self.stats["requests"] += len(texts)
+            for key, text in zip(keys, texts):
+                if key in found or key in waiting or key in owned:
+                    continue
+                vector = self.cache.get(key)
+                if vector is not None:
+                    found[key] = vector
+                    self.stats["cache_hits"] += 1
+                elif key in self._inflight:
+                    waiting[key] = self._inflight[key]
+                    self.stats["inflight_hits"] += 1
+                else:
+                    self._inflight[key] = Future()
+                    owned[key] = text
+        return found, waiting, owned
+
+    def _publish(self, keys: List[str], vectors: List[List[float]],
+                 found: Dict[str, array], pending: set) -> None:
+        """写入缓存，并通知等待这些 key 的其他调用"""
+        if len(vectors) != len(keys):
+            raise ValueError(f"嵌入结果数量不匹配: 期望 {len(keys)}，实际 {len(vectors)}")
+        items = [(key, array("f", vector)) for key, vector in zip(keys, vectors)]
+        self.cache.put_many(items)
+        with self._lock:
+            self.stats["batches"] += 1
+            self.stats["embedded"] += len(items)
+            for key, vector in items:
+                found[key] = vector
+                if key in pending:
+                    pending.discard(key)
+                    self._inflight.pop(key).set_result(vector)
+
+    def _fail(self, pending: set, error: BaseException) -> None:
+        """请求失败时通知等待尚未完成的 key 的其他调用"""
+        with self._lock:
+            for key in pending:
+                self._inflight.pop(key).set_exception(error)
+            pending.clear()
+
+    def _embed_owned(self, owned: Dict[str, str], found: Dict[str, array]) -> None:
+        """请求当前调用负责的文本，并通知等待中的其他调用"""
+        owned_keys = list(owned)
+        owned_texts = [owned[key] for key in owned_keys]
+        pending = set(owned_keys)
+        try:
+            for batch in self._make_batches(owned_texts):
+                vectors = self.embedder([owned_texts[i] for i in batch])
+                self._publish([owned_keys[i] for i in batch], vectors, found, pending)
+        except BaseException as e:
+            self._fail(pending, e)
+            raise
+
+    async def aembed(self, texts: List[str]) -> List[array]:
+        """
+        embed 的异步版本
+
+        各批次并发请求，同时进行的请求数不超过 max_concurrent_requests；
+        磁盘缓存的读写放到线程池中执行，不阻塞事件循环。
+
+        参数:
+            texts: 文本列表
+
+        返回:
+            与输入一一对应的向量列表
+        """
+        loop = asyncio.get_running_loop()
+        keys = [EmbeddingCache.make_key(text, self.model_name) for text in texts]
+        if self.cache.path:
+            found, waiting, owned = await loop.run_in_executor(None, self._claim, keys, texts)
+        else:
+            found, waiting, owned = self._claim(keys, texts)
+
+        if owned:
+            await self._aembed_owned(owned, found)
+
+        for key, future in waiting.items():
+            found[key] = await asyncio.wrap_future(future)
+
+        return [found[key] for key in keys]
+
+    async def _aembed_owned(self, owned: Dict[str, str], found: Dict[str, array]) -> None:
+        """并发请求当前调用负责的文本，并通知等待中的其他调用"""
+        loop = asyncio.get_running_loop()
+        request_slots = self._request_slots.get()
+        owned_keys = list(owned)
+        owned_texts = [owned[key] for key in owned_keys]
+        pending = set(owned_keys)
+
+        async def run_batch(batch: List[int]) -> None:
+            batch_texts = [owned_texts[i] for i in batch]
+            async with request_slots:
+                if self.async_embedder is not None:
+                    vectors = await self.async_embedder(batch_texts)
+                else:
+                    vectors = await loop.run_in_executor(None, self.embedder, batch_texts)
+            batch_keys = [owned_keys[i] for i in batch]
+            if self.cache.path:
+                await loop.run_in_executor(None, self._publish, batch_keys, vectors, found, pending)
+            else:
+                self._publish(batch_keys, vectors, found, pending)
+
+        tasks = [asyncio.ensure_future(run_batch(batch)) for batch in self._make_batches(owned_texts)]
+        try:
+            await asyncio.gather(*tasks)
+        except BaseException as e:
+            # 先取消其余批次，再让等待者收到同一个异常
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            self._fail(pending, e)
+            raise
+
+    def embed_one(self, text: str) -> array:
+        """获取单条文本的嵌入向量"""
+        return self.embed([text])[0]
+
+    async def aembed_one(self, text: str) -> array:
+        """embed_one 的异步版本"""
+        return (await self.aembed([text]))[0]
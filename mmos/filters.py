@@ -0,0 +1,265 @@
+"""
+结构化记忆过滤模块
+
+MemoryFilter 描述对标签、元数据字段、创建时间和重要性的约束；
+AttributeIndex 按向量存储的行号维护这些属性，把过滤条件编译为候选行号，
+使向量检索可以在打分之前就排除不满足条件的记忆。
+"""
+
+from typing import List, Dict, Set, Any, Optional, Iterable, FrozenSet, Tuple
+
+import numpy as np
+
+from .models import Memory
+
+_EMPTY: FrozenSet[int] = frozenset()
+
+
+def _is_hashable(value: Any) -> bool:
+    try:
+        hash(value)
+    except TypeError:
+        return False
+    return True
+
+
+def _as_values(value: Any) -> FrozenSet[Any]:
+    """把元数据条件统一为取值集合，列表/元组/集合表示“任一取值”"""
+    if isinstance(value, (list, tuple, set, frozenset)):
+        return frozenset(item for item in value if _is_hashable(item))
+    return frozenset([value]) if _is_hashable(value) else frozenset()
+
+
+class MemoryFilter:
+    """记忆的结构化过滤条件，各条件之间为“且”的关系"""
+
+    def __init__(self,
+                 tags: Optional[Iterable[str]] = None,
+                 any_tags: Optional[Iterable[str]] = None,
+                 metadata: Optional[Dict[str, Any]] = None,
+                 created_after: Optional[float] = None,
+                 created_before: Optional[float] = None,
+                 min_importance: Optional[float] = None,
+                 max_importance: Optional[float] = None):
+        """
+        初始化过滤条件
+
+        参数:
+            tags: 必须全部包含的标签
+            any_tags: 至少包含其中一个的标签
+            metadata: 字段名 -> 取值，取值为列表/元组/集合时匹配其中任一个；
+                只比较可哈希的取值
+            created_after: 创建时间下界（含）
+            created_before: 创建时间上界（不含）
+            min_importance: 重要性下界（含）
+            max_importance: 重要性上界（含）
+        """
+        self.tags = frozenset(tags or ())
+        self.any_tags = frozenset(any_tags or ())
+        self.metadata = {field: _as_values(value) for field, value in (metadata or {}).items()}
+        self.created_after = created_after
+        self.created_before = created_before
+        self.min_importance = min_importance
+        self.max_importance = max_importance
+
+    @property
+    def is_empty(self) -> bool:
+        """是否没有任何条件"""
+        return not (self.tags or self.any_tags or self.metadata) and all(
+            bound is None for bound in (self.created_after, self.created_before,
+                                        self.min_importance, self.max_importance)
+        )
+
+    def matches(self, memory: Memory) -> bool:
+        """判断单条记忆是否满足条件"""
+        if self.tags and not self.tags.issubset(memory.tags):
+            return False
+        if self.any_tags and self.any_tags.isdisjoint(memory.tags):
+            return False
+        for field, values in self.metadata.items():
+            value = memory.metadata.get(field)
+            if field not in memory.metadata or not _is_hashable(value) or value not in values:
+                return False
+        if self.created_after is not None and memory.created_at < self.created_after:
+            return False
+        if self.created_before is not None and memory.created_at >= self.created_before:
+            return False
+        if self.min_importance is not None and memory.importance < self.min_importance:
+            return False
+        if self.max_importance is not None and memory.importance > self.max_importance:
+            return False
+        return True
+
+
+class AttributeIndex:
+    """按行号维护的记忆属性
+
+    标签与元数据保存为 取值 -> 行号集合 的倒排表，创建时间与重要性保存为
+    与向量矩阵行对齐的数组。行号随向量存储的压缩一起重排。
+    """
+
+    def __init__(self):
+        self.clear()
+
+    def clear(self) -> None:
+        """清空索引"""
+        self.created_at = np.zeros(0, dtype=np.float64)
+        self.importance = np.zeros(0, dtype=np.float64)
+        self._tags: Dict[str, Set[int]] = {}
+        self._fields: Dict[str, Dict[Any, Set[int]]] = {}
+        # 行号 -> (标签, 已索引的元数据项)，用于删除
+        self._row_keys: Dict[int, Tuple[FrozenSet[str], Tuple[Tuple[str, Any], ...]]] = {}
+
+    def reserve(self, capacity: int) -> None:
+        """保证属性数组至少能容纳 capacity 行"""
+        size = self.created_at.shape[0]
+        if capacity <= size:
+            return
+        created_at = np.zeros(capacity, dtype=np.float64)
+        created_at[:size] = self.created_at
+        importance = np.zeros(capacity, dtype=np.float64)
+        importance[:size] = self.importance
+        self.created_at = created_at
+        self.importance = importance
+
+    def set(self, row: int, tags: Iterable[str], metadata: Dict[str, Any],
+            created_at: float, importance: float) -> None:
+        """
+        写入一行的属性，已存在时替换
+
+        参数:
+            row: 行号
+            tags: 标签列表
+            metadata: 元数据，只索引可哈希的取值
+            created_at: 创建时间
+            importance: 重要性
+        """
+        self.discard(row)
+        tags = frozenset(tags)
+        items = tuple((field, value) for field, value in metadata.items() if _is_hashable(value))
+        self._row_keys[row] = (tags, items)
+        for tag in tags:
+            self._tags.setdefault(tag, set()).add(row)
+        for field, value in items:
+            self._fields.setdefault(field, {}).setdefault(value, set()).add(row)
+        self.reserve(row + 1)
+        self.created_at[row] = created_at
+        self.importance[row] = importance
+
+    def set_memory(self, row: int, memory: Memory) -> None:
+        """写入一条记忆的属性"""
+        self.set(row, memory.tags, memory.metadata, memory.created_at, memory.importance)
+
+    def discard(self, row: int) -> None:
+        """移除一行的标签与元数据"""
+        keys = self._row_keys.pop(row, None)
+        if keys is None:
+            return
+        tags, items = keys
+        for tag in tags:
+            rows = self._tags[tag]
+            rows.discard(row)
+            if not rows:
+                del self._tags[tag]
+        for field, value in items:
+            values = self._fields[field]
+            rows = values[value]
+            rows.discard(row)
+            if not rows:
+                del values[value]
+                if not values:
+                    del self._fields[field]
+
+    def record(self, row: int) -> Dict[str, Any]:
+        """导出一行的属性，可序列化为 JSON"""
+        tags, items = self._row_keys.get(row, (_EMPTY, ()))
+        return {
+            "tags": sorted(tags),
+            "metadata": dict(items),
+            "created_at": float(self.created_at[row]),
+            "importance": float(self.importance[row]),
+        }
+
+    @classmethod
+    def from_records(cls, records: List[Dict[str, Any]]) -> "AttributeIndex":
+        """由 record() 导出的属性列表重建索引，行号为列表下标"""
+        index = cls()
+        index.reserve(len(records))
+        for row, record in enumerate(records):
+            index.set(row, record["tags"], record["metadata"],
+                      record["created_at"], record["importance"])
+        return index
+
+    def compact(self, keep: np.ndarray) -> None:
+        """
+        按向量存储的压缩结果重排行号
+
+        参数:
+            keep: 保留的旧行号（升序），新行号为其下标
+        """
+        count = keep.shape[0]
+        remap = {int(old): new for new, old in enumerate(keep)}
+        self.created_at[:count] = self.created_at[keep]
+        self.importance[:count] = self.importance[keep]
+        for rows_by_key in [self._tags] + list(self._fields.values()):
+            for key, rows in rows_by_key.items():
+                rows_by_key[key] = {remap[row] for row in rows}
+        self._row_keys = {remap[row]: keys for row, keys in self._row_keys.items()}
+
+    def select(self, memory_filter: MemoryFilter, alive: np.ndarray) -> np.ndarray:
+        """
+        求满足过滤条件的有效行号
+
+        标签与元数据条件先从最小的倒排表开始求交集，得到的候选较少时
+        只在候选行上比较时间与重要性；没有这类条件时对整列做向量化比较。
+
+        参数:
+            memory_filter: 过滤条件
+            alive: 各行是否有效的布尔数组，长度即参与过滤的行数
+
+        返回:
+            升序排列的行号数组
+        """
+        size = alive.shape[0]
+        groups: List[Set[int]] = [self._tags.get(tag, _EMPTY) for tag in memory_filter.tags]
+        if memory_filter.any_tags:
+            union: Set[int] = set()
+            for tag in memory_filter.any_tags:
+                union |= self._tags.get(tag, _EMPTY)
+            groups.append(union)
+        for field, values in memory_filter.metadata.items():
+            by_value = self._fields.get(field, {})
+            union = set()
+            for value in values:
+                union |= by_value.get(value, _EMPTY)
+            groups.append(union)
+
+        if groups:
+            groups.sort(key=len)
+            candidates = set(groups[0])
+            for group in groups[1:]:
+                if not candidates:
+                    break
+                candidates &= group
+            rows = np.fromiter(candidates, dtype=np.int64, count=len(candidates))
+            rows.sort()
+            rows = rows[rows < size]
+            rows = rows[alive[rows]]
+            created_at = self.created_at[rows]
+            importance = self.importance[rows]
+            mask = np.ones(rows.shape[0], dtype=bool)
+        else:
+            rows = None
+            created_at = self.created_at[:size]
+            importance = self.importance[:size]
+            mask = alive.copy()
+
+        if memory_filter.created_after is not None:
+            mask &= created_at >= memory_filter.created_after
+        if memory_filter.created_before is not None:
+            mask &= created_at < memory_filter.created_before
+        if memory_filter.min_importance is not None:
+            mask &= importance >= memory_filter.min_importance
+        if memory_filter.max_importance is not None:
+            mask &= importance <= memory_filter.max_importance
+        return np.flatnonzero(mask) if rows is None else rows[mask]
@@ -0,0 +1,268 @@
+"""
+记忆索引模块
+
+为 MemoryManager 提供增量维护的倒排索引，避免每次查询都全量扫描记忆内容。
+"""
+
+import re
+from typing import List, Dict, Set, FrozenSet, Optional, Iterable
+
+# 中日韩字符的码位范围（正则字符类写法）：假名、CJK 扩展A、CJK 统一汉字、兼容汉字、谚文音节，
+# 分词、压缩与 token 估计都以此为准
+_CJK_RANGES = "\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\uac00-\ud7af"
+# 中日韩字符连续片段，以及其余的字母数字片段
+_TOKEN_PATTERN = re.compile(rf"(?P<cjk>[{_CJK_RANGES}]+)|(?P<word>[^\W_{_CJK_RANGES}]+)")
+_CJK_CHAR = re.compile(rf"[{_CJK_RANGES}]")
+
+_EMPTY: FrozenSet[str] = frozenset()
+
+# 子串检索用的片段词元：中文单字与字母数字词的三元组，加前缀与普通词元区分
+# （分词结果不含该字符），不影响按词检索
+_GRAM_PREFIX = "#"
+_GRAM_SIZE = 3
+
+
+def _cjk_tokens(run: str) -> List[str]:
+    """中文片段切分为相邻二元组（单字片段保留单字）"""
+    if len(run) == 1:
+        return [run]
+    return [run[i:i + 2] for i in range(len(run) - 1)]
+
+
+def tokenize(text: str, cjk_unigrams: bool = False) -> List[str]:
+    """
+    中文友好的分词
+
+    中日韩字符按相邻二元组（bigram）切分，其余字母数字按词切分，统一转小写。
+    二元组不依赖词典，且任意两个相邻汉字组成的子串都能命中索引。
+
+    参数:
+        text: 输入文本
+        cjk_unigrams: 是否同时输出中文单字，便于打分检索命中单字查询
+
+    返回:
+        词元列表
+    """
+    tokens: List[str] = []
+    for match in _TOKEN_PATTERN.finditer(text.lower()):
+        run = match.group("cjk")
+        if run:
+            if cjk_unigrams and len(run) > 1:
+                tokens.extend(run)
+            tokens.extend(_cjk_tokens(run))
+        else:
+            tokens.append(match.group("word"))
+    return tokens
+
+
+def _word_grams(word: str) -> List[str]:
+    """字母数字词的全部三元组片段词元，短于三个字符的词没有"""
+    return [_GRAM_PREFIX + word[i:i + _GRAM_SIZE] for i in range(len(word) - _GRAM_SIZE + 1)]
+
+
+def with_grams(tokens: Iterable[str]) -> Set[str]:
+    """
+    倒排索引实际登记的词元：tokenize 的结果，外加由其推出的中文单字与
+    字母数字词三元组片段词元，使单字查询与贴着查询首尾的残缺单词也能利用索引
+
+    参数:
+        tokens: tokenize 的结果
+
+    返回:
+        词元集合
+    """
+    result = set(tokens)
+    for token in tokens:
+        if _CJK_CHAR.match(token):
+            result.update(_GRAM_PREFIX + char for char in token)
+        else:
+            result.update(_word_grams(token))
+    return result
+
+
+def substring_tokens(query: str) -> Set[str]:
+    """
+    提取子串查询中一定会出现在匹配文本里的词元
+
+    若文本包含 query 作为子串，则文本的 with_grams(tokenize(text)) 必然包含这里返回的每个词元：
+    中文二元组与单字总是成立；字母数字词两侧都被其他字符隔开时是完整的词，
+    贴着查询首尾的词可能只是文本中某个更长单词的一部分，改用它的三元组。
+    只有不足三个字符的首尾单词（如单独的 "go"）无法利用索引。
+
+    参数:
+        query: 查询字符串
+
+    返回:
+        词元集合，为空表示无法利用索引
+    """
+    query = query.lower()
+    tokens: Set[str] = set()
+    for match in _TOKEN_PATTERN.finditer(query):
+        run = match.group("cjk")
+        if run:
+            if len(run) > 1:
+                tokens.update(_cjk_tokens(run))
+            else:
+                tokens.add(_GRAM_PREFIX + run)
+        elif match.start() > 0 and match.end() < len(query):
+            tokens.add(match.group("word"))
+        else:
+            tokens.update(_word_grams(match.group("word")))
+    return tokens
+
+
+class InvertedIndex:
+    """词元 -> 记忆ID集合 的倒排索引"""
+
+    def __init__(self):
+        self._postings: Dict[str, Set[str]] = {}
+        # 只保存 tokenize 的结果，片段词元在移除时再推出，节省内存
+        self._doc_tokens: Dict[str, FrozenSet[str]] = {}
+
+    def __len__(self) -> int:
+        return len(self._doc_tokens)
+
+    def add(self, doc_id: str, text: str) -> None:
+        """
+        索引一条文本，已存在时先移除旧的词元
+
+        参数:
+            doc_id: 记忆ID
+            text: 记忆内容
+        """
+        if doc_id in self._doc_tokens:
+            self.remove(doc_id)
+        tokens = frozenset(tokenize(text))
+        self._doc_tokens[doc_id] = tokens
+        for token in with_grams(tokens):
+            posting = self._postings.get(token)
+            if posting is None:
+                self._postings[token] = {doc_id}
+            else:
+                posting.add(doc_id)
+
+    def remove(self, doc_id: str) -> bool:
+        """移除一条文本的索引"""
+        tokens = self._doc_tokens.pop(doc_id, None)
+        if tokens is None:
+            return False
+        for token in with_grams(tokens):
+            posting = self._postings[token]
+            posting.discard(doc_id)
+            if not posting:
+                del self._postings[token]
+        return True
+
+    def clear(self) -> None:
+        """清空索引"""
+        self._postings = {}
+        self._doc_tokens = {}
+
+    def document_frequency(self, token: str) -> int:
+        """包含该词元的记忆数"""
+        return len(self._postings.get(token, _EMPTY))
+
+    def intersect(self, tokens: Iterable[str]) -> Set[str]:
+        """返回同时包含全部词元的记忆ID，从最短的倒排表开始求交集"""
+        postings = sorted((self._postings.get(token, _EMPTY) for token in tokens), key=len)
+        if not postings or not postings[0]:
+            return set()
+        result = set(postings[0])
+        for posting in postings[1:]:
+            result &= posting
+            if not result:
+                break
+        return result
+
+    def search(self, query: str, exact: bool = True) -> Optional[Set[str]]:
+        """
+        查找候选记忆
+
+        参数:
+            query: 查询字符串
+            exact: True 时返回子串匹配的候选超集（需再做子串校验），
+                False 时返回包含查询全部词元的记忆
+
+        返回:
+            候选记忆ID集合；查询中没有可用词元时返回None，表示需要全量扫描
+        """
+        tokens = substring_tokens(query) if exact else set(tokenize(query))
+        if not tokens:
+            return None
+        return self.intersect(tokens)
+
+
+class TagIndex:
+    """标签 -> 记忆ID集合 的索引"""
+
+    def __init__(self):
+        self._tags: Dict[str, Set[str]] = {}
+        self._doc_tags: Dict[str, FrozenSet[str]] = {}
+
+    def __len__(self) -> int:
+        return len(self._doc_tags)
+
+    def add(self, doc_id: str, tags: Iterable[str]) -> None:
+        """
+        索引一条记忆的标签，已存在时先移除旧标签
+
+        参数:
+            doc_id: 记忆ID
+            tags: 标签列表
+        """
+        if doc_id in self._doc_tags:
+            self.remove(doc_id)
+        tags = frozenset(tags)
+        self._doc_tags[doc_id] = tags
+        for tag in tags:
+            members = self._tags.get(tag)
+            if members is None:
+                self._tags[tag] = {doc_id}
+            else:
+                members.add(doc_id)
+
+    def remove(self, doc_id: str) -> bool:
+        """移除一条记忆的标签索引"""
+        tags = self._doc_tags.pop(doc_id, None)
+        if tags is None:
+            return False
+        for tag in tags:
+            members = self._tags[tag]
+            members.discard(doc_id)
+            if not members:
+                del self._tags[tag]
+        return True
+
+    def clear(self) -> None:
+        """清空索引"""
+        self._tags = {}
+        self._doc_tags = {}
+
+    def match_all(self, tags: Iterable[str]) -> Set[str]:
+        """包含全部标签的记忆ID，从最小的集合开始求交集"""
+        members = sorted((self._tags.get(tag, _EMPTY) for tag in set(tags)), key=len)
+        if not members:
+            return set(self._doc_tags)
+        if not members[0]:
+            return set()
+        result = set(members[0])
+        for member in members[1:]:
+            result &= member
+            if not result:
+                break
+        return result
+
+    def match_any(self, tags: Iterable[str]) -> Set[str]:
+        """包含任意一个标签的记忆ID"""
+        result: Set[str] = set()
+        for tag in set(tags):
+            result |= self._tags.get(tag, _EMPTY)
+        return result
+
+    def count(self, tag: str) -> int:
+        """带有该标签的记忆数"""
+        return len(self._tags.get(tag, _EMPTY))
+
+    def counts(self) -> Dict[str, int]:
+        """所有标签及其记忆数"""
+        return {tag: len(members) for tag, members in self._tags.items()}
@@ -0,0 +1,3 @@
+from .short_memory import ShortMemory
+
+__all__ = ["ShortMemory"]
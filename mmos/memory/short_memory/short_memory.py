@@ -1,18 +1,31 @@
-from openai import OpenAI
-from openai.types.create_embedding_response import CreateEmbeddingResponse
 import os
-from dotenv import load_dotenv
-from chromadb import PersistentClient
 from typing import List, Dict, Any, Optional, Union, Iterable, Literal
-import numpy as np
-from sklearn.metrics.pairwise import cosine_similarity, euclidean_distances, manhattan_distances, pairwise_distances
 import json
-load_dotenv()
 
-os.environ["OPENAI_API_KEY"] = "sk-proj-1234567890"
-os.environ["OPENAI_BASE_URL"] = "http://180.153.21.76:12118/v1"
-os.environ["EMBEDDING_MODEL"] = "text-embedding-3-small"
-os.environ["CHROMA_DB_PATH"] = "mmos/vector_db"
+from ...embedding import AsyncOpenAIEmbedder, EmbeddingCache, EmbeddingService, OpenAIEmbedder
+
+# openai、chromadb、sklearn、dotenv 都在用到时才导入，导入本模块不产生副作用
+
+# 环境变量未设置时使用的默认值（不会写回 os.environ）
+_ENV_DEFAULTS = {
+    "OPENAI_API_KEY": "sk-proj-1234567890",
+    "OPENAI_BASE_URL": "http://180.153.21.76:12118/v1",
+    "EMBEDDING_MODEL": "text-embedding-3-small",
+    "CHROMA_DB_PATH": "mmos/vector_db",
+}
+
+
+_dotenv_loaded = False
+
+
+def _env(name: str) -> Optional[str]:
+    """读取配置项，首次读取时加载 .env 文件"""
+    global _dotenv_loaded
+    if not _dotenv_loaded:
+        from dotenv import load_dotenv
+        load_dotenv()
+        _dotenv_loaded = True
+    return os.getenv(name, _ENV_DEFAULTS.get(name))
 
 
 
@@ -72,18 +85,86 @@ test_cases = """
 test_cases = json.loads(test_cases)
 
 class ShortMemory:
-    def __init__(self):
-        self.client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"), base_url=os.getenv("OPENAI_BASE_URL"))
-        self.embedding_model = os.getenv("EMBEDDING_MODEL", "text-embedding-3-small")
-        self.chroma_client = PersistentClient(path=os.getenv("CHROMA_DB_PATH", "mmos/vector_db"))
+    def __init__(self, embedding_service: Optional[EmbeddingService] = None):
+        """
+        初始化短期记忆
+
+        参数:
+            embedding_service: 嵌入服务，为None时使用带缓存的 OpenAI 嵌入服务；
+                测试时可传入基于 LocalEmbedder 的服务以脱离网络；
+                传入时不会加载 .env，也不会创建 OpenAI 客户端
+        """
+        self._client = None
+        self._async_client = None
+        self._embedding_model: Optional[str] = None
+        self._chroma_client = None
+        if embedding_service is None:
+            embedding_service = EmbeddingService(
+                OpenAIEmbedder(client=self.client, model=self.embedding_model),
+                model_name=self.embedding_model,
+                async_embedder=AsyncOpenAIEmbedder(client=self.async_client, model=self.embedding_model),
+                cache=EmbeddingCache(path=os.getenv("EMBEDDING_CACHE_PATH")),
+            )
+        self.embedding_service = embedding_service
+        self._segmenters = {}  # conversation_id -> TopicSegmenter
+        self._compressor = None  # ContextCompressor，首次压缩时创建
+
+    @property
+    def client(self):
+        """OpenAI 客户端，首次访问时才创建"""
+        if self._client is None:
+            from openai import OpenAI
+            self._client = OpenAI(api_key=_env("OPENAI_API_KEY"), base_url=_env("OPENAI_BASE_URL"))
+        return self._client
+
+    @property
+    def async_client(self):
+        """AsyncOpenAI 客户端，首次访问时才创建"""
+        if self._async_client is None:
+            from openai import AsyncOpenAI
+            self._async_client = AsyncOpenAI(api_key=_env("OPENAI_API_KEY"), base_url=_env("OPENAI_BASE_URL"))
+        return self._async_client
+
+    @property
+    def embedding_model(self) -> str:
+        """直接请求嵌入接口时使用的模型名"""
+        if self._embedding_model is None:
+            self._embedding_model = _env("EMBEDDING_MODEL")
+        return self._embedding_model
+
+    @property
+    def chroma_client(self):
+        """Chroma 持久化客户端，首次访问时才打开数据库"""
+        if self._chroma_client is None:
+            from chromadb import PersistentClient
+            self._chroma_client = PersistentClient(path=_env("CHROMA_DB_PATH"))
+        return self._chroma_client
 
     def _get_embedding(self, input: str | List[str] | Iterable[int] | Iterable[Iterable[int]],) -> List:
-        print(input)
+        if isinstance(input, str):
+            return self.embedding_service.embed([input])
+        input = list(input)
+        if all(isinstance(item, str) for item in input):
+            return self.embedding_service.embed(input)
+        # token 形式的输入无法按内容缓存，直接请求接口
         response = self.client.embeddings.create(
             model=self.embedding_model,
             input=input,
         )
         return [embedding.embedding for embedding in response.data]
+
+    async def aget_embedding(self, input: str | List[str] | Iterable[int] | Iterable[Iterable[int]],) -> List:
+        """_get_embedding 的异步版本，使用 AsyncOpenAI 客户端"""
+        if isinstance(input, str):
+            return await self.embedding_service.aembed([input])
+        input = list(input)
+        if all(isinstance(item, str) for item in input):
+            return await self.embedding_service.aembed(input)
+        response = await self.async_client.embeddings.create(
+            model=self.embedding_model,
+            input=input,
+        )
+        return [embedding.embedding for embedding in response.data]
     
     def _calculate_vector_similarity(self, vector1: List[float], vector2: List[float], method: Literal["cosine", "euclidean", "dot_product", "manhattan", "jaccard"] = "cosine") -> float:
         """计算两个向量之间的相似度。
@@ -101,62 +182,144 @@ class ShortMemory:
         返回:
             相似度得分
         """
-        # 将输入向量转换为2D数组（sklearn要求的格式）
-        v1 = np.array(vector1).reshape(1, -1)
-        v2 = np.array(vector2).reshape(1, -1)
+        from ...similarity import pairwise_similarity
+
+        return float(pairwise_similarity(vector2, vector1, method, dtype="float64")[0, 0])
+
+    def similarity_matrix(self, embeddings: List[List[float]], queries: Optional[List[List[float]]] = None,
+                          method: Literal["cosine", "euclidean", "dot_product", "manhattan", "jaccard"] = "cosine"):
+        """一次计算多条消息嵌入之间的相似度矩阵。
+        
+        参数:
+            embeddings: N 条消息的嵌入
+            queries: Q 条查询嵌入，为None时计算 embeddings 两两之间的相似度
+            method: 计算方法，同 _calculate_vector_similarity
+        
+        返回:
+            (Q×N) 或 (N×N) 的 float32 相似度矩阵
+        """
+        from ...similarity import pairwise_similarity
+
+        return pairwise_similarity(embeddings, queries, method)
+        
+    def _segmenter(self, conversation_id: str, similarity_threshold: float,
+                   prefilter_error_rate: Optional[float] = None):
+        """会话的话题切分器，阈值或预筛设置变化时重新切分"""
+        from ...segmentation import TopicSegmenter
+
+        segmenter = self._segmenters.get(conversation_id)
+        if (segmenter is None or segmenter.similarity_threshold != similarity_threshold
+                or segmenter.prefilter_error_rate != prefilter_error_rate):
+            segmenter = TopicSegmenter(self._get_embedding, similarity_threshold, prefilter_error_rate)
+            self._segmenters[conversation_id] = segmenter
+        return segmenter
+
+    def reset_conversation(self, conversation_id: str = "default") -> None:
+        """丢弃会话的切分状态"""
+        self._segmenters.pop(conversation_id, None)
+
+    def conversation_state(self, conversation_id: str = "default") -> Optional[Dict[str, Any]]:
+        """
+        导出会话的切分状态（含预筛布隆过滤器），可与会话一起保存
         
-        if method == "cosine":
-            # 余弦相似度：测量两个向量夹角的余弦值
-            return cosine_similarity(v1, v2)
-        elif method == "euclidean":
-            # 欧几里得距离：测量两点之间的直线距离
-            return euclidean_distances(v1, v2)[0][0]
-        elif method == "dot_product":
-            # 点积：直接计算向量点积，适用于归一化向量
-            return np.dot(v1, v2.T)[0][0]
-        elif method == "manhattan":
-            # 曼哈顿距离：测量沿坐标轴的距离总和
-            return manhattan_distances(v1, v2)[0][0]
-        elif method == "jaccard":
-            # 杰卡德相似度：集合相似度度量
-            # 对于二元向量或稀疏特征，使用pairwise_distances计算Jaccard距离
-            # 首先将向量转换为二进制形式（>0的元素设为1）
-            binary_v1 = (v1 > 0).astype(int)
-            binary_v2 = (v2 > 0).astype(int)
-            
-            # 如果两个向量都是零向量，返回1.0（完全相似）
-            if not np.any(binary_v1) and not np.any(binary_v2):
-                return 1.0
-                
-            # 计算Jaccard距离（1减去相似度）
-            jaccard_dist = pairwise_distances(binary_v1, binary_v2, metric='jaccard')[0][0]
-            # 返回Jaccard相似度（1减去距离）
-            return 1.0 - jaccard_dist
+        参数:
+            conversation_id: 会话标识
+        返回:
+            可 JSON 序列化的状态字典，会话不存在时返回None
+        """
+        segmenter = self._segmenters.get(conversation_id)
+        return segmenter.to_dict() if segmenter is not None else None
+
+    def restore_conversation(self, state: Dict[str, Any], conversation_id: str = "default") -> None:
+        """
+        恢复 conversation_state 导出的会话切分状态
         
-    def split_message(self, messages: List[Dict[str, str]],instant_count: int = 1, similarity_threshold: float = 0.5) -> List[Dict[str, str]]:
+        参数:
+            state: 状态字典
+            conversation_id: 会话标识
+        """
+        from ...segmentation import TopicSegmenter
+
+        self._segmenters[conversation_id] = TopicSegmenter.from_dict(state, self._get_embedding)
+
+    def conversation_stats(self, conversation_id: str = "default") -> Dict[str, int]:
         """
-        将消息列表按即时消息数量分割成多个子列表
+        会话的切分计数
         
         参数:
-            messages: 消息列表
-            instant_count: 每个子列表中即时消息的数量
+            conversation_id: 会话标识
+        返回:
+            turns（处理的轮次数）、embedded（请求嵌入的文本数）、
+            rejected（被预筛直接开启新话题的轮次数）、embeddings_avoided（预筛省下的嵌入数）
+        """
+        segmenter = self._segmenters.get(conversation_id)
+        if segmenter is None:
+            return {"turns": 0, "embedded": 0, "rejected": 0, "embeddings_avoided": 0}
+        return dict(segmenter.stats)
+
+    def split_message(self, messages: List[Dict[str, str]], instant_count: int = 1, similarity_threshold: float = 0.5,
+                      conversation_id: str = "default",
+                      prefilter_error_rate: Optional[float] = None) -> List[List[Dict[str, str]]]:
+        """
+        将消息列表按话题分割成多个子列表
+        
+        每条用户消息与其后的回复组成一轮，按用户消息的嵌入与各话题质心的余弦相似度
+        归入最相似的话题，低于阈值时开启新话题。会话状态按 conversation_id 保存，
+        同一会话每次追加消息后再调用时，只为新增的轮次请求嵌入。
+        
+        参数:
+            messages: 消息列表（OpenAI messages 格式），第一条用户消息之前的消息归入第一轮
+            instant_count: 最近的几轮对话无论相似度如何都归入当前话题，不会被剥离
             similarity_threshold: 相似度阈值
+            conversation_id: 会话标识
+            prefilter_error_rate: 关键词布隆过滤器的误判率；设置后关键词不少于三个、不含指代追问
+                且与所有历史话题都没有共同关键词的轮次直接开启新话题，不请求嵌入，
+                其余轮次只与当前话题及有共同关键词的话题比较。为None时不预筛
         返回:
-            分割后的消息列表
+            按话题分割后的消息列表，话题按首次出现的顺序排列，每个话题内保持原有顺序；
+            最后一轮所在的话题即当前话题
         """
-        user_messages = []
+        turns: List[List[Dict[str, str]]] = []
+        contents: List[str] = []
         for item in messages:
             if item.get("role") == "user" and item.get("content") is not None:
-                user_messages.append(item["content"])
-            
-        for i in range(0, len(messages), instant_count):
-            result.append(messages[i:i+instant_count])
-        return result
-
-if __name__ == "__main__":
-    short_memory = ShortMemory()
-    # 指代消解（Coreference Resolution）实现
-    for i in test_cases:
-        embedding = short_memory._get_embedding([i["messages"][0]["content"],i["messages"][0]["content"]+" "+i["messages"][2]["content"]])
-        result = short_memory._calculate_vector_similarity(embedding[0], embedding[1])
-        print(result)
+                if contents or not turns:
+                    turns.append([])
+                contents.append(item["content"])
+            elif not turns:
+                turns.append([])
+            turns[-1].append(item)
+        if not contents:
+            return [list(messages)] if messages else []
+
+        replies = ["\n".join(item["content"] for item in turn_messages
+                             if item.get("role") == "assistant" and isinstance(item.get("content"), str))
+                   for turn_messages in turns]
+        segmenter = self._segmenter(conversation_id, similarity_threshold, prefilter_error_rate)
+        labels = segmenter.update(contents, replies)
+        current = labels[-1]
+        for turn in range(max(0, len(labels) - instant_count), len(labels)):
+            labels[turn] = current
+
+        segments: Dict[int, List[Dict[str, str]]] = {}
+        for label, turn_messages in zip(labels, turns):
+            segments.setdefault(label, []).extend(turn_messages)
+        return [segments[label] for label in sorted(segments)]
+
+    def compress(self, messages: List[Dict[str, str]], token_budget: int) -> List[Dict[str, str]]:
+        """
+        将消息列表压缩到 token 预算以内
+        
+        最近两轮对话原样保留，更早的对话按句子抽取式压缩，见 mmos.compression。
+        
+        参数:
+            messages: 消息列表（OpenAI messages 格式）
+            token_budget: token 预算
+        返回:
+            压缩后的消息列表
+        """
+        if self._compressor is None:
+            from ...compression import ContextCompressor
+
+            self._compressor = ContextCompressor()
+        return self._compressor.compress(messages, token_budget)
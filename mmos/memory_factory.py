@@ -3,12 +3,30 @@
 根据配置创建和管理不同的记忆模块
 """
 
-from typing import Dict, Any, Optional, Type
-from pydantic import BaseModel
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+from contextlib import contextmanager
+from typing import Dict, Any, Optional, Type, List, Set, Union, Iterable, Iterator, Tuple, Callable, TYPE_CHECKING
 
 from .config import MMOSConfig, ModuleName, StrategyType
 from .memory_manager import MemoryManager
-from .vector_store import SimpleVectorStore
+from .models import Memory, MemoryRecord
+from .retrieval import FusionMethod, fuse
+
+# NumPy、asyncio 相关模块只在用到时导入，保持 import mmos 轻量
+if TYPE_CHECKING:
+    import asyncio
+    from .aio import AsyncReadWriteLock, LoopLocal
+    from .filters import MemoryFilter
+
+logger = logging.getLogger(__name__)
+
+
+def _record_view(memory: Union[Memory, tuple]) -> Union[Memory, MemoryRecord]:
+    """原始记录元组包装为只读视图，Memory 原样返回"""
+    return MemoryRecord._make(memory) if type(memory) is tuple else memory
+
 
 # 模块接口（后续可以扩展为抽象基类）
 class MemoryModule:
@@ -50,8 +68,9 @@ class LongMemoryModule(MemoryModule):
     
     def initialize(self):
         """初始化长期记忆模块"""
-        # 基于配置初始化向量存储
-        self.vector_store = SimpleVectorStore()
+        # 基于配置初始化向量存储（params.index 可选 flat / ivf / hnsw）
+        from .ann import create_vector_store
+        self.vector_store = create_vector_store(self.config)
         
         # 基于策略初始化不同的实现
         if self.strategy == "ai":
@@ -99,7 +118,8 @@ class MemoryModuleFactory:
     }
     
     @classmethod
-    def create_module(cls, module_name: ModuleName, strategy: StrategyType, params: dict = None) -> MemoryModule:
+    def create_module(cls, module_name: ModuleName, strategy: StrategyType, params: dict = None,
+                      initialize: bool = True) -> MemoryModule:
         """
         创建记忆模块实例
         
@@ -107,6 +127,7 @@ class MemoryModuleFactory:
             module_name: 模块名称
             strategy: 实现策略
             params: 模块参数
+            initialize: 是否立即调用 initialize()
             
         返回:
             记忆模块实例
@@ -116,70 +137,500 @@ class MemoryModuleFactory:
             
         module_class = cls.MODULE_CLASSES[module_name]
         module = module_class(config=params, strategy=strategy)
-        module.initialize()
+        if initialize:
+            module.initialize()
         return module
 
 # 增强版记忆管理系统
 class MMOSMemorySystem:
     """基于配置的记忆管理系统"""
     
-    def __init__(self, config: MMOSConfig = None):
+    # 混合检索时每个来源召回的候选数 = limit * 该倍数
+    _CANDIDATE_FACTOR = 3
+    
+    def __init__(self, config: MMOSConfig = None,
+                 memory_manager: Optional[MemoryManager] = None,
+                 executor: Optional[ThreadPoolExecutor] = None,
+                 max_concurrency: int = 32):
         """
         初始化记忆管理系统
         
         参数:
             config: MMOS配置，如果为None则使用默认配置
+            memory_manager: 使用的记忆管理器，如果为None则创建仅在内存中存储的管理器；
+                其中已有的记忆会在初始化时建立检索索引
+            executor: 并发检索使用的线程池，如果为None则按需创建并在 close() 时关闭；
+                外部传入的线程池由调用方负责关闭
+            max_concurrency: 异步接口同时进行的检索数上限
         """
+        from .bm25 import BM25Index
+        
         self.config = config or MMOSConfig()
-        self.memory_manager = MemoryManager()
+        self.memory_manager = memory_manager or MemoryManager()
         self.modules: Dict[ModuleName, MemoryModule] = {}
+        self._initialized_modules: Set[ModuleName] = set()
+        self._module_lock = threading.RLock()
+        self._pending_memories: Optional[List[Memory]] = None  # 批量写入期间待处理的记忆
+        # 新记忆的写入与建立索引在同一把锁内完成，写入前检查（见 MemoryManager.add_store_guard）
+        # 看到的向量数因此不会漏掉已写入、尚未建立向量的记忆
+        self._write_lock = threading.RLock()
+        self.sparse_index = BM25Index()  # 关键词检索索引
+        self._executor: Optional[ThreadPoolExecutor] = executor
+        self._owns_executor = executor is None
+        # 异步接口：检索之间并发、写入独占
+        self.max_concurrency = max_concurrency
+        # 每个事件循环各自的读写锁与检索信号量（LoopLocal），首次异步调用时创建
+        self._async_lock: Optional["LoopLocal[AsyncReadWriteLock]"] = None
+        self._async_slots: Optional["LoopLocal[asyncio.Semaphore]"] = None
         self._initialize_modules()
+        self._index_existing()
+        self.memory_manager.add_listener(self._on_memory_change)
     
-    def _initialize_modules(self):
-        """初始化所有启用的模块"""
-        active_modules = self.config.get_active_modules()
+    def _initialization_order(self) -> List[List[ModuleName]]:
+        """
+        按依赖关系把启用的模块分层
+        
+        每层的模块只依赖之前各层的模块，同层模块互不依赖、可以并发初始化；
+        层内按 priority 从高到低排列，同优先级保持配置中的顺序。
         
+        返回:
+            模块名的分层列表
+        """
+        active_modules = self.config.get_active_modules()
+        remaining: Dict[ModuleName, Set[ModuleName]] = {}
         for module_name in active_modules:
-            module_config = self.config.modules[module_name]
-            module = MemoryModuleFactory.create_module(
-                module_name=module_name,
-                strategy=module_config.strategy,
-                params=module_config.params
-            )
-            self.modules[module_name] = module
+            dependencies = set(self.config.modules[module_name].dependencies)
+            for dependency in dependencies:
+                if dependency not in active_modules:
+                    raise ValueError(f"模块 {module_name} 依赖未启用的模块 {dependency}")
+            remaining[module_name] = dependencies
+        
+        levels: List[List[ModuleName]] = []
+        while remaining:
+            ready = [name for name in active_modules if name in remaining and not remaining[name]]
+            if not ready:
+                raise ValueError(f"模块依赖存在循环: {', '.join(remaining)}")
+            ready.sort(key=lambda name: -self.config.modules[name].priority)
+            levels.append(ready)
+            for name in ready:
+                del remaining[name]
+            for dependencies in remaining.values():
+                dependencies.difference_update(ready)
+        return levels
+    
+    def _eager_modules(self) -> Set[ModuleName]:
+        """需要在构造时初始化的模块：非延迟模块及其全部依赖"""
+        eager: Set[ModuleName] = set()
+        stack = [name for name in self.config.get_active_modules()
+                 if not self.config.modules[name].lazy]
+        while stack:
+            name = stack.pop()
+            if name not in eager:
+                eager.add(name)
+                stack.extend(self.config.modules[name].dependencies)
+        return eager
+    
+    def _initialize_modules(self):
+        """
+        创建所有启用的模块，并按依赖分层初始化
+        
+        同层的多个模块在线程池中并发初始化；延迟模块只创建实例，
+        首次通过 get_module 访问时才初始化。
+        """
+        levels = self._initialization_order()
+        for level in levels:
+            for module_name in level:
+                module_config = self.config.modules[module_name]
+                self.modules[module_name] = MemoryModuleFactory.create_module(
+                    module_name=module_name,
+                    strategy=module_config.strategy,
+                    params=module_config.params,
+                    initialize=False,
+                )
+        
+        eager = self._eager_modules()
+        for level in levels:
+            batch = [name for name in level if name in eager]
+            if len(batch) == 1:
+                self.modules[batch[0]].initialize()
+            elif batch:
+                with ThreadPoolExecutor(max_workers=len(batch), thread_name_prefix="mmos-init") as pool:
+                    # list() 等待全部完成，并抛出第一个失败模块的异常
+                    list(pool.map(lambda name: self.modules[name].initialize(), batch))
+            self._initialized_modules.update(batch)
     
     def get_module(self, module_name: ModuleName) -> Optional[MemoryModule]:
-        """获取指定模块实例"""
-        return self.modules.get(module_name)
+        """获取指定模块实例，延迟模块在首次访问时（连同其依赖）初始化"""
+        module = self.modules.get(module_name)
+        if module is None or module_name in self._initialized_modules:
+            return module
+        with self._module_lock:
+            if module_name not in self._initialized_modules:
+                for dependency in self.config.modules[module_name].dependencies:
+                    self.get_module(dependency)
+                module.initialize()
+                self._initialized_modules.add(module_name)
+                if module_name == "long_memory":
+                    self._index_vectors()
+        return module
     
-    def store_memory(self, content: str, **kwargs):
-        """存储记忆并处理相关模块逻辑"""
-        # 基础存储
-        memory = self.memory_manager.store(content, **kwargs)
+    def is_module_initialized(self, module_name: ModuleName) -> bool:
+        """模块是否已完成初始化"""
+        return module_name in self._initialized_modules
+    
+    @property
+    def vector_store(self) -> Optional[Any]:
+        """长期记忆模块的向量存储，未启用时为None；延迟模块会在此时初始化"""
+        return getattr(self.get_module("long_memory"), "vector_store", None)
+    
+    def _loaded_vector_store(self) -> Optional[Any]:
+        """已初始化的向量存储，长期记忆模块尚未初始化时为None（不触发初始化）"""
+        if not self.is_module_initialized("long_memory"):
+            return None
+        return getattr(self.modules["long_memory"], "vector_store", None)
+    
+    def _index_vectors(self) -> None:
+        """把向量存储中还没有的记忆补充进去"""
+        vector_store = self._loaded_vector_store()
+        if vector_store is None:
+            return
+        manager = self.memory_manager
+        manager.wait_until_loaded()
+        missing = []
+        for memory_id in vector_store.missing_ids(list(manager.memories)):
+            memory = manager._raw_memory(memory_id)
+            if memory is not None:
+                missing.append(_record_view(memory))
+        if missing:
+            vector_store.add_memories(missing)
+    
+    def _index_existing(self) -> None:
+        """
+        为记忆管理器中已有的记忆建立检索索引，向量存储中已有的向量不再重新嵌入
         
-        # 处理长期记忆（如果启用）
-        if "long_memory" in self.modules:
-            # 处理长期记忆逻辑
-            pass
+        直接读取原始记录，延迟加载的记忆不会因此被构建为 Memory 对象。
+        """
+        self.memory_manager.wait_until_loaded()
+        for memory in self.memory_manager._raw_memories():
+            self.sparse_index.add_memory(_record_view(memory))
+        self._index_vectors()
+    
+    def _on_memory_change(self, op: str, memory_id: Optional[Any], memory: Optional[Memory]) -> None:
+        """记忆管理器的变更监听器：内容修改、删除和清空同步到各检索索引"""
+        vector_store = self._loaded_vector_store()
+        if op == "clear":
+            self.sparse_index.clear()
+            if vector_store is not None:
+                vector_store.clear()
+        elif op == "delete":
+            self.sparse_index.remove_memory(memory_id)
+            if vector_store is not None:
+                vector_store.remove_memory(memory_id)
+        elif op == "update" and memory_id in self.sparse_index:
+            # 不在索引中的是批量写入中尚未处理的新记忆，块结束时按最新内容索引
+            self.sparse_index.update_memory(memory)
+            if vector_store is not None:
+                vector_store.update_memory(memory)
+    
+    def _process_new_memories(self, memories: List[Memory]) -> None:
+        """对新存储的记忆执行向量索引和模块逻辑"""
+        # 跳过同一批量写入中已被删除的记忆
+        current = self.memory_manager.memories
+        memories = [memory for memory in memories if current.get(memory.id) is memory]
+        if not memories:
+            return
+        
+        for memory in memories:
+            self.sparse_index.add_memory(memory)
+        
+        # 处理长期记忆（如果启用）；延迟模块初始化时会补充这些记忆的向量
+        vector_store = self._loaded_vector_store()
+        if vector_store is not None:
+            vector_store.add_memories(memories)
             
         # 处理事件（如果启用）
         if "event" in self.modules:
             # 处理事件逻辑
             pass
+    
+    @contextmanager
+    def batch(self) -> Iterator["MMOSMemorySystem"]:
+        """
+        批量写入上下文
+        
+        块内存储的记忆在块结束时统一持久化、建立向量索引并执行模块逻辑；
+        块内抛出异常时回滚全部内存变更。
+        """
+        with self._write_lock:
+            outermost = self._pending_memories is None
+            if outermost:
+                self._pending_memories = []
+            try:
+                with self.memory_manager.batch():
+                    yield self
+            except BaseException:
+                if outermost:
+                    self._pending_memories = None
+                raise
+            if outermost:
+                pending, self._pending_memories = self._pending_memories, None
+                self._process_new_memories(pending)
+    
+    def store_memory(self, content: str, **kwargs):
+        """存储记忆并处理相关模块逻辑"""
+        with self._write_lock:
+            # 基础存储
+            memory = self.memory_manager.store(content, **kwargs)
             
-        return memory
+            if self._pending_memories is not None:
+                self._pending_memories.append(memory)
+            else:
+                self._process_new_memories([memory])
+                
+            return memory
     
-    def retrieve_memory(self, query: str, **kwargs):
-        """检索记忆"""
-        # 使用短期记忆检索
-        if "short_memory" in self.modules:
-            results = self.memory_manager.retrieve(query, **kwargs)
+    def update_memory(self, memory_id: Any, **kwargs) -> Optional[Memory]:
+        """
+        更新记忆，内容变化时重新建立关键词与向量索引
+        
+        参数:
+            memory_id: 记忆ID
+            **kwargs: MemoryManager.update 的参数（content、tags、metadata、importance）
             
-        # 如果启用长期记忆，也使用向量检索
-        if "long_memory" in self.modules and hasattr(self.modules["long_memory"], "vector_store"):
-            vector_store = self.modules["long_memory"].vector_store
-            vector_results = vector_store.similarity_search(query)
-            # 合并结果
-            # ...
+        返回:
+            更新后的记忆，不存在时为None
+        """
+        return self.memory_manager.update(memory_id, **kwargs)
+    
+    def delete_memory(self, memory_id: Any) -> bool:
+        """
+        删除记忆，并从关键词与向量索引中移除
+        
+        参数:
+            memory_id: 记忆ID
+            
+        返回:
+            是否删除成功
+        """
+        return self.memory_manager.delete(memory_id)
+    
+    def store_many(self, items: Iterable[Union[str, Dict[str, Any]]]) -> List[Memory]:
+        """
+        批量存储记忆
+        
+        参数:
+            items: 记忆内容字符串，或包含 store_memory 参数的字典
             
-        return results 
\ No newline at end of file
+        返回:
+            存储的记忆对象列表
+        """
+        with self.batch():
+            return [
+                self.store_memory(item) if isinstance(item, str) else self.store_memory(**item)
+                for item in items
+            ]
+    
+    def _get_executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="mmos-retrieval")
+            self._owns_executor = True
+        return self._executor
+    
+    def _retrieval_sources(self, memory_filter: Optional["MemoryFilter"] = None
+                           ) -> Dict[str, Callable[[str, int], List[Tuple[str, float]]]]:
+        """
+        当前可用的检索来源：名称 -> search(query, top_k)
+        
+        过滤条件按记忆管理器中的最新属性求出允许的记忆ID，再下推到各来源，
+        各来源的过滤结果因此一致。
+        """
+        vector_store = self.vector_store
+        if memory_filter is None or memory_filter.is_empty:
+            sources = {"keyword": self.sparse_index.search}
+            # 如果启用长期记忆，也使用向量检索
+            if vector_store is not None:
+                sources["vector"] = vector_store.similarity_search
+            return sources
+        
+        allowed_ids = self.memory_manager.filter_ids(memory_filter)
+        sources = {"keyword": lambda query, top_k: self.sparse_index.search(query, top_k, allowed_ids)}
+        if vector_store is not None:
+            sources["vector"] = lambda query, top_k: vector_store.similarity_search(
+                query, top_k, allowed_ids=allowed_ids)
+        return sources
+    
+    def retrieve_memory(self, query: str, limit: int = 10,
+                        filter_func: Optional[Callable[[Memory], bool]] = None,
+                        fusion: FusionMethod = "rrf",
+                        weights: Optional[Dict[str, float]] = None,
+                        timeout: Optional[float] = 2.0,
+                        return_scores: bool = False,
+                        memory_filter: Optional["MemoryFilter"] = None):
+        """
+        混合检索记忆
+        
+        关键词（BM25）与向量检索并发执行，结果按记忆ID去重后融合排序。
+        超过 timeout 仍未返回的来源会被忽略，检索耗时因此有上界；被忽略的检索
+        仍在线程池中运行到结束，期间持有向量存储的锁，之后的写入会等待它完成。
+        出错的来源记录警告日志后忽略。
+        
+        参数:
+            query: 查询字符串
+            limit: 返回结果数量限制
+            filter_func: 过滤函数
+            fusion: 融合方法，rrf（倒数排名融合）或 weighted（归一化分数加权）
+            weights: 来源名（keyword/vector）-> 权重
+            timeout: 等待各来源的最长秒数，None表示一直等待
+            return_scores: 为True时返回 (记忆, 分数字典) 列表，分数字典包含
+                各来源的原始分数以及 fused 融合分数
+            memory_filter: 结构化过滤条件（标签、元数据、创建时间、重要性），
+                在各来源打分之前生效，不需要多取再过滤
+            
+        返回:
+            匹配的记忆列表
+        """
+        sources = self._retrieval_sources(memory_filter)
+        candidates = limit * self._CANDIDATE_FACTOR
+        executor = self._get_executor()
+        futures = {
+            executor.submit(search, query, candidates): name
+            for name, search in sources.items()
+        }
+        done, not_done = wait(futures, timeout=timeout)
+        for future in not_done:
+            future.cancel()
+        
+        source_results: Dict[str, List[Tuple[str, float]]] = {}
+        for future in done:
+            error = future.exception()
+            if error is None:
+                source_results[futures[future]] = future.result()
+            else:
+                logger.warning("检索来源 %s 出错，已忽略该来源", futures[future], exc_info=error)
+        return self._collect_results(sources, source_results, limit, filter_func,
+                                     fusion, weights, return_scores)
+    
+    def _collect_results(self, sources: Dict[str, Any],
+                         source_results: Dict[str, List[Tuple[str, float]]],
+                         limit: int, filter_func: Optional[Callable[[Memory], bool]],
+                         fusion: FusionMethod, weights: Optional[Dict[str, float]],
+                         return_scores: bool):
+        """融合各来源的结果并转换为记忆对象"""
+        # 按来源固定顺序融合，保证结果确定
+        source_results = {name: source_results[name] for name in sources if name in source_results}
+        
+        per_source: Dict[str, Dict[str, float]] = {}
+        for name, items in source_results.items():
+            for memory_id, score in items:
+                per_source.setdefault(memory_id, {})[name] = score
+        
+        results = []
+        for memory_id, fused_score in fuse(source_results, fusion, weights):
+            memory = self.memory_manager.memories.get(memory_id)
+            if memory is None or (filter_func and not filter_func(memory)):
+                continue
+            memory.access()
+            if return_scores:
+                scores = dict(per_source[memory_id])
+                scores["fused"] = fused_score
+                results.append((memory, scores))
+            else:
+                results.append(memory)
+            if len(results) >= limit:
+                break
+            
+        return results
+    
+    def _init_async(self) -> None:
+        """创建异步接口使用的 LoopLocal，asyncio 原语不能跨事件循环使用"""
+        with self._module_lock:
+            if self._async_lock is None:
+                import asyncio
+                from .aio import AsyncReadWriteLock, LoopLocal
+                self._async_slots = LoopLocal(lambda: asyncio.Semaphore(self.max_concurrency))
+                self._async_lock = LoopLocal(AsyncReadWriteLock)
+    
+    def _get_async_lock(self) -> "AsyncReadWriteLock":
+        """当前事件循环的读写锁：同一循环内的写入互斥，不同循环之间由各索引自身的锁保护"""
+        if self._async_lock is None:
+            self._init_async()
+        return self._async_lock.get()
+    
+    async def astore_memory(self, content: str, **kwargs) -> Memory:
+        """
+        store_memory 的异步版本
+        
+        写入（含日志落盘与向量嵌入）在线程池中执行，不阻塞事件循环；
+        同一系统的写入之间以及写入与检索之间互斥。
+        """
+        from .aio import run_blocking
+        async with self._get_async_lock().write():
+            return await run_blocking(None, self.store_memory, content, **kwargs)
+    
+    async def astore_many(self, items: Iterable[Union[str, Dict[str, Any]]]) -> List[Memory]:
+        """store_many 的异步版本"""
+        from .aio import run_blocking
+        items = list(items)
+        async with self._get_async_lock().write():
+            return await run_blocking(None, self.store_many, items)
+    
+    async def aupdate_memory(self, memory_id: Any, **kwargs) -> Optional[Memory]:
+        """update_memory 的异步版本"""
+        from .aio import run_blocking
+        async with self._get_async_lock().write():
+            return await run_blocking(None, self.update_memory, memory_id, **kwargs)
+    
+    async def adelete_memory(self, memory_id: Any) -> bool:
+        """delete_memory 的异步版本"""
+        from .aio import run_blocking
+        async with self._get_async_lock().write():
+            return await run_blocking(None, self.delete_memory, memory_id)
+    
+    async def aretrieve_memory(self, query: str, limit: int = 10,
+                               filter_func: Optional[Callable[[Memory], bool]] = None,
+                               fusion: FusionMethod = "rrf",
+                               weights: Optional[Dict[str, float]] = None,
+                               timeout: Optional[float] = 2.0,
+                               return_scores: bool = False,
+                               memory_filter: Optional["MemoryFilter"] = None):
+        """
+        retrieve_memory 的异步版本
+        
+        各检索来源在线程池中并发执行，事件循环只等待结果；
+        同时进行的检索数不超过 max_concurrency。参数与返回值同 retrieve_memory。
+        """
+        import asyncio
+        from .aio import run_blocking
+        async_lock = self._get_async_lock()
+        async with self._async_slots.get(), async_lock.read():
+            sources = await run_blocking(None, self._retrieval_sources, memory_filter)
+            candidates = limit * self._CANDIDATE_FACTOR
+            executor = self._get_executor()
+            tasks = {
+                asyncio.ensure_future(run_blocking(executor, search, query, candidates)): name
+                for name, search in sources.items()
+            }
+            done, not_done = await asyncio.wait(tasks, timeout=timeout)
+            for task in not_done:
+                task.cancel()
+            
+            source_results: Dict[str, List[Tuple[str, float]]] = {}
+            for task in done:
+                error = task.exception()
+                if error is None:
+                    source_results[tasks[task]] = task.result()
+                else:
+                    logger.warning("检索来源 %s 出错，已忽略该来源", tasks[task], exc_info=error)
+            return self._collect_results(sources, source_results, limit, filter_func,
+                                         fusion, weights, return_scores)
+    
+    def close(self) -> None:
+        """释放检索线程池、将向量落盘并关闭记忆存储"""
+        # 外部传入的线程池由调用方关闭，保留引用，关闭后再检索不会悄悄创建私有线程池
+        if self._executor is not None and self._owns_executor:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+        flush = getattr(self._loaded_vector_store(), "flush", None)
+        if flush is not None:
+            flush()
+        self.memory_manager.close() 
\ No newline at end of file
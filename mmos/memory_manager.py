@@ -1,26 +1,330 @@
-import json
 import os
-from typing import List, Dict, Any, Optional, Union, Callable
+import threading
+from contextlib import contextmanager
+from typing import List, Dict, Any, Optional, Union, Callable, Iterable, Iterator, TYPE_CHECKING
 import time
 
-from .models import Memory
-from pydantic import BaseModel
+from .index import InvertedIndex, TagIndex
+from .models import Memory, MemoryId, LazyMemories, RECORD_FIELDS
+from .storage import MemoryLog, SnapshotFormat, check_snapshot_options, iter_snapshot, write_snapshot
+
+if TYPE_CHECKING:
+    from .filters import MemoryFilter
+    from .table import MemoryTable
+
+_ID_TYPES = ("uuid", "int")
+_LOAD_CHUNK = 1000  # 加载时每次持锁写入的记录数，两批之间读取可以插入
 
 
 class MemoryManager:
     """记忆管理器类，用于管理AI系统的记忆"""
     
-    def __init__(self, storage_path: Optional[str] = None):
+    def __init__(self, storage_path: Optional[str] = None,
+                 compact_threshold: int = 1000,
+                 background_compaction: bool = False,
+                 id_type: str = "uuid",
+                 snapshot_format: SnapshotFormat = "json",
+                 snapshot_compression: Optional[str] = None,
+                 background_load: bool = False,
+                 lazy_load: bool = False):
         """
         初始化记忆管理器
         
         参数:
             storage_path: 记忆存储路径，如果为None则仅在内存中存储
+            compact_threshold: 追加日志累计多少条记录后压缩为快照
+            background_compaction: 是否在后台线程中执行压缩
+            id_type: 新记忆的ID类型，"uuid" 为UUID字符串，
+                "int" 为自增整数（占用更少内存，只在本管理器内唯一）
+            snapshot_format: 快照格式，"json" 或 "binary"（紧凑的二进制格式，读写更快）
+            snapshot_compression: 二进制快照的压缩方式，None、"zlib" 或 "zstd"
+            background_load: 是否在后台线程中加载已有记忆；加载期间读取操作
+                只能看到已加载的部分，写入操作会等待加载完成
+            lazy_load: 是否延迟构建记忆对象；加载时只保存原始记录并建立索引，
+                第一次读取某条记忆时才构建 Memory
+        
+        变更会以单条记录追加到 storage_path + ".log"，storage_path 本身保存
+        最近一次压缩得到的完整快照，启动时依次回放快照和日志。加载时自动识别
+        快照格式，因此切换 snapshot_format 后，旧快照会在下次压缩时转换为新格式。
         """
-        self.memories: Dict[str, Memory] = {}
+        if id_type not in _ID_TYPES:
+            raise ValueError(f"不支持的ID类型: {id_type}")
+        check_snapshot_options(snapshot_format, snapshot_compression)
+        from .table import MemoryTable
+        
+        self.memories: Dict[MemoryId, Memory] = {}
         self.storage_path = storage_path
-        if storage_path and os.path.exists(storage_path):
+        self.compact_threshold = compact_threshold
+        self.background_compaction = background_compaction
+        self.id_type = id_type
+        self.snapshot_format = snapshot_format
+        self.snapshot_compression = snapshot_compression
+        self.lazy_load = lazy_load
+        self._next_id = 0
+        self._lock = threading.RLock()
+        self._compaction_thread: Optional[threading.Thread] = None
+        self._load_thread: Optional[threading.Thread] = None
+        self._loaded = threading.Event()
+        self._loaded.set()
+        self._log = MemoryLog(storage_path + ".log") if storage_path else None
+        # 批量写入状态
+        self._batch_depth = 0
+        self._batch_records: List[Dict[str, Any]] = []
+        self._batch_added: List[str] = []
+        self._batch_journal: Dict[str, tuple] = {}
+        self._batch_order: Optional[Dict[str, Memory]] = None
+        self._batch_events: List[tuple] = []
+        # 变更监听器，见 add_listener
+        self._listeners: List[Callable[[str, Optional[MemoryId], Optional[Memory]], None]] = []
+        # 写入前检查，见 add_store_guard
+        self._store_guards: List[Callable[[], None]] = []
+        # 内容倒排索引、标签索引，以及数值属性的列式表（同时记录插入顺序）
+        self._text_index = InvertedIndex()
+        self._tag_index = TagIndex()
+        self._table = MemoryTable()
+        if storage_path and (os.path.exists(storage_path) or self._log.exists()):
+            if background_load:
+                self._loaded.clear()
+                self._load_thread = threading.Thread(
+                    target=self._background_load, name="mmos-load", daemon=True
+                )
+                self._load_thread.start()
+            else:
+                self.load_from_storage()
+    
+    def _background_load(self) -> None:
+        try:
             self.load_from_storage()
+        finally:
+            self._loaded.set()
+    
+    @property
+    def is_loaded(self) -> bool:
+        """已有记忆是否已经全部加载"""
+        return self._loaded.is_set()
+    
+    def wait_until_loaded(self, timeout: Optional[float] = None) -> bool:
+        """
+        等待后台加载完成
+        
+        参数:
+            timeout: 最长等待秒数，None表示一直等待
+            
+        返回:
+            是否已加载完成
+        """
+        return self._loaded.wait(timeout)
+    
+    def _new_memories(self) -> Dict[MemoryId, Memory]:
+        """空的记忆字典，延迟构建时记忆对象在首次读取时才加入属性表"""
+        return LazyMemories(self._table.put) if self.lazy_load else {}
+    
+    def _raw_memories(self) -> Iterable[Union[Memory, tuple]]:
+        """不触发构建的全部记忆，尚未构建的是原始记录元组"""
+        memories = self.memories
+        if isinstance(memories, LazyMemories):
+            return memories.raw_values()
+        return memories.values()
+    
+    def _raw_memory(self, memory_id: MemoryId) -> Union[Memory, tuple, None]:
+        """不触发构建地读取单条记忆，尚未构建的是原始记录元组，不存在时返回None"""
+        return dict.get(self.memories, memory_id)
+    
+    def _persist(self, record: Dict[str, Any]) -> None:
+        """追加一条变更记录，达到阈值时触发压缩"""
+        if self._batch_depth:
+            self._batch_records.append(record)
+            return
+        if not self._log:
+            return
+        with self._lock:
+            self._log.append(record)
+            if self._log.count >= self.compact_threshold:
+                self.compact()
+    
+    def add_listener(self, listener: Callable[[str, Optional[MemoryId], Optional[Memory]], None]) -> None:
+        """
+        注册变更监听器，供外部索引与记忆保持一致
+        
+        已有记忆的内容被修改或记忆被删除、清空后，以 listener(op, memory_id, memory)
+        调用：op 为 "update"（memory 为更新后的记忆）、"delete"（memory 为None）
+        或 "clear"（memory_id 与 memory 均为None）。新增记忆不通知。
+        批量写入期间的变更在块成功结束时按发生顺序通知，回滚的变更不通知。
+        监听器在持有管理器锁时调用。
+        
+        参数:
+            listener: 监听函数
+        """
+        self._listeners.append(listener)
+    
+    def add_store_guard(self, guard: Callable[[], None]) -> None:
+        """
+        注册写入前检查，用于配额等限制
+        
+        每次存储新记忆之前，在持有管理器锁时以 guard() 调用，此时新记忆尚未写入；
+        抛出异常即拒绝本次写入，批量写入中的拒绝会使整个块回滚。
+        检查与写入在同一把锁内完成，并发写入不会越过检查。
+        
+        参数:
+            guard: 检查函数
+        """
+        self._store_guards.append(guard)
+    
+    def _notify(self, op: str, memory_id: Optional[MemoryId] = None,
+                memory: Optional[Memory] = None) -> None:
+        """通知变更监听器，批量写入期间推迟到块结束"""
+        if self._batch_depth:
+            self._batch_events.append((op, memory_id, memory))
+            return
+        for listener in self._listeners:
+            listener(op, memory_id, memory)
+    
+    def _index_memory(self, memory: Memory) -> None:
+        """新增或刷新一条记忆的索引"""
+        self._table.put(memory)
+        self._text_index.add(memory.id, memory.content)
+        self._tag_index.add(memory.id, memory.tags)
+    
+    def _index_record(self, record: tuple) -> None:
+        """为尚未构建为对象的原始记录元组建立索引"""
+        self._table.put_record(record)
+        self._text_index.add(record[0], record[1])
+        self._tag_index.add(record[0], record[2])
+    
+    def _unindex_memory(self, memory_id: str) -> None:
+        """移除一条记忆的索引"""
+        self._table.remove(memory_id)
+        self._text_index.remove(memory_id)
+        self._tag_index.remove(memory_id)
+    
+    def _rebuild_indexes(self) -> None:
+        """按当前记忆重建全部索引"""
+        self._text_index.clear()
+        self._tag_index.clear()
+        self._table.clear()
+        for memory in self._raw_memories():
+            if type(memory) is tuple:
+                self._index_record(memory)
+            else:
+                self._index_memory(memory)
+        self._update_next_id()
+    
+    def _update_next_id(self) -> None:
+        """整数ID从已有的最大ID之后继续分配"""
+        if self.id_type == "int":
+            self._next_id = max([self._next_id] + [mid + 1 for mid in self.memories
+                                                   if isinstance(mid, int)])
+    
+    def _journal(self, memory: Memory) -> None:
+        """批量写入期间，记录记忆第一次被修改前的状态以便回滚"""
+        if self._batch_depth and memory.id not in self._batch_journal:
+            self._batch_journal[memory.id] = (memory, memory.to_dict())
+    
+    def _journal_order(self) -> None:
+        """批量写入期间，删除或清空前保存记忆字典的顺序"""
+        if self._batch_depth and self._batch_order is None:
+            self._batch_order = self.memories.copy()
+    
+    @contextmanager
+    def batch(self) -> Iterator["MemoryManager"]:
+        """
+        批量写入上下文
+        
+        块内的变更立即对读取可见，但持久化推迟到块结束时一次完成；
+        块内抛出异常时，内存中的变更全部回滚，不写入任何记录。支持嵌套，
+        以最外层为准。后台加载尚未完成时先等待加载完成。
+        
+        用法:
+            with manager.batch():
+                manager.store("...")
+                manager.update(memory_id, importance=0.9)
+        """
+        self._loaded.wait()
+        with self._lock:
+            self._batch_depth += 1
+            try:
+                yield self
+            except BaseException:
+                self._batch_depth -= 1
+                if not self._batch_depth:
+                    self._rollback_batch()
+                raise
+            self._batch_depth -= 1
+            if not self._batch_depth:
+                self._commit_batch()
+    
+    def _reset_batch(self) -> None:
+        self._batch_records = []
+        self._batch_added = []
+        self._batch_journal = {}
+        self._batch_order = None
+        self._batch_events = []
+    
+    def _rollback_batch(self) -> None:
+        """撤销批量写入期间的内存变更"""
+        if self._batch_order is not None:
+            self.memories = self._batch_order
+        for memory_id in self._batch_added:
+            self.memories.pop(memory_id, None)
+            self._unindex_memory(memory_id)
+        for memory, data in self._batch_journal.values():
+            memory.content = data["content"]
+            memory.tags = data["tags"]
+            memory.metadata = data["metadata"]
+            memory.importance = data["importance"]
+            memory.last_accessed = data["last_accessed"]
+            memory.access_count = data["access_count"]
+            if memory.id in self.memories:
+                self._index_memory(memory)
+        if self._batch_order is not None:
+            self._rebuild_indexes()
+        self._reset_batch()
+    
+    def _commit_batch(self) -> None:
+        """一次性持久化批量写入期间的变更"""
+        records = self._batch_records
+        events = self._batch_events
+        self._reset_batch()
+        if self._log and records:
+            if self._log.count + len(records) >= self.compact_threshold:
+                # 变更量足够大时直接写快照，省去先追加再压缩
+                self.compact()
+            else:
+                self._log.append_many(records)
+        for event in events:
+            for listener in self._listeners:
+                listener(*event)
+    
+    def compact(self) -> None:
+        """将当前记忆写为快照并清空日志"""
+        if not self._log:
+            return
+        self._loaded.wait()
+        if not self.background_compaction:
+            self.save_to_storage()
+            return
+        with self._lock:
+            if self._compaction_thread and self._compaction_thread.is_alive():
+                return
+            data = self._snapshot_data()
+            self._log.rotate()
+            self._compaction_thread = threading.Thread(
+                target=self._write_snapshot, args=(data,), daemon=True
+            )
+            self._compaction_thread.start()
+    
+    def wait_for_compaction(self) -> None:
+        """等待后台压缩完成"""
+        thread = self._compaction_thread
+        if thread:
+            thread.join()
+    
+    def close(self) -> None:
+        """等待后台加载与压缩，并关闭日志文件"""
+        self.wait_until_loaded()
+        self.wait_for_compaction()
+        if self._log:
+            self._log.close()
     
     def store(self, content: str, tags: Optional[List[str]] = None, 
               metadata: Optional[Dict[str, Any]] = None, 
@@ -37,16 +341,57 @@ class MemoryManager:
         返回:
             存储的记忆对象
         """
-        memory = Memory(content=content, tags=tags, metadata=metadata, importance=importance)
-        self.memories[memory.id] = memory
-        
-        if self.storage_path:
-            self.save_to_storage()
+        self._loaded.wait()
+        with self._lock:
+            for guard in self._store_guards:
+                guard()
+            memory = Memory(content=content, tags=tags, metadata=metadata,
+                            importance=importance, memory_id=self._new_id())
+            self.memories[memory.id] = memory
+            self._index_memory(memory)
+            if self._batch_depth:
+                self._batch_added.append(memory.id)
+            self._persist({"op": "put", "memory": memory.to_dict()})
             
         return memory
     
+    def store_many(self, items: Iterable[Union[str, Dict[str, Any]]]) -> List[Memory]:
+        """
+        批量存储记忆，只在结束时持久化一次
+        
+        参数:
+            items: 记忆内容字符串，或包含 store 参数的字典
+            
+        返回:
+            存储的记忆对象列表
+        """
+        with self.batch():
+            return [
+                self.store(item) if isinstance(item, str) else self.store(**item)
+                for item in items
+            ]
+    
+    def _new_id(self) -> Optional[MemoryId]:
+        """分配新记忆的ID，UUID由 Memory 自行生成"""
+        if self.id_type != "int":
+            return None
+        memory_id = self._next_id
+        self._next_id += 1
+        return memory_id
+    
+    @property
+    def table(self) -> "MemoryTable":
+        """记忆数值属性的列式表，可用于向量化的统计与打分"""
+        return self._table
+    
+    def _in_insertion_order(self, memory_ids: Iterable[MemoryId]) -> List[Memory]:
+        """将记忆ID集合按插入顺序转换为记忆对象列表"""
+        return [self.memories[mid] for mid in self._table.in_order(memory_ids)]
+    
     def retrieve(self, query: str, limit: int = 10, 
-                 filter_func: Optional[Callable[[Memory], bool]] = None) -> List[Memory]:
+                 filter_func: Optional[Callable[[Memory], bool]] = None,
+                 exact: bool = True,
+                 memory_filter: Optional["MemoryFilter"] = None) -> List[Memory]:
         """
         检索记忆
         
@@ -54,131 +399,294 @@ class MemoryManager:
             query: 查询字符串
             limit: 返回结果数量限制
             filter_func: 过滤函数
+            exact: 为True时要求内容包含完整的查询子串（不区分大小写）；
+                为False时只要求内容包含查询的全部词元
+            memory_filter: 结构化过滤条件
             
         返回:
             匹配的记忆列表
         """
-        # 这里实现的是一个简单的关键词匹配
-        # 真实应用中可能需要使用向量数据库或更复杂的语义搜索
-        results = []
+        with self._lock:
+            # 先通过倒排索引求候选集合，再按插入顺序校验
+            # 查询中没有可用词元时（如不足三个字符的英文单词）退回全量扫描
+            candidates = self._text_index.search(query, exact=exact)
+            if candidates is None:
+                memories: Iterable[Memory] = self.memories.values()
+                verify = True
+            else:
+                memories = self._in_insertion_order(candidates)
+                verify = exact
+        
+            query_lower = query.lower()
+            results = []
         
-        for memory in self.memories.values():
-            if filter_func and not filter_func(memory):
-                continue
+            for memory in memories:
+                if filter_func and not filter_func(memory):
+                    continue
+                if memory_filter and not memory_filter.matches(memory):
+                    continue
                 
-            if query.lower() in memory.content.lower():
-                memory.access()
-                results.append(memory)
+                if not verify or query_lower in memory.content.lower():
+                    memory.access()
+                    results.append(memory)
             
-            if len(results) >= limit:
-                break
+                if len(results) >= limit:
+                    break
                 
-        return results
+            return results
     
     def get_by_id(self, memory_id: str) -> Optional[Memory]:
         """根据ID获取记忆"""
-        memory = self.memories.get(memory_id)
-        if memory:
-            memory.access()
-        return memory
+        with self._lock:
+            memory = self.memories.get(memory_id)
+            if memory:
+                memory.access()
+            return memory
+    
+    def filter_ids(self, memory_filter: "MemoryFilter") -> List[str]:
+        """
+        满足结构化过滤条件的记忆ID
+        
+        有标签条件时先用标签索引缩小候选，再逐条校验其余条件；
+        只有时间与重要性条件时直接在列式表上向量化比较。
+        
+        参数:
+            memory_filter: 过滤条件
+            
+        返回:
+            按插入顺序排列的记忆ID列表
+        """
+        with self._lock:
+            if memory_filter.tags:
+                candidates = self._tag_index.match_all(memory_filter.tags)
+                if memory_filter.any_tags:
+                    candidates &= self._tag_index.match_any(memory_filter.any_tags)
+                memories: Iterable[Memory] = self._in_insertion_order(candidates)
+            elif memory_filter.any_tags:
+                memories = self._in_insertion_order(self._tag_index.match_any(memory_filter.any_tags))
+            elif not memory_filter.metadata:
+                return self._table.ids(self._table.select(memory_filter))
+            else:
+                memories = self.memories.values()
+            return [memory.id for memory in memories if memory_filter.matches(memory)]
+    
+    def get_by_filter(self, memory_filter: "MemoryFilter") -> List[Memory]:
+        """根据结构化过滤条件获取记忆"""
+        with self._lock:
+            results = [self.memories[memory_id] for memory_id in self.filter_ids(memory_filter)]
+            for memory in results:
+                memory.access()
+            return results
     
     def get_by_tags(self, tags: List[str], match_all: bool = False) -> List[Memory]:
         """根据标签获取记忆"""
-        results = []
-        
-        for memory in self.memories.values():
+        with self._lock:
             if match_all:
                 # 所有标签都必须匹配
-                if all(tag in memory.tags for tag in tags):
-                    memory.access()
-                    results.append(memory)
+                memory_ids = self._tag_index.match_all(tags)
             else:
                 # 匹配任意标签
-                if any(tag in memory.tags for tag in tags):
-                    memory.access()
-                    results.append(memory)
+                memory_ids = self._tag_index.match_any(tags)
+        
+            results = self._in_insertion_order(memory_ids)
+            for memory in results:
+                memory.access()
                     
-        return results
+            return results
+    
+    def tag_count(self, tag: str) -> int:
+        """获取带有指定标签的记忆数量"""
+        with self._lock:
+            return self._tag_index.count(tag)
+    
+    def tag_counts(self) -> Dict[str, int]:
+        """获取所有标签及其记忆数量"""
+        with self._lock:
+            return self._tag_index.counts()
     
     def update(self, memory_id: str, content: Optional[str] = None, 
                tags: Optional[List[str]] = None, metadata: Optional[Dict[str, Any]] = None,
                importance: Optional[float] = None) -> Optional[Memory]:
         """更新记忆"""
-        memory = self.memories.get(memory_id)
-        if not memory:
-            return None
-            
-        if content is not None:
-            memory.content = content
-            
-        if tags is not None:
-            memory.tags = tags
-            
-        if metadata is not None:
-            memory.metadata = metadata
+        self._loaded.wait()
+        with self._lock:
+            memory = self.memories.get(memory_id)
+            if not memory:
+                return None
+            self._journal(memory)
+                
+            if content is not None:
+                memory.content = content
+                
+            if tags is not None:
+                memory.tags = tags
+                
+            if metadata is not None:
+                memory.metadata = metadata
+                
+            if importance is not None:
+                memory.update_importance(importance)
             
-        if importance is not None:
-            memory.update_importance(importance)
+            if content is not None or tags is not None:
+                self._index_memory(memory)
+                
+            memory.access()
+            self._persist({"op": "put", "memory": memory.to_dict()})
+            if content is not None:
+                self._notify("update", memory_id, memory)
             
-        memory.access()
+        return memory
+    
+    def forget(self, threshold: float, half_life: float = 7 * 24 * 3600,
+               now: Optional[float] = None) -> List[MemoryId]:
+        """
+        遗忘保留分数低于阈值的记忆
         
-        if self.storage_path:
-            self.save_to_storage()
+        保留分数为重要性按距最近访问的时间指数衰减后的值，
+        在列式表上一次性计算，删除在一个批量写入中完成。
+        
+        参数:
+            threshold: 保留分数阈值
+            half_life: 衰减半衰期（秒），默认7天
+            now: 当前时间戳，默认为 time.time()
             
-        return memory
+        返回:
+            被删除的记忆ID列表（按插入顺序）
+        """
+        self._loaded.wait()
+        with self._lock:
+            table = self._table
+            scores = table.retention_scores(half_life, time.time() if now is None else now)
+            forgotten = table.ids((scores < threshold).nonzero()[0])
+            with self.batch():
+                for memory_id in forgotten:
+                    self.delete(memory_id)
+        return forgotten
     
-    def delete(self, memory_id: str) -> bool:
+    def delete(self, memory_id: MemoryId) -> bool:
         """删除记忆"""
-        if memory_id in self.memories:
-            del self.memories[memory_id]
-            
-            if self.storage_path:
-                self.save_to_storage()
-                
-            return True
+        self._loaded.wait()
+        with self._lock:
+            if memory_id in self.memories:
+                self._journal_order()
+                del self.memories[memory_id]
+                self._unindex_memory(memory_id)
+                self._persist({"op": "delete", "id": memory_id})
+                self._notify("delete", memory_id)
+                return True
         return False
     
+    def _snapshot_data(self) -> List[Dict[str, Any]]:
+        """生成快照内容，尚未构建为对象的记忆直接使用原始记录"""
+        return [dict(zip(RECORD_FIELDS, memory)) if type(memory) is tuple else memory.to_dict()
+                for memory in self._raw_memories()]
+    
+    def _write_snapshot(self, data: List[Dict[str, Any]]) -> None:
+        """原子地写入快照文件，完成后删除已压缩的日志"""
+        write_snapshot(self.storage_path, data, self.snapshot_format, self.snapshot_compression)
+        self._log.discard_rotated()
+    
     def save_to_storage(self) -> None:
-        """保存记忆到存储"""
+        """保存记忆到存储（写入完整快照并清空日志）"""
         if not self.storage_path:
             return
-            
-        data = {
-            "memories": {mid: memory.to_dict() for mid, memory in self.memories.items()},
-            "last_saved": time.time()
-        }
         
-        with open(self.storage_path, 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
+        self._loaded.wait()
+        self.wait_for_compaction()
+        with self._lock:
+            data = self._snapshot_data()
+            self._log.rotate()
+            self._write_snapshot(data)
     
     def load_from_storage(self) -> None:
-        """从存储加载记忆"""
-        if not self.storage_path or not os.path.exists(self.storage_path):
+        """
+        从存储加载记忆（快照 + 追加日志）
+        
+        快照边读边解析，每解析出一批记录就写入并建立索引，不会把整个文件
+        读入内存；后台加载时已写入的部分立即可以检索。加载出错时恢复为
+        加载前的记忆（启动时即为空），已加载的部分全部丢弃。
+        """
+        if not self.storage_path:
+            return
+        if not os.path.exists(self.storage_path) and not self._log.exists():
             return
             
+        previous = self.memories
         try:
-            with open(self.storage_path, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-                
-            if "memories" in data:
-                self.memories = {
-                    mid: Memory.from_dict(mdata) 
-                    for mid, mdata in data["memories"].items()
-                }
-        except (json.JSONDecodeError, KeyError) as e:
+            with self._lock:
+                self.memories = self._new_memories()
+                self._rebuild_indexes()
+            if os.path.exists(self.storage_path):
+                chunk: List[Dict[str, Any]] = []
+                for data in iter_snapshot(self.storage_path):
+                    chunk.append(data)
+                    if len(chunk) >= _LOAD_CHUNK:
+                        self._add_loaded(chunk)
+                        chunk = []
+                self._add_loaded(chunk)
+            
+            with self._lock:
+                if self._log.exists():
+                    for record in self._log.replay():
+                        self._replay_record(record)
+                self._update_next_id()
+        except (ValueError, KeyError) as e:
             print(f"加载记忆时出错: {e}")
+            with self._lock:
+                self.memories = previous
+                self._rebuild_indexes()
+    
+    def _add_loaded(self, records: List[Dict[str, Any]]) -> None:
+        """写入一批从快照读出的记录"""
+        with self._lock:
+            # 以记录中的ID为键：JSON 对象的键总是字符串，整数ID需要还原
+            memories = self.memories
+            for data in records:
+                if self.lazy_load and len(data) == len(RECORD_FIELDS):
+                    try:
+                        record = tuple(data[field] for field in RECORD_FIELDS)
+                    except KeyError:
+                        pass
+                    else:
+                        memories[record[0]] = record
+                        self._index_record(record)
+                        continue
+                memory = Memory.from_dict(data)
+                memories[memory.id] = memory
+                self._index_memory(memory)
+    
+    def _replay_record(self, record: Dict[str, Any]) -> None:
+        """回放一条日志记录并维护索引"""
+        op = record.get("op")
+        if op == "put":
+            memory = Memory.from_dict(record["memory"])
+            self.memories[memory.id] = memory
+            self._index_memory(memory)
+        elif op == "delete":
+            if record["id"] in self.memories:
+                del self.memories[record["id"]]
+                self._unindex_memory(record["id"])
+        elif op == "clear":
+            self.memories = self._new_memories()
+            self._rebuild_indexes()
     
     def clear(self) -> None:
         """清空所有记忆"""
-        self.memories = {}
-        
-        if self.storage_path and os.path.exists(self.storage_path):
-            self.save_to_storage()
+        self._loaded.wait()
+        with self._lock:
+            self._journal_order()
+            self.memories = {}
+            self._rebuild_indexes()
+            
+            if self.storage_path and (os.path.exists(self.storage_path) or self._log.exists()):
+                self._persist({"op": "clear"})
+            self._notify("clear")
     
     def get_all(self) -> List[Memory]:
         """获取所有记忆"""
-        return list(self.memories.values())
+        with self._lock:
+            return list(self.memories.values())
     
     def count(self) -> int:
-        """获取记忆数量"""
+        """获取记忆数量（后台加载期间为已加载的数量）"""
         return len(self.memories) 
\ No newline at end of file
@@ -2,13 +2,40 @@
 记忆数据模型
 """
 
+import sys
 import time
-from typing import List, Dict, Any, Optional
+from collections import namedtuple
+from typing import List, Dict, Any, Optional, Union, Iterable, Iterator, Callable, Tuple, TYPE_CHECKING
 import uuid
 
+if TYPE_CHECKING:
+    from .table import MemoryTable
+
+# 记忆ID：默认是UUID字符串，MemoryManager(id_type="int") 时是自增整数
+MemoryId = Union[str, int]
+
+# 原始记录元组的字段顺序，与 to_dict() 的键一致
+RECORD_FIELDS = ("id", "content", "tags", "metadata", "importance",
+                 "created_at", "last_accessed", "access_count")
+
+# 原始记录的只读视图，属性名与 Memory 相同，建立检索索引时不必为每条记录构建 Memory
+MemoryRecord = namedtuple("MemoryRecord", RECORD_FIELDS)
+
+
+def intern_tags(tags: Iterable[Any]) -> List[Any]:
+    """驻留标签字符串，相同的标签在所有记忆间共用同一个对象"""
+    return [sys.intern(tag) if type(tag) is str else tag for tag in tags]
+
 
 class Memory:
-    """记忆对象类"""
+    """记忆对象类
+    
+    使用 __slots__ 而不是实例字典，标签字符串经过驻留，
+    大量记忆常驻内存时可以显著减少占用。
+    """
+    
+    __slots__ = ("id", "content", "_tags", "metadata", "importance",
+                 "created_at", "last_accessed", "access_count", "_table")
     
     def __init__(
         self, 
@@ -16,6 +43,7 @@ class Memory:
         tags: Optional[List[str]] = None,
         metadata: Optional[Dict[str, Any]] = None,
         importance: float = 0.5,
+        memory_id: Optional[MemoryId] = None,
     ):
         """
         初始化一个新的记忆对象
@@ -25,8 +53,9 @@ class Memory:
             tags: 记忆标签列表
             metadata: 附加元数据
             importance: 记忆重要性 (0.0-1.0)
+            memory_id: 记忆ID，为None时生成UUID字符串
         """
-        self.id = str(uuid.uuid4())
+        self.id = str(uuid.uuid4()) if memory_id is None else memory_id
         self.content = content
         self.tags = tags or []
         self.metadata = metadata or {}
@@ -34,15 +63,29 @@ class Memory:
         self.created_at = time.time()
         self.last_accessed = self.created_at
         self.access_count = 0
+        self._table: Optional["MemoryTable"] = None  # 所属管理器的列式属性表
+    
+    @property
+    def tags(self) -> List[str]:
+        """记忆标签列表"""
+        return self._tags
+    
+    @tags.setter
+    def tags(self, tags: Iterable[str]) -> None:
+        self._tags = intern_tags(tags)
         
     def access(self) -> None:
         """更新记忆访问信息"""
         self.last_accessed = time.time()
         self.access_count += 1
+        if self._table is not None:
+            self._table.refresh(self)
         
     def update_importance(self, new_importance: float) -> None:
         """更新记忆重要性"""
         self.importance = max(0.0, min(1.0, new_importance))
+        if self._table is not None:
+            self._table.refresh(self)
         
     def to_dict(self) -> Dict[str, Any]:
         """将记忆转换为字典表示"""
@@ -64,13 +107,98 @@ class Memory:
             content=data["content"],
             tags=data.get("tags", []),
             metadata=data.get("metadata", {}),
-            importance=data.get("importance", 0.5)
+            importance=data.get("importance", 0.5),
+            memory_id=data.get("id")
         )
-        memory.id = data.get("id", memory.id)
         memory.created_at = data.get("created_at", memory.created_at)
         memory.last_accessed = data.get("last_accessed", memory.last_accessed)
         memory.access_count = data.get("access_count", memory.access_count)
         return memory
     
+    @classmethod
+    def from_record(cls, record: Tuple[Any, ...]) -> "Memory":
+        """从按 RECORD_FIELDS 排列的原始记录元组创建记忆对象"""
+        memory = cls.__new__(cls)
+        (memory.id, memory.content, memory.tags, memory.metadata, memory.importance,
+         memory.created_at, memory.last_accessed, memory.access_count) = record
+        memory._table = None
+        return memory
+    
+    def __getstate__(self) -> Dict[str, Any]:
+        # 不序列化所属的属性表
+        return self.to_dict()
+    
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        self.id = state["id"]
+        self.content = state["content"]
+        self.tags = state["tags"]
+        self.metadata = state["metadata"]
+        self.importance = state["importance"]
+        self.created_at = state["created_at"]
+        self.last_accessed = state["last_accessed"]
+        self.access_count = state["access_count"]
+        self._table = None
+    
     def __repr__(self) -> str:
-        return f"Memory(id={self.id}, content={self.content[:30]}{'...' if len(self.content) > 30 else ''})" 
\ No newline at end of file
+        return f"Memory(id={self.id}, content={self.content[:30]}{'...' if len(self.content) > 30 else ''})" 
+
+
+_MISSING = object()
+
+
+class LazyMemories(dict):
+    """memory_id -> 记忆 的字典，值可以暂时是原始记录元组（按 RECORD_FIELDS 排列）
+
+    读取某条记忆时才由原始记录构建 Memory 对象并替换原值，
+    加载大量记忆时不必一开始就为每条记录构建对象。
+    """
+
+    __slots__ = ("_on_materialize",)
+
+    def __init__(self, on_materialize: Optional[Callable[[Memory], None]] = None):
+        """
+        初始化
+
+        参数:
+            on_materialize: 由原始记录构建出 Memory 后的回调
+        """
+        super().__init__()
+        self._on_materialize = on_materialize
+
+    def _materialize(self, key: MemoryId, value: Any) -> Memory:
+        if type(value) is tuple:
+            value = Memory.from_record(value)
+            dict.__setitem__(self, key, value)
+            if self._on_materialize is not None:
+                self._on_materialize(value)
+        return value
+
+    def __getitem__(self, key: MemoryId) -> Memory:
+        return self._materialize(key, dict.__getitem__(self, key))
+
+    def get(self, key: MemoryId, default: Any = None) -> Any:
+        value = dict.get(self, key, _MISSING)
+        if value is _MISSING:
+            return default
+        return self._materialize(key, value)
+
+    def pop(self, key: MemoryId, *default: Any) -> Any:
+        value = dict.pop(self, key, *default)
+        return Memory.from_record(value) if type(value) is tuple else value
+
+    def values(self) -> Iterator[Memory]:  # type: ignore[override]
+        for key, value in dict.items(self):
+            yield self._materialize(key, value)
+
+    def items(self) -> Iterator[Tuple[MemoryId, Memory]]:  # type: ignore[override]
+        for key, value in dict.items(self):
+            yield key, self._materialize(key, value)
+
+    def raw_values(self) -> Iterable[Union[Memory, Tuple[Any, ...]]]:
+        """不触发构建的值视图，未访问过的记忆是原始记录"""
+        return dict.values(self)
+
+    def copy(self) -> "LazyMemories":
+        memories = LazyMemories(self._on_materialize)
+        dict.update(memories, self)
+        return memories
@@ -0,0 +1,296 @@
+"""
+向量量化存储模块
+
+在 SimpleVectorStore 的基础上压缩向量的存储精度：
+    float32  不压缩，与 SimpleVectorStore 相同
+    float16  半精度，内存减半
+    int8     每行一个 float32 缩放系数的标量量化，约为 float32 的 1/4
+    pq       乘积量化（Product Quantization），每行只保存 m 个字节的码字
+
+搜索直接在压缩后的数据上进行，初筛出的候选可以再用全精度向量精排。
+"""
+
+from typing import List, Dict, Optional, Tuple, Callable
+
+import numpy as np
+
+from .ann import kmeans
+from .vector_store import SimpleVectorStore
+
+_PRECISIONS = ("float32", "float16", "int8", "pq")
+
+
+class ProductQuantizer:
+    """乘积量化编解码器
+
+    把 D 维向量切成 m 段子向量，每段用 ksub 个质心的码本量化为一个字节，
+    查询时先算出查询子向量与各码本质心的内积表，再查表求和得到近似内积。
+    """
+
+    def __init__(self, m: int = 8, ksub: int = 256, iterations: int = 20, seed: int = 0):
+        """
+        初始化乘积量化器
+
+        参数:
+            m: 子向量段数，需整除向量维度
+            ksub: 每段码本的质心数，不超过256
+            iterations: k-means 迭代次数
+            seed: 随机种子
+        """
+        if not 1 <= ksub <= 256:
+            raise ValueError(f"ksub 必须在 1~256 之间，实际 {ksub}")
+        self.m = m
+        self.ksub = ksub
+        self.iterations = iterations
+        self.seed = seed
+        self.codebooks: Optional[np.ndarray] = None  # (m×ksub×dsub)
+
+    @property
+    def is_trained(self) -> bool:
+        return self.codebooks is not None
+
+    def train(self, data: np.ndarray) -> None:
+        """
+        在样本上训练各段码本
+
+        参数:
+            data: (N×D) 训练数据
+        """
+        data = np.asarray(data, dtype=np.float32)
+        dimension = data.shape[1]
+        if dimension % self.m:
+            raise ValueError(f"向量维度 {dimension} 不能被子向量段数 {self.m} 整除")
+        dsub = dimension // self.m
+        ksub = min(self.ksub, data.shape[0])
+        codebooks = np.zeros((self.m, self.ksub, dsub), dtype=np.float32)
+        for j in range(self.m):
+            sub = data[:, j * dsub:(j + 1) * dsub]
+            codebooks[j, :ksub] = kmeans(sub, ksub, self.iterations, self.seed + j, spherical=False)
+        if ksub < self.ksub:
+            # 样本不足时用第一个质心填充，argmax 取首个最大值，填充项不会被选中
+            codebooks[:, ksub:] = codebooks[:, :1]
+        self.codebooks = codebooks
+
+    def encode(self, data: np.ndarray) -> np.ndarray:
+        """把 (N×D) 向量编码为 (N×m) 的 uint8 码字"""
+        dsub = self.codebooks.shape[2]
+        data = np.asarray(data, dtype=np.float32).reshape(-1, self.m * dsub)
+        codes = np.empty((data.shape[0], self.m), dtype=np.uint8)
+        for j, codebook in enumerate(self.codebooks):
+            sub = data[:, j * dsub:(j + 1) * dsub]
+            # argmin ||x - c||² 等价于 argmax (x·c - ||c||²/2)
+            half_norms = 0.5 * (codebook * codebook).sum(axis=1)
+            codes[:, j] = np.argmax(sub @ codebook.T - half_norms, axis=1)
+        return codes
+
+    def decode(self, codes: np.ndarray) -> np.ndarray:
+        """把 (N×m) 码字解码为 (N×D) 的 float32 近似向量"""
+        parts = [self.codebooks[j][codes[:, j]] for j in range(self.m)]
+        return np.concatenate(parts, axis=1)
+
+    def lookup_table(self, query_vector: np.ndarray) -> np.ndarray:
+        """查询子向量与各码本质心的内积表，形状 (m×ksub)"""
+        dsub = self.codebooks.shape[2]
+        query = np.asarray(query_vector, dtype=np.float32).reshape(self.m, dsub)
+        return np.einsum("jkd,jd->jk", self.codebooks, query)
+
+    def score(self, codes: np.ndarray, table: np.ndarray) -> np.ndarray:
+        """查表求和，得到每行码字与查询的近似内积"""
+        return table[np.arange(self.m), codes].sum(axis=1)
+
+
+class QuantizedVectorStore(SimpleVectorStore):
+    """压缩存储精度的向量存储
+
+    接口与 SimpleVectorStore 相同。有损精度下初筛会多保留 rerank_factor 倍的候选，
+    提供 rerank_vectors 时用它返回的全精度向量精排，否则用解码后的向量精排。
+    pq 精度在向量数达到 pq_train_threshold 之前按 float32 保存，达到后训练码本并
+    一次性编码全部已有向量。
+    """
+
+    # 分块解码的行数，控制打分时的临时内存
+    _CHUNK_ROWS = 8192
+
+    def __init__(self,
+                 embedding_function: Optional[Callable[[str], np.ndarray]] = None,
+                 dimension: int = 384,
+                 batch_embedding_function: Optional[Callable[[List[str]], np.ndarray]] = None,
+                 precision: str = "float16",
+                 pq_m: int = 8,
+                 pq_ksub: int = 256,
+                 pq_train_threshold: Optional[int] = None,
+                 rerank_factor: int = 4,
+                 rerank_vectors: Optional[Callable[[List[str]], np.ndarray]] = None):
+        """
+        初始化量化向量存储
+
+        参数:
+            embedding_function: 同 SimpleVectorStore
+            dimension: 同 SimpleVectorStore
+            batch_embedding_function: 同 SimpleVectorStore
+            precision: 存储精度，"float32"、"float16"、"int8" 或 "pq"
+            pq_m: 乘积量化的子向量段数，需整除向量维度
+            pq_ksub: 乘积量化每段的质心数
+            pq_train_threshold: 训练码本所需的向量数，默认 pq_ksub * 16
+            rerank_factor: 有损精度下初筛保留 top_k 的多少倍候选
+            rerank_vectors: 按 memory_id 列表返回 (N×D) 全精度向量的函数，用于精排
+        """
+        if precision not in _PRECISIONS:
+            raise ValueError(f"不支持的存储精度: {precision}")
+        super().__init__(embedding_function, dimension, batch_embedding_function)
+        self.precision = precision
+        self.rerank_factor = rerank_factor
+        self.rerank_vectors = rerank_vectors
+        self.pq_train_threshold = pq_train_threshold or pq_ksub * 16
+        self._pq_m = pq_m
+        self._pq_ksub = pq_ksub
+        self._codec: Optional[ProductQuantizer] = None
+        self._scales = np.zeros(0, dtype=np.float32)  # int8 每行的缩放系数
+
+    @property
+    def is_lossy(self) -> bool:
+        """当前存储是否有精度损失（pq 训练前仍为 float32）"""
+        if self.precision == "pq":
+            return self._codec is not None
+        return self.precision != "float32"
+
+    @property
+    def nbytes(self) -> int:
+        return super().nbytes + self._scales.nbytes
+
+    @property
+    def vectors(self) -> Dict[str, np.ndarray]:
+        """memory_id -> 解码后的向量（按插入顺序）"""
+        with self._lock:
+            rows = np.fromiter(self._id_to_row.values(), dtype=np.int64, count=len(self._id_to_row))
+            decoded = self._decode(rows)
+            return dict(zip(self._id_to_row, decoded))
+
+    def _allocate(self, capacity: int, dimension: int) -> None:
+        self._dim = dimension
+        if self.precision == "float16":
+            self._matrix = np.zeros((capacity, dimension), dtype=np.float16)
+        elif self.precision == "int8":
+            self._matrix = np.zeros((capacity, dimension), dtype=np.int8)
+            self._scales = np.zeros(capacity, dtype=np.float32)
+        elif self._codec is not None:
+            self._matrix = np.zeros((capacity, self._codec.m), dtype=np.uint8)
+        else:
+            if self.precision == "pq" and dimension % self._pq_m:
+                raise ValueError(f"向量维度 {dimension} 不能被子向量段数 {self._pq_m} 整除")
+            self._matrix = np.zeros((capacity, dimension), dtype=np.float32)
+        self._alive = np.zeros(capacity, dtype=bool)
+
+    def _resize(self, capacity: int) -> None:
+        super()._resize(capacity)
+        if self.precision == "int8":
+            scales = np.zeros(capacity, dtype=np.float32)
+            scales[:self._size] = self._scales[:self._size]
+            self._scales = scales
+
+    def _compact(self) -> None:
+        if self.precision == "int8":
+            keep = np.flatnonzero(self._alive[:self._size])
+            self._scales[:keep.shape[0]] = self._scales[keep]
+        super()._compact()
+
+    def _write_row(self, row: int, vector: np.ndarray) -> None:
+        if self.precision == "int8":
+            peak = float(np.abs(vector).max())
+            scale = peak / 127.0 if peak > 0 else 1.0
+            self._matrix[row] = np.clip(np.round(vector / scale), -127, 127)
+            self._scales[row] = scale
+        elif self._codec is not None:
+            self._matrix[row] = self._codec.encode(vector)[0]
+        else:
+            self._matrix[row] = vector
+
+    def _set_vector(self, memory_id: str, vector: np.ndarray) -> None:
+        super()._set_vector(memory_id, vector)
+        if self.precision == "pq" and self._codec is None and len(self) >= self.pq_train_threshold:
+            self.train()
+
+    def train(self) -> None:
+        """训练乘积量化码本并把已有的 float32 向量编码为码字"""
+        with self._lock:
+            if self.precision != "pq" or self._matrix is None:
+                return
+            codec = ProductQuantizer(self._pq_m, self._pq_ksub)
+            alive = np.flatnonzero(self._alive[:self._size])
+            codec.train(self._matrix[alive])
+            codes = np.zeros((self._matrix.shape[0], codec.m), dtype=np.uint8)
+            for start in range(0, self._size, self._CHUNK_ROWS):
+                stop = min(start + self._CHUNK_ROWS, self._size)
+                codes[start:stop] = codec.encode(self._matrix[start:stop])
+            self._codec = codec
+            self._matrix = codes
+
+    def _decode(self, rows: np.ndarray) -> np.ndarray:
+        """把指定行解码为 float32 向量"""
+        codes = self._matrix[rows]
+        if self.precision == "int8":
+            return codes.astype(np.float32) * self._scales[rows, None]
+        if self._codec is not None:
+            return self._codec.decode(codes)
+        return codes.astype(np.float32)
+
+    def _score_rows(self, query_vector: np.ndarray) -> np.ndarray:
+        if self.precision == "float32" or (self.precision == "pq" and self._codec is None):
+            return super()._score_rows(query_vector)
+        query_vector = np.asarray(query_vector, dtype=np.float32).ravel()
+        return self._score_matrix(query_vector[None, :])[0]
+
+    def _score_matrix(self, query_matrix: np.ndarray) -> np.ndarray:
+        if self.precision == "float32" or (self.precision == "pq" and self._codec is None):
+            return super()._score_matrix(query_matrix)
+        query_matrix = np.asarray(query_matrix, dtype=np.float32)
+        scores = np.empty((query_matrix.shape[0], self._size), dtype=np.float32)
+        if self._codec is not None:
+            tables = [self._codec.lookup_table(query_vector) for query_vector in query_matrix]
+        for start in range(0, self._size, self._CHUNK_ROWS):
+            stop = min(start + self._CHUNK_ROWS, self._size)
+            codes = self._matrix[start:stop]
+            if self._codec is not None:
+                for i, table in enumerate(tables):
+                    scores[i, start:stop] = self._codec.score(codes, table)
+            else:
+                block = query_matrix @ codes.astype(np.float32).T
+                if self.precision == "int8":
+                    block *= self._scales[start:stop]
+                scores[:, start:stop] = block
+        if self._tombstones:
+            scores[:, ~self._alive[:self._size]] = -np.inf
+        return scores
+
+    def _score_subset(self, rows: np.ndarray, query_vector: np.ndarray) -> np.ndarray:
+        if not self.is_lossy:
+            return super()._score_subset(rows, query_vector)
+        if self._codec is not None:
+            return self._codec.score(self._matrix[rows], self._codec.lookup_table(query_vector))
+        query_vector = np.asarray(query_vector, dtype=np.float32).ravel()
+        return self._decode(rows) @ query_vector
+
+    def _candidate_pool(self, top_k: int) -> int:
+        if not self.is_lossy:
+            return super()._candidate_pool(top_k)
+        return top_k * self.rerank_factor + self._RERANK_PADDING
+
+    def _rerank(self, rows: np.ndarray, query_vector: np.ndarray,
+                k: int) -> Tuple[np.ndarray, np.ndarray]:
+        if not self.is_lossy:
+            return super()._rerank(rows, query_vector, k)
+        if self.rerank_vectors is not None:
+            vectors = self.rerank_vectors([self._row_ids[row] for row in rows])
+        else:
+            vectors = self._decode(rows)
+        vectors = np.asarray(vectors, dtype=np.float64).reshape(rows.shape[0], -1)
+        exact = (vectors * np.asarray(query_vector, dtype=np.float64).ravel()).sum(axis=1)
+        order = np.lexsort((rows, -exact))[:k]
+        return rows[order], np.clip(exact[order], -1.0, 1.0)
+
+    def clear(self) -> None:
+        """清空向量存储，pq 码本需要重新训练"""
+        with self._lock:
+            super().clear()
+            self._scales = np.zeros(0, dtype=np.float32)
+            self._codec = None
@@ -0,0 +1,73 @@
+"""
+混合检索的结果融合
+
+每个检索源返回按分数降序排列的 (memory_id, score) 列表，
+这里把多个来源的结果合并为一个排序。
+"""
+
+from typing import List, Dict, Tuple, Optional, Literal
+
+FusionMethod = Literal["rrf", "weighted"]
+
+
+def reciprocal_rank_fusion(results: Dict[str, List[Tuple[str, float]]],
+                           weights: Optional[Dict[str, float]] = None,
+                           k: int = 60) -> List[Tuple[str, float]]:
+    """
+    倒数排名融合（RRF）
+
+    参数:
+        results: 来源名 -> 按分数降序的 (memory_id, score) 列表
+        weights: 来源名 -> 权重，缺省为1
+        k: 平滑常数，越大排名靠后的结果影响越大
+
+    返回:
+        融合后的 (memory_id, 融合分数) 列表，同分按首次出现顺序
+    """
+    weights = weights or {}
+    fused: Dict[str, float] = {}
+    for source, items in results.items():
+        weight = weights.get(source, 1.0)
+        for rank, (memory_id, _) in enumerate(items, 1):
+            fused[memory_id] = fused.get(memory_id, 0.0) + weight / (k + rank)
+    return sorted(fused.items(), key=lambda item: -item[1])
+
+
+def weighted_score_fusion(results: Dict[str, List[Tuple[str, float]]],
+                          weights: Optional[Dict[str, float]] = None) -> List[Tuple[str, float]]:
+    """
+    归一化分数加权融合
+
+    每个来源的分数先做 min-max 归一化到 [0, 1]，再按权重求和。
+
+    参数:
+        results: 来源名 -> 按分数降序的 (memory_id, score) 列表
+        weights: 来源名 -> 权重，缺省为1
+
+    返回:
+        融合后的 (memory_id, 融合分数) 列表，同分按首次出现顺序
+    """
+    weights = weights or {}
+    fused: Dict[str, float] = {}
+    for source, items in results.items():
+        if not items:
+            continue
+        weight = weights.get(source, 1.0)
+        high = max(score for _, score in items)
+        low = min(score for _, score in items)
+        span = high - low
+        for memory_id, score in items:
+            normalized = (score - low) / span if span > 0 else 1.0
+            fused[memory_id] = fused.get(memory_id, 0.0) + weight * normalized
+    return sorted(fused.items(), key=lambda item: -item[1])
+
+
+def fuse(results: Dict[str, List[Tuple[str, float]]],
+         method: FusionMethod = "rrf",
+         weights: Optional[Dict[str, float]] = None) -> List[Tuple[str, float]]:
+    """按指定方法融合多个来源的检索结果"""
+    if method == "rrf":
+        return reciprocal_rank_fusion(results, weights)
+    if method == "weighted":
+        return weighted_score_fusion(results, weights)
+    raise ValueError(f"不支持的融合方法: {method}")
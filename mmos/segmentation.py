@@ -0,0 +1,322 @@
+"""
+对话话题切分
+
+TopicSegmenter 为一个会话保存已处理轮次的话题归属和各话题的质心，
+每次只为新增的轮次请求嵌入，并只与现有话题的质心比较，
+单轮的开销与历史长度无关。
+
+启用关键词预筛后，每个话题另外维护一个关键词布隆过滤器，新的一轮只与
+当前话题以及有共同关键词的话题比较；关键词足够多、不含指代追问、且与所有话题
+都没有共同关键词的一轮直接开启新话题，不请求嵌入。
+"""
+
+import base64
+import hashlib
+import re
+from typing import List, Dict, Any, Callable, Optional, Sequence, Set, Iterable
+
+import numpy as np
+
+from .bloom import ScalableBloomFilter
+from .index import tokenize
+
+# 不作为话题关键词的常见词
+_STOPWORDS = frozenset("""
+什么 怎么 怎样 可以 一下 我们 你们 他们 这个 那个 一个 没有 不是 就是 还是 还有 如果 因为
+所以 但是 然后 现在 的话 需要 想要 知道 告诉 请问 是否 有没 是不 能不 好的 谢谢 你好 觉得
+the a an is are was were be to of and or in on at for with what how why can could would
+you your i me my it this that do does please there here
+""".split())
+
+# 追问常用的指代词与语气词：含有这些词的轮次依赖上文，不被预筛直接拒绝
+_FOLLOW_UP = re.compile(r"[它他她这那呢]|\b(?:it|its|they|them|this|that|these|those)\b", re.IGNORECASE)
+# 关键词少于该数目的短轮次信息不足，不被预筛直接拒绝
+_MIN_REJECT_KEYWORDS = 3
+
+
+def _chain_fingerprint(fingerprint: bytes, text: str) -> bytes:
+    """把一轮内容接到前缀指纹上，得到包含该轮的前缀指纹"""
+    return hashlib.blake2b(fingerprint + text.encode("utf-8"), digest_size=16).digest()
+
+
+def _prefix_fingerprint(turns: Iterable[str], fingerprint: bytes = b"") -> bytes:
+    for turn in turns:
+        fingerprint = _chain_fingerprint(fingerprint, turn)
+    return fingerprint
+
+
+def extract_keywords(text: str) -> Set[str]:
+    """
+    提取用于预筛的关键词：中文相邻二元组与长度不小于2的词，去掉常见词
+
+    参数:
+        text: 文本
+
+    返回:
+        关键词集合
+    """
+    return {token for token in tokenize(text) if len(token) > 1 and token not in _STOPWORDS}
+
+
+class TopicSegmenter:
+    """增量的对话话题切分器
+
+    每轮以用户消息的嵌入表示。新的一轮与各话题质心（话题内各轮单位向量之和）
+    计算余弦相似度，最高分不低于阈值时归入该话题，否则开启新话题。
+    """
+
+    def __init__(self, embed: Callable[[List[str]], Sequence[Sequence[float]]],
+                 similarity_threshold: float = 0.5,
+                 prefilter_error_rate: Optional[float] = None):
+        """
+        初始化
+
+        参数:
+            embed: 批量嵌入函数，输入文本列表，返回等长的向量列表
+            similarity_threshold: 归入已有话题所需的最低余弦相似度
+            prefilter_error_rate: 关键词布隆过滤器的误判率，为None时不做预筛
+        """
+        self.embed = embed
+        self.similarity_threshold = similarity_threshold
+        self.prefilter_error_rate = prefilter_error_rate
+        self.reset()
+
+    def reset(self) -> None:
+        """清空会话状态"""
+        self._prefix_fingerprint = b""  # 已处理的全部轮次依次链接得到的指纹
+        self._labels: List[int] = []
+        self._sums = np.zeros((0, 0), dtype=np.float32)
+        self._segment_count = 0
+        self._filters: List[ScalableBloomFilter] = []
+        self._pending: Dict[int, str] = {}  # 由预筛开启、尚未请求嵌入的话题 -> 首轮内容
+        # turns: 处理的轮次数；embedded: 请求嵌入的文本数；
+        # rejected: 未请求嵌入就开启新话题的轮次数（含会话的第一轮）
+        self.stats = {"turns": 0, "embedded": 0, "rejected": 0, "embeddings_avoided": 0}
+
+    @property
+    def labels(self) -> List[int]:
+        """已处理各轮所属的话题编号，编号按话题首次出现的顺序"""
+        return list(self._labels)
+
+    @property
+    def segment_count(self) -> int:
+        """话题数"""
+        return self._segment_count
+
+    def _is_continuation(self, turns: Sequence[str]) -> bool:
+        """turns 的前缀是否与已处理的轮次完全一致（比较整个前缀的指纹，任何一轮被修改都不算延续）"""
+        processed = len(self._labels)
+        if processed == 0:
+            return True
+        return (len(turns) >= processed
+                and _prefix_fingerprint(turns[:processed]) == self._prefix_fingerprint)
+
+    def _embed(self, texts: List[str]) -> np.ndarray:
+        self.stats["embedded"] += len(texts)
+        return np.asarray(self.embed(texts), dtype=np.float32)
+
+    def _new_segment(self) -> int:
+        """追加一个质心为零的话题"""
+        segment = self._segment_count
+        if segment == self._sums.shape[0] and self._sums.shape[1]:
+            grown = np.zeros((max(4, 2 * segment), self._sums.shape[1]), dtype=np.float32)
+            grown[:segment] = self._sums[:segment]
+            self._sums = grown
+        if self.prefilter_error_rate is not None:
+            self._filters.append(ScalableBloomFilter(self.prefilter_error_rate))
+        self._segment_count += 1
+        return segment
+
+    def _add_vector(self, segment: int, vector: np.ndarray) -> None:
+        """把单位向量累加到话题质心，首个向量确定维度"""
+        if self._sums.shape[1] != vector.shape[0]:
+            self._sums = np.zeros((max(4, 2 * self._segment_count), vector.shape[0]), dtype=np.float32)
+        self._sums[segment] += vector
+
+    def _assign(self, vector: np.ndarray, candidates: Optional[List[int]] = None) -> int:
+        """把一轮分配到话题（只考虑 candidates 中的话题，为None时考虑全部），并更新话题质心"""
+        norm = float(np.linalg.norm(vector))
+        if norm > 0:
+            vector = vector / norm
+        if candidates is None:
+            candidates = list(range(self._segment_count))
+        if candidates and self._sums.shape[1]:
+            sums = self._sums[candidates]
+            norms = np.linalg.norm(sums, axis=1)
+            norms[norms == 0] = 1.0
+            scores = (sums @ vector) / norms
+            best = int(np.argmax(scores))
+            if scores[best] >= self.similarity_threshold:
+                self._add_vector(candidates[best], vector)
+                return candidates[best]
+        segment = self._new_segment()
+        self._add_vector(segment, vector)
+        return segment
+
+    def _candidates(self, keywords: Set[str], current: Optional[int] = None) -> Optional[List[int]]:
+        """
+        与 keywords 有共同关键词的话题，按编号排列；没有关键词时无法预筛，
+        返回None表示全部话题。current 为当前话题，总是包含在内
+        """
+        if not keywords:
+            return None
+        return [segment for segment, bloom in enumerate(self._filters)
+                if segment == current or any(keyword in bloom for keyword in keywords)]
+
+    def _materialize(self, segments: Optional[List[int]], vectors: Dict[str, np.ndarray]) -> None:
+        """为由预筛开启的话题补充嵌入，使其质心可以参与比较；vectors 为已批量取得的嵌入"""
+        if segments is None:
+            segments = list(self._pending)
+        segments = [segment for segment in segments if segment in self._pending]
+        missing = [self._pending[segment] for segment in segments if self._pending[segment] not in vectors]
+        if missing:
+            vectors.update(zip(missing, self._embed(missing)))
+        for segment in segments:
+            vector = vectors[self._pending.pop(segment)]
+            norm = float(np.linalg.norm(vector))
+            self._add_vector(segment, vector / norm if norm > 0 else vector)
+
+    def _remember(self, segment: int, keywords: Set[str]) -> None:
+        for keyword in keywords:
+            self._filters[segment].add(keyword)
+
+    def update(self, turns: Sequence[str], replies: Optional[Sequence[str]] = None) -> List[int]:
+        """
+        处理会话的全部轮次，返回每轮所属的话题编号
+
+        turns 延续上一次调用的轮次时只为新增轮次请求一次批量嵌入；
+        已处理的任何一轮被修改（如被压缩或截断）时重置状态后重新处理。
+        启用预筛时，关键词不少于三个、不含指代追问且与所有话题都没有共同关键词的
+        轮次不请求嵌入，其余轮次总是与当前话题比较。
+
+        参数:
+            turns: 按顺序排列的每轮用户消息内容
+            replies: 与 turns 对齐的每轮回复内容，仅用于补充预筛关键词
+
+        返回:
+            与 turns 等长的话题编号列表
+        """
+        if not self._is_continuation(turns):
+            self.reset()
+        processed = len(self._labels)
+        new_turns = list(turns[processed:])
+        if self.prefilter_error_rate is None:
+            if new_turns:
+                for vector in self._embed(new_turns):
+                    self._labels.append(self._assign(vector))
+        else:
+            if replies is not None:
+                # 上次处理时最后一轮的回复可能还不完整
+                for turn in range(max(0, processed - 1), processed):
+                    self._remember(self._labels[turn], extract_keywords(replies[turn]))
+            self._update_prefiltered(new_turns, replies[processed:] if replies is not None else None)
+        if new_turns:
+            self._prefix_fingerprint = _prefix_fingerprint(new_turns, self._prefix_fingerprint)
+            self.stats["turns"] += len(new_turns)
+            self.stats["embeddings_avoided"] = self.stats["turns"] - self.stats["embedded"]
+        return list(self._labels)
+
+    def _update_prefiltered(self, new_turns: List[str], replies: Optional[Sequence[str]]) -> None:
+        keywords = [extract_keywords(turn) for turn in new_turns]
+        reply_keywords = [extract_keywords(replies[index]) if replies is not None and index < len(replies) else set()
+                          for index in range(len(new_turns))]
+
+        # 预筛只依赖关键词，先确定哪些轮次直接开启新话题：会话的第一轮没有可比较的话题；
+        # 其余轮次须关键词足够多、不含指代追问，且与已有话题和更早的新轮次都没有共同关键词
+        rejected: List[bool] = []
+        earlier: Set[str] = set()
+        for index, turn in enumerate(new_turns):
+            turn_keywords = keywords[index]
+            rejected.append(
+                (not self._labels and index == 0)
+                or (len(turn_keywords) >= _MIN_REJECT_KEYWORDS and not _FOLLOW_UP.search(turn)
+                    and not turn_keywords & earlier and self._candidates(turn_keywords) == [])
+            )
+            earlier |= turn_keywords | reply_keywords[index]
+
+        # 一次批量请求需要的嵌入：未被拒绝的轮次，以及它们要比较的尚未嵌入的话题首轮
+        # （上一轮开启的话题，和有共同关键词的话题）
+        needed: Set[str] = set()
+        for index, turn in enumerate(new_turns):
+            if rejected[index]:
+                continue
+            needed.add(turn)
+            if index == 0:
+                if self._labels[-1] in self._pending:
+                    needed.add(self._pending[self._labels[-1]])
+            elif rejected[index - 1]:
+                needed.add(new_turns[index - 1])
+            candidates = self._candidates(keywords[index])
+            if candidates is None:
+                needed.update(self._pending.values())
+                needed.update(new_turns[other] for other in range(index) if rejected[other])
+            else:
+                needed.update(self._pending[segment] for segment in candidates if segment in self._pending)
+                needed.update(new_turns[other] for other in range(index) if rejected[other]
+                              and keywords[index] & (keywords[other] | reply_keywords[other]))
+        vectors: Dict[str, np.ndarray] = {}
+        if needed:
+            texts = sorted(needed)
+            vectors = dict(zip(texts, self._embed(texts)))
+
+        for index, turn in enumerate(new_turns):
+            if rejected[index]:
+                segment = self._new_segment()
+                self._pending[segment] = turn
+                self.stats["rejected"] += 1
+            else:
+                candidates = self._candidates(keywords[index], self._labels[-1])
+                self._materialize(candidates, vectors)
+                vector = vectors.get(turn)
+                if vector is None:
+                    vector = self._embed([turn])[0]
+                segment = self._assign(vector, candidates)
+            self._labels.append(segment)
+            self._remember(segment, keywords[index] | reply_keywords[index])
+
+    def to_dict(self) -> Dict[str, Any]:
+        """
+        将会话状态转换为可 JSON 序列化的字典
+
+        返回:
+            状态字典，可与会话一起保存，之后用 from_dict 恢复
+        """
+        sums = np.ascontiguousarray(self._sums[:self._segment_count])
+        return {
+            "similarity_threshold": self.similarity_threshold,
+            "prefilter_error_rate": self.prefilter_error_rate,
+            "prefix_fingerprint": self._prefix_fingerprint.hex(),
+            "labels": list(self._labels),
+            "dimension": int(self._sums.shape[1]),
+            "sums": base64.b64encode(sums.tobytes()).decode("ascii"),
+            "filters": [bloom.to_dict() for bloom in self._filters],
+            "pending": {str(segment): text for segment, text in self._pending.items()},
+            "stats": dict(self.stats),
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any],
+                  embed: Callable[[List[str]], Sequence[Sequence[float]]]) -> "TopicSegmenter":
+        """
+        从 to_dict 的结果恢复会话状态
+
+        参数:
+            data: 状态字典
+            embed: 批量嵌入函数
+
+        返回:
+            切分器
+        """
+        segmenter = cls(embed, data["similarity_threshold"], data.get("prefilter_error_rate"))
+        segmenter._prefix_fingerprint = bytes.fromhex(data["prefix_fingerprint"])
+        segmenter._labels = list(data["labels"])
+        segmenter._segment_count = max(segmenter._labels, default=-1) + 1
+        dimension = data["dimension"]
+        sums = np.frombuffer(base64.b64decode(data["sums"]), dtype=np.float32)
+        segmenter._sums = np.zeros((max(4, 2 * segmenter._segment_count), dimension), dtype=np.float32)
+        if dimension:
+            segmenter._sums[:segmenter._segment_count] = sums.reshape(-1, dimension)
+        segmenter._filters = [ScalableBloomFilter.from_dict(bloom) for bloom in data["filters"]]
+        segmenter._pending = {int(segment): text for segment, text in data["pending"].items()}
+        segmenter.stats.update(data.get("stats", {}))
+        return segmenter
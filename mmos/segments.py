@@ -0,0 +1,582 @@
+"""
+向量分段持久化模块
+
+向量按段存放在磁盘上，每个封存段由四部分组成：
+    <name>.vec   64 字节文件头 + float32 行向量矩阵，通过 np.memmap 只读打开
+    <name>.keys  按 memory_id 哈希排序的 (哈希, 行号) 表，通过 np.memmap 只读打开
+    <name>.ids   每行一个 JSON 编码的 memory_id
+    <name>.attrs 每行一条 JSON 编码的记忆属性（标签、元数据、时间、重要性），供过滤使用
+    manifest.json  段列表、各段已删除的行号、清单代数与待清理的旧段
+
+多个工作进程打开同一目录时共享操作系统的页缓存，无需各自拷贝；
+启动时只读取清单并映射文件，与数据量无关。判断记忆是否存在、删除记忆只查哈希表，
+.ids 在第一次需要返回结果时才读取。
+
+写入清单的操作（封存、合并、清空、落盘删除）持有目录下的文件锁，先读取磁盘上的
+最新清单再修改，多个进程可以同时写入。合并与清空后不再使用的段文件记在清单的
+retired 中，至少再过一代清单才删除；段在打开时即持有全部文件，之后文件被删除
+也能继续读取。
+"""
+
+import hashlib
+import json
+import os
+import struct
+import threading
+from contextlib import contextmanager
+from typing import List, Dict, Any, Optional, Tuple, Callable, Iterable, Iterator, Set
+
+import numpy as np
+
+from .filters import AttributeIndex, MemoryFilter
+from .models import Memory
+from .vector_store import SimpleVectorStore, _top_k_rows, _rerank_rows
+
+_MAGIC = b"MMOSVEC\0"
+_VERSION = 1
+_HEADER = struct.Struct("<8sIIQ")  # magic, version, dimension, count
+_HEADER_SIZE = 64
+_MANIFEST = "manifest.json"
+_LOCK = "manifest.lock"
+_SUFFIXES = (".vec", ".keys", ".ids", ".attrs")
+# 刷新清单时遇到段文件已被清理（读到的清单已过期）的最大重试次数
+_REFRESH_RETRIES = 5
+
+
+def _id_key(memory_id: Any) -> int:
+    """memory_id 的 64 位哈希"""
+    digest = hashlib.blake2b(json.dumps(memory_id, ensure_ascii=False).encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "little", signed=True)
+
+
+def _id_keys(memory_ids: Iterable[Any]) -> np.ndarray:
+    return np.fromiter(map(_id_key, memory_ids), dtype=np.int64)
+
+
+def write_segment(directory: str, name: str, ids: List[Any], matrix: np.ndarray,
+                  attributes: Optional[List[Dict[str, Any]]] = None) -> None:
+    """
+    写入一个封存段
+
+    参数:
+        directory: 存储目录
+        name: 段名
+        ids: 行号对应的 memory_id
+        matrix: (N×D) 向量矩阵
+        attributes: 行号对应的记忆属性（AttributeIndex.record 的结果）
+    """
+    matrix = np.ascontiguousarray(matrix, dtype=np.float32)
+    count, dimension = matrix.shape
+    vec_path = os.path.join(directory, name + ".vec")
+    keys_path = os.path.join(directory, name + ".keys")
+    ids_path = os.path.join(directory, name + ".ids")
+    attrs_path = os.path.join(directory, name + ".attrs")
+
+    with open(ids_path + ".tmp", "w", encoding="utf-8") as f:
+        for memory_id in ids:
+            f.write(json.dumps(memory_id, ensure_ascii=False) + "\n")
+    if attributes is not None:
+        with open(attrs_path + ".tmp", "w", encoding="utf-8") as f:
+            for record in attributes:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+    keys = _id_keys(ids)
+    order = np.argsort(keys, kind="stable")
+    with open(keys_path + ".tmp", "wb") as f:
+        f.write(np.stack([keys[order], order]).astype("<i8").tobytes())
+    with open(vec_path + ".tmp", "wb") as f:
+        header = _HEADER.pack(_MAGIC, _VERSION, dimension, count)
+        f.write(header.ljust(_HEADER_SIZE, b"\0"))
+        f.write(matrix.tobytes())
+    os.replace(ids_path + ".tmp", ids_path)
+    if attributes is not None:
+        os.replace(attrs_path + ".tmp", attrs_path)
+    os.replace(keys_path + ".tmp", keys_path)
+    os.replace(vec_path + ".tmp", vec_path)
+
+
+def remove_segment_files(directory: str, name: str) -> bool:
+    """
+    删除段文件
+
+    返回:
+        是否已全部删除（文件正被占用而无法删除时为False，例如 Windows）
+    """
+    removed = True
+    for suffix in _SUFFIXES:
+        try:
+            os.remove(os.path.join(directory, name + suffix))
+        except FileNotFoundError:
+            pass
+        except OSError:
+            removed = False
+    return removed
+
+
+class VectorSegment:
+    """只读的封存段"""
+
+    def __init__(self, directory: str, name: str, deleted: Optional[List[int]] = None):
+        """
+        打开封存段，段的文件在此时全部打开，之后即使被删除也能继续读取
+
+        参数:
+            directory: 存储目录
+            name: 段名
+            deleted: 已删除的行号
+        """
+        self.directory = directory
+        self.name = name
+        vec_path = os.path.join(directory, name + ".vec")
+        with open(vec_path, "rb") as f:
+            magic, version, dimension, count = _HEADER.unpack(f.read(_HEADER.size))
+        if magic != _MAGIC:
+            raise ValueError(f"不是有效的向量段文件: {vec_path}")
+        if version != _VERSION:
+            raise ValueError(f"不支持的向量段版本: {version}")
+        self.dimension = dimension
+        self.count = count
+        self._ids_file = None
+        self._attrs_file = None
+        self._load_lock = threading.Lock()  # .ids 与 .attrs 只读取一次
+        self._ids_file = open(os.path.join(directory, name + ".ids"), "r", encoding="utf-8")
+        attrs_path = os.path.join(directory, name + ".attrs")
+        if os.path.exists(attrs_path):
+            self._attrs_file = open(attrs_path, "r", encoding="utf-8")
+        keys_path = os.path.join(directory, name + ".keys")
+        # 旧版本写入的段没有哈希表，查找时退回读取 .ids
+        self._keys: Optional[np.ndarray] = None
+        if count:
+            self.matrix = np.memmap(vec_path, dtype=np.float32, mode="r",
+                                    offset=_HEADER_SIZE, shape=(count, dimension))
+            if os.path.exists(keys_path):
+                self._keys = np.memmap(keys_path, dtype="<i8", mode="r", shape=(2, count))
+        else:
+            self.matrix = np.zeros((0, dimension), dtype=np.float32)
+            self._keys = np.zeros((2, 0), dtype=np.int64)
+        self.alive = np.ones(count, dtype=bool)
+        if deleted:
+            self.alive[np.asarray(deleted, dtype=np.int64)] = False
+        self._ids: Optional[List[Any]] = None
+        self._id_to_row: Optional[Dict[Any, int]] = None
+        self._attributes: Optional[AttributeIndex] = None
+
+    def __del__(self) -> None:
+        for f in (self._ids_file, self._attrs_file):
+            if f is not None:
+                f.close()
+
+    @property
+    def ids(self) -> List[Any]:
+        """行号 -> memory_id，首次访问时才读取"""
+        with self._load_lock:
+            if self._ids is None:
+                with self._ids_file as f:
+                    self._ids = [json.loads(line) for line in f]
+        return self._ids
+
+    @property
+    def attributes(self) -> AttributeIndex:
+        """行号 -> 记忆属性，首次访问时才读取；没有属性文件的段视为无标签无元数据"""
+        with self._load_lock:
+            if self._attributes is None:
+                if self._attrs_file is not None:
+                    with self._attrs_file as f:
+                        records = [json.loads(line) for line in f]
+                else:
+                    records = [{"tags": [], "metadata": {}, "created_at": 0.0, "importance": 0.0}] * self.count
+                self._attributes = AttributeIndex.from_records(records)
+        return self._attributes
+
+    def rows_of(self, memory_ids: List[Any]) -> np.ndarray:
+        """
+        批量查找有效行号
+
+        参数:
+            memory_ids: 记忆ID列表
+
+        返回:
+            与 memory_ids 对齐的行号数组，不存在或已删除的为 -1
+        """
+        if self._keys is None:
+            if self._id_to_row is None:
+                self._id_to_row = {memory_id: row for row, memory_id in enumerate(self.ids)}
+            rows = np.fromiter((self._id_to_row.get(memory_id, -1) for memory_id in memory_ids),
+                               dtype=np.int64, count=len(memory_ids))
+        else:
+            keys = _id_keys(memory_ids)
+            sorted_keys = self._keys[0]
+            positions = np.minimum(np.searchsorted(sorted_keys, keys), max(self.count - 1, 0))
+            if self.count:
+                rows = np.where(sorted_keys[positions] == keys, self._keys[1][positions], -1)
+            else:
+                rows = np.full(keys.shape[0], -1, dtype=np.int64)
+        found = rows >= 0
+        found[found] = self.alive[rows[found]]
+        return np.where(found, rows, -1)
+
+    def row_of(self, memory_id: Any) -> Optional[int]:
+        """查找有效行号，不存在或已删除时返回None"""
+        row = int(self.rows_of([memory_id])[0])
+        return None if row < 0 else row
+
+    @property
+    def deleted_rows(self) -> List[int]:
+        return np.flatnonzero(~self.alive).tolist()
+
+    @property
+    def live_count(self) -> int:
+        return int(self.alive.sum())
+
+    def remove_files(self) -> bool:
+        """删除段文件，见 remove_segment_files"""
+        return remove_segment_files(self.directory, self.name)
+
+
+class SegmentedVectorStore:
+    """基于磁盘分段的向量存储
+
+    新向量先写入内存中的可变段（SimpleVectorStore），达到 seal_threshold 后封存为
+    磁盘段；封存段超过 max_segments 个时合并为一个。删除封存段中的向量只记录行号，
+    合并时才真正丢弃。调用 flush() 后全部变更落盘。
+
+    可变段只通过本对象访问，段列表与可变段由同一把锁保护；嵌入在锁外进行。
+    """
+
+    def __init__(self, directory: str,
+                 embedding_function: Optional[Callable[[str], np.ndarray]] = None,
+                 dimension: int = 384,
+                 batch_embedding_function: Optional[Callable[[List[str]], np.ndarray]] = None,
+                 seal_threshold: int = 10000,
+                 max_segments: int = 8):
+        """
+        初始化分段向量存储
+
+        参数:
+            directory: 存储目录，不存在时自动创建
+            embedding_function: 同 SimpleVectorStore
+            dimension: 同 SimpleVectorStore
+            batch_embedding_function: 同 SimpleVectorStore
+            seal_threshold: 可变段达到多少条向量后封存
+            max_segments: 封存段数量上限，超过后合并
+        """
+        self.directory = directory
+        self.seal_threshold = seal_threshold
+        self.max_segments = max_segments
+        self._mutable = SimpleVectorStore(embedding_function, dimension, batch_embedding_function)
+        self.embedding_function = self._mutable.embedding_function
+        self.segments: List[VectorSegment] = []
+        self._next_segment = 0
+        self._generation = 0
+        self._retired: Dict[str, int] = {}  # 段名 -> 停止使用时的清单代数
+        self._unflushed_deletes: Set[Any] = set()  # 封存段中尚未写入清单的删除
+        self._lock = threading.RLock()  # 写入、检索与刷新清单互斥，seal 等可重入
+        os.makedirs(directory, exist_ok=True)
+        self.refresh()
+
+    @contextmanager
+    def _manifest_lock(self) -> Iterator[None]:
+        """持有目录下的清单文件锁（不支持 fcntl 的平台上不加锁，只允许单个写入进程）"""
+        try:
+            import fcntl
+        except ImportError:
+            fcntl = None
+        with open(os.path.join(self.directory, _LOCK), "a") as f:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+    def refresh(self) -> None:
+        """重新读取清单，加载其他进程封存、合并的段与落盘的删除；本进程尚未落盘的删除会保留"""
+        path = os.path.join(self.directory, _MANIFEST)
+        with self._lock:
+            for attempt in range(_REFRESH_RETRIES):
+                if not os.path.exists(path):
+                    return
+                with open(path, "r", encoding="utf-8") as f:
+                    manifest = json.load(f)
+                try:
+                    self._apply_manifest(manifest)
+                    return
+                except FileNotFoundError:
+                    # 读到清单后段已被合并并清理，重新读取最新的清单
+                    if attempt == _REFRESH_RETRIES - 1:
+                        raise
+
+    def _apply_manifest(self, manifest: Dict[str, Any]) -> None:
+        deleted = manifest.get("deleted", {})
+        opened = {segment.name: segment for segment in self.segments}
+        segments = []
+        for name in manifest.get("segments", []):
+            segment = opened.get(name)
+            if segment is None:
+                segment = VectorSegment(self.directory, name, deleted.get(name))
+            else:
+                # 其他进程只会增加删除，按清单重建后再补上本进程尚未落盘的删除
+                segment.alive[:] = True
+                if deleted.get(name):
+                    segment.alive[np.asarray(deleted[name], dtype=np.int64)] = False
+            segments.append(segment)
+        self.segments = segments
+        self._next_segment = manifest.get("next_segment", len(segments))
+        self._generation = manifest.get("generation", 0)
+        self._retired = dict(manifest.get("retired", {}))
+        if self._unflushed_deletes:
+            ids = list(self._unflushed_deletes)
+            for segment in segments:
+                rows = segment.rows_of(ids)
+                segment.alive[rows[rows >= 0]] = False
+
+    def _write_manifest(self) -> None:
+        """写入下一代清单，并清理已停用至少一代的段文件；调用方需持有清单锁"""
+        self._generation += 1
+        for name, generation in list(self._retired.items()):
+            if generation < self._generation - 1 and remove_segment_files(self.directory, name):
+                del self._retired[name]
+        manifest = {
+            "version": _VERSION,
+            "generation": self._generation,
+            "segments": [segment.name for segment in self.segments],
+            "deleted": {
+                segment.name: segment.deleted_rows
+                for segment in self.segments if not segment.alive.all()
+            },
+            "next_segment": self._next_segment,
+            "retired": self._retired,
+        }
+        path = os.path.join(self.directory, _MANIFEST)
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(manifest, f)
+        os.replace(path + ".tmp", path)
+        self._unflushed_deletes.clear()
+
+    def _retire(self, segments: List[VectorSegment]) -> None:
+        """标记段停止使用，文件在之后的清单中清理，仍在读取这些段的进程不受影响"""
+        for segment in segments:
+            self._retired[segment.name] = self._generation + 1
+
+    def _new_segment_name(self) -> str:
+        name = f"seg_{self._next_segment:06d}"
+        self._next_segment += 1
+        return name
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._mutable) + sum(segment.live_count for segment in self.segments)
+
+    def __contains__(self, memory_id: Any) -> bool:
+        with self._lock:
+            if memory_id in self._mutable:
+                return True
+            return any(segment.row_of(memory_id) is not None for segment in self.segments)
+
+    def missing_ids(self, memory_ids: Iterable[Any]) -> List[Any]:
+        """
+        批量找出尚未写入向量的记忆ID，只查哈希表，不读取各段的 .ids
+
+        参数:
+            memory_ids: 记忆ID序列
+
+        返回:
+            不在存储中的记忆ID，保持输入顺序
+        """
+        with self._lock:
+            memory_ids = [memory_id for memory_id in memory_ids if memory_id not in self._mutable]
+            missing = np.ones(len(memory_ids), dtype=bool)
+            for segment in self.segments:
+                if not missing.any():
+                    break
+                missing &= segment.rows_of(memory_ids) < 0
+            return [memory_id for memory_id, absent in zip(memory_ids, missing) if absent]
+
+    def _remove_sealed_many(self, memory_ids: List[Any]) -> int:
+        """把封存段中的这些记忆标记删除，返回删除的行数"""
+        removed = 0
+        for segment in self.segments:
+            rows = segment.rows_of(memory_ids)
+            hits = rows >= 0
+            if hits.any():
+                segment.alive[rows[hits]] = False
+                self._unflushed_deletes.update(memory_id for memory_id, hit in zip(memory_ids, hits) if hit)
+                removed += int(hits.sum())
+        return removed
+
+    def _remove_sealed(self, memory_id: Any) -> bool:
+        return self._remove_sealed_many([memory_id]) > 0
+
+    def add_memory(self, memory: Memory) -> None:
+        """将记忆添加到可变段，已封存的旧向量标记删除"""
+        vector = np.asarray(self.embedding_function(memory.content)).reshape(1, -1)
+        self._add_vectors([memory], vector)
+
+    def add_memories(self, memories: List[Memory]) -> None:
+        """批量添加记忆"""
+        if not memories:
+            return
+        self._add_vectors(memories, self._mutable._embed_batch([memory.content for memory in memories]))
+
+    def _add_vectors(self, memories: List[Memory], vectors: np.ndarray) -> None:
+        """写入已嵌入的向量，可变段达到阈值时封存"""
+        with self._lock:
+            self._remove_sealed_many([memory.id for memory in memories])
+            self._mutable._add_vectors(memories, vectors)
+            if len(self._mutable) >= self.seal_threshold:
+                self.seal()
+
+    def update_memory(self, memory: Memory) -> None:
+        """更新记忆的向量表示"""
+        self.add_memory(memory)
+
+    def remove_memory(self, memory_id: Any) -> bool:
+        """移除记忆，封存段中的删除在下次 flush 时落盘"""
+        with self._lock:
+            return self._mutable.remove_memory(memory_id) or self._remove_sealed(memory_id)
+
+    def seal(self) -> None:
+        """把可变段写为新的封存段，同时落盘封存段中的删除"""
+        with self._lock, self._manifest_lock():
+            self.refresh()
+            mutable = self._mutable
+            if len(mutable):
+                rows = np.flatnonzero(mutable._alive[:mutable._size])
+                ids = [mutable._row_ids[row] for row in rows]
+                attributes = [mutable._attributes.record(row) for row in rows]
+                name = self._new_segment_name()
+                write_segment(self.directory, name, ids, mutable._matrix[rows], attributes)
+                self.segments.append(VectorSegment(self.directory, name))
+                mutable.clear()
+            if len(self.segments) > self.max_segments:
+                self._merge()
+            self._write_manifest()
+
+    def merge(self) -> None:
+        """把所有封存段合并为一个，丢弃已删除的行"""
+        with self._lock, self._manifest_lock():
+            self.refresh()
+            self._merge()
+            self._write_manifest()
+
+    def _merge(self) -> None:
+        if not self.segments:
+            return
+        ids: List[Any] = []
+        attributes: List[Dict[str, Any]] = []
+        parts = []
+        for segment in self.segments:
+            rows = np.flatnonzero(segment.alive)
+            ids.extend(segment.ids[row] for row in rows)
+            attributes.extend(segment.attributes.record(row) for row in rows)
+            parts.append(np.asarray(segment.matrix[rows]))
+        name = self._new_segment_name()
+        write_segment(self.directory, name, ids, np.concatenate(parts), attributes)
+        self._retire(self.segments)
+        self.segments = [VectorSegment(self.directory, name)]
+
+    def flush(self) -> None:
+        """封存可变段并写入清单，使全部变更落盘"""
+        self.seal()
+
+    @staticmethod
+    def _segment_rows(segment: VectorSegment, memory_filter: Optional[MemoryFilter],
+                      allowed_ids: Optional[List[Any]]) -> Optional[np.ndarray]:
+        """段内满足过滤条件且在 allowed_ids 中的有效行号（升序），不限制时为None"""
+        rows = None
+        if memory_filter is not None:
+            rows = segment.attributes.select(memory_filter, segment.alive)
+        if allowed_ids is not None:
+            allowed = segment.rows_of(allowed_ids)
+            allowed = np.unique(allowed[allowed >= 0])
+            rows = allowed if rows is None else np.intersect1d(rows, allowed, assume_unique=True)
+        return rows
+
+    def _search_vector(self, query_vector: np.ndarray, top_k: int,
+                       memory_filter: Optional[MemoryFilter] = None,
+                       allowed_ids: Optional[List[Any]] = None) -> List[Tuple[str, float]]:
+        query32 = np.asarray(query_vector, dtype=np.float32).ravel()
+        candidates: List[Tuple[float, int, Any]] = []
+        for order, segment in enumerate(self.segments):
+            allowed = self._segment_rows(segment, memory_filter, allowed_ids)
+            if allowed is None:
+                live = segment.live_count
+                if not live:
+                    continue
+                scores = np.asarray(segment.matrix @ query32)
+                scores[~segment.alive] = -np.inf
+                picked = _top_k_rows(scores, min(top_k + SimpleVectorStore._RERANK_PADDING, live))
+            else:
+                # 只读取满足条件的行，不必扫描整个段
+                live = allowed.shape[0]
+                if not live:
+                    continue
+                scores = np.asarray(segment.matrix[allowed] @ query32)
+                picked = allowed[_top_k_rows(scores, min(top_k + SimpleVectorStore._RERANK_PADDING, live))]
+            rows, exact = _rerank_rows(segment.matrix, picked, query_vector, min(top_k, live))
+            ids = segment.ids
+            candidates.extend((float(score), order, ids[row]) for row, score in zip(rows, exact))
+        if len(self._mutable):
+            order = len(self.segments)
+            rows = self._mutable._restrict_rows(memory_filter, allowed_ids)
+            if rows is None:
+                mutable_results = self._mutable._search_vector(query_vector, top_k)
+            else:
+                mutable_results = self._mutable._search_filtered(query_vector, top_k, rows)
+            candidates.extend((score, order, memory_id) for memory_id, score in mutable_results)
+        # Python 的排序是稳定的，同分时保持段顺序与段内行顺序
+        candidates.sort(key=lambda item: (-item[0], item[1]))
+        return [(memory_id, score) for score, _, memory_id in candidates[:top_k]]
+
+    def similarity_search(self, query: str, top_k: int = 5,
+                          memory_filter: Optional[MemoryFilter] = None,
+                          allowed_ids: Optional[Iterable[Any]] = None) -> List[Tuple[str, float]]:
+        """
+        基于语义相似度搜索记忆
+
+        参数:
+            query: 查询字符串
+            top_k: 返回的最大结果数
+            memory_filter: 结构化过滤条件
+            allowed_ids: 只在这些记忆中检索，同 SimpleVectorStore.similarity_search
+
+        返回:
+            包含(memory_id, 相似度分数)的列表，按相似度从高到低排序
+        """
+        if not len(self):
+            return []
+        if memory_filter is not None and memory_filter.is_empty:
+            memory_filter = None
+        if allowed_ids is not None:
+            allowed_ids = list(allowed_ids)
+        query_vector = self.embedding_function(query)
+        with self._lock:
+            return self._search_vector(query_vector, top_k, memory_filter, allowed_ids)
+
+    def similarity_search_batch(self, queries: List[str], top_k: int = 5,
+                                memory_filter: Optional[MemoryFilter] = None,
+                                allowed_ids: Optional[Iterable[Any]] = None
+                                ) -> List[List[Tuple[str, float]]]:
+        """批量语义搜索，查询一次性嵌入"""
+        if not queries:
+            return []
+        if not len(self):
+            return [[] for _ in queries]
+        if memory_filter is not None and memory_filter.is_empty:
+            memory_filter = None
+        if allowed_ids is not None:
+            allowed_ids = list(allowed_ids)
+        query_matrix = self._mutable._embed_batch(queries)
+        with self._lock:
+            return [self._search_vector(query_vector, top_k, memory_filter, allowed_ids)
+                    for query_vector in query_matrix]
+
+    def clear(self) -> None:
+        """清空向量存储，段文件在之后的清单中清理"""
+        with self._lock, self._manifest_lock():
+            self.refresh()
+            self._retire(self.segments)
+            self.segments = []
+            self._mutable.clear()
+            self._unflushed_deletes.clear()
+            self._write_manifest()
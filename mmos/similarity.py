@@ -0,0 +1,159 @@
+"""
+向量相似度矩阵
+
+一次调用计算查询向量与全部向量（或全部向量两两之间）的分数矩阵，
+按查询行分块计算以限制中间结果的内存占用。
+"""
+
+from typing import Dict, Literal, Optional
+
+import numpy as np
+
+SimilarityMetric = Literal["cosine", "euclidean", "dot_product", "manhattan", "jaccard"]
+
+_METRICS = ("cosine", "euclidean", "dot_product", "manhattan", "jaccard")
+_ALIASES: Dict[str, str] = {"dot": "dot_product"}
+
+# 曼哈顿距离需要 (块行数×N×D) 的中间数组，按该字节数确定块大小
+_MANHATTAN_BLOCK_BYTES = 64 << 20
+
+
+def _as_matrix(vectors, dtype: np.dtype) -> np.ndarray:
+    matrix = np.asarray(vectors, dtype=dtype)
+    if matrix.ndim == 1:
+        matrix = matrix.reshape(1, -1)
+    if matrix.ndim != 2:
+        raise ValueError(f"向量必须是一维或二维数组，实际为 {matrix.ndim} 维")
+    return matrix
+
+
+class SimilarityEngine:
+    """针对一组固定向量的相似度计算
+
+    构造时按度量预先计算归一化向量、平方范数或二值化结果，
+    之后每次查询只需一次矩阵乘法（曼哈顿距离除外）。
+
+    各度量的含义与 ShortMemory._calculate_vector_similarity 一致：
+        cosine: 余弦相似度，零向量与任何向量的相似度为0
+        euclidean: 欧几里得距离，越小越相似
+        dot_product: 点积，越大越相似
+        manhattan: 曼哈顿距离，越小越相似
+        jaccard: 把大于0的分量视为集合元素的杰卡德相似度，两个空集的相似度为1
+    """
+
+    def __init__(self, vectors, metric: SimilarityMetric = "cosine",
+                 dtype: np.dtype = np.float32, chunk_size: int = 1024):
+        """
+        初始化
+
+        参数:
+            vectors: (N×D) 向量矩阵
+            metric: 相似度度量，"dot" 是 "dot_product" 的别名
+            dtype: 计算精度，默认 float32；需要与逐对计算逐位一致时用 float64
+            chunk_size: 每块计算的查询行数上限
+        """
+        metric = _ALIASES.get(metric, metric)
+        if metric not in _METRICS:
+            raise ValueError(f"不支持的相似度度量: {metric}")
+        if chunk_size <= 0:
+            raise ValueError("chunk_size 必须大于0")
+        self.metric = metric
+        self.dtype = np.dtype(dtype)
+        self.chunk_size = chunk_size
+        self._vectors = _as_matrix(vectors, self.dtype)
+        self._base = self._prepare(self._vectors)
+        self._base_norms = self._norms(self._base)
+
+    def __len__(self) -> int:
+        return self._vectors.shape[0]
+
+    def _prepare(self, matrix: np.ndarray) -> np.ndarray:
+        """按度量预处理向量"""
+        if self.metric == "cosine":
+            norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+            norms[norms == 0] = 1.0
+            return matrix / norms
+        if self.metric == "jaccard":
+            return (matrix > 0).astype(self.dtype)
+        return matrix
+
+    def _norms(self, prepared: np.ndarray) -> Optional[np.ndarray]:
+        """欧氏距离用平方范数，杰卡德用集合大小"""
+        if self.metric == "euclidean":
+            return np.einsum("ij,ij->i", prepared, prepared)
+        if self.metric == "jaccard":
+            return prepared.sum(axis=1)
+        return None
+
+    def _block(self, queries: np.ndarray, query_norms: Optional[np.ndarray]) -> np.ndarray:
+        """计算一块查询对全部向量的分数"""
+        base = self._base
+        if self.metric == "manhattan":
+            return np.abs(queries[:, None, :] - base[None, :, :]).sum(axis=2)
+        products = queries @ base.T
+        if self.metric in ("cosine", "dot_product"):
+            return products
+        if self.metric == "euclidean":
+            squared = query_norms[:, None] + self._base_norms[None, :] - 2 * products
+            return np.sqrt(np.maximum(squared, 0, out=squared), out=squared)
+        # jaccard：交集 / 并集，两个空集记为1
+        union = query_norms[:, None] + self._base_norms[None, :] - products
+        scores = np.ones_like(products)
+        np.divide(products, union, out=scores, where=union > 0)
+        return scores
+
+    def _rows_per_block(self) -> int:
+        if self.metric != "manhattan":
+            return self.chunk_size
+        per_row = max(1, self._base.shape[0] * self._base.shape[1] * self.dtype.itemsize)
+        return max(1, min(self.chunk_size, _MANHATTAN_BLOCK_BYTES // per_row))
+
+    def scores(self, queries=None) -> np.ndarray:
+        """
+        计算分数矩阵
+
+        参数:
+            queries: (Q×D) 查询向量或单个查询向量；为None时计算全部向量两两之间
+                的 (N×N) 矩阵，此时欧氏与曼哈顿距离的对角线严格为0
+
+        返回:
+            (Q×N) 或 (N×N) 的分数矩阵，dtype 与构造时一致
+        """
+        if queries is None:
+            prepared = self._base
+            query_norms = self._base_norms
+        else:
+            matrix = _as_matrix(queries, self.dtype)
+            if matrix.shape[1] != self._vectors.shape[1]:
+                raise ValueError(f"查询向量维度 {matrix.shape[1]} 与向量维度 {self._vectors.shape[1]} 不一致")
+            prepared = self._prepare(matrix)
+            query_norms = self._norms(prepared)
+
+        count = prepared.shape[0]
+        out = np.empty((count, self._base.shape[0]), dtype=self.dtype)
+        step = self._rows_per_block()
+        for start in range(0, count, step):
+            end = min(start + step, count)
+            out[start:end] = self._block(prepared[start:end],
+                                         None if query_norms is None else query_norms[start:end])
+        if queries is None and self.metric in ("euclidean", "manhattan"):
+            np.fill_diagonal(out, 0)
+        return out
+
+
+def pairwise_similarity(vectors, queries=None, metric: SimilarityMetric = "cosine",
+                        dtype: np.dtype = np.float32, chunk_size: int = 1024) -> np.ndarray:
+    """
+    一次计算相似度矩阵
+
+    参数:
+        vectors: (N×D) 向量矩阵
+        queries: (Q×D) 查询向量，为None时计算 vectors 两两之间的 (N×N) 矩阵
+        metric: 相似度度量，见 SimilarityEngine
+        dtype: 计算精度
+        chunk_size: 每块计算的查询行数上限
+
+    返回:
+        (Q×N) 或 (N×N) 的分数矩阵
+    """
+    return SimilarityEngine(vectors, metric, dtype, chunk_size).scores(queries)
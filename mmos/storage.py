@@ -0,0 +1,532 @@
+"""
+记忆持久化模块
+
+提供追加写日志（write-ahead log），每次变更只追加一条紧凑记录，
+由 MemoryManager 在达到阈值时压缩为完整快照。快照可以是 JSON，
+也可以是带版本头、可选压缩的二进制格式，两者可以互相转换。
+"""
+
+import json
+import logging
+import os
+import re
+import struct
+import sys
+import threading
+import time
+import zlib
+from typing import List, Dict, Any, Iterator, Iterable, Optional, Literal
+
+SnapshotFormat = Literal["json", "binary"]
+
+logger = logging.getLogger(__name__)
+
+
+class MemoryLog:
+    """追加写的记忆变更日志
+
+    每行一条 JSON 记录，支持以下操作：
+        {"op": "put", "memory": {...}}   新增或覆盖一条记忆
+        {"op": "delete", "id": "..."}    删除一条记忆
+        {"op": "clear"}                  清空全部记忆
+
+    压缩时先把当前日志轮转为 .compacting 文件，快照写完后再删除，
+    因此压缩过程中崩溃也不会丢失记录。
+    """
+
+    def __init__(self, path: str, fsync: bool = False):
+        """
+        初始化日志
+
+        参数:
+            path: 日志文件路径
+            fsync: 每次追加后是否调用 os.fsync 强制落盘
+        """
+        self.path = path
+        self.rotated_path = path + ".compacting"
+        self.fsync = fsync
+        self.count = 0  # 自上次压缩以来追加的记录数
+        self._file = None
+        self._lock = threading.Lock()
+
+    def exists(self) -> bool:
+        """是否存在尚未压缩的日志"""
+        return os.path.exists(self.path) or os.path.exists(self.rotated_path)
+
+    def _open(self):
+        if self._file is None:
+            self._file = open(self.path, "a", encoding="utf-8")
+        return self._file
+
+    def append_many(self, records: List[Dict[str, Any]]) -> None:
+        """追加多条记录，一次写入"""
+        if not records:
+            return
+        lines = "".join(
+            json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n"
+            for record in records
+        )
+        with self._lock:
+            f = self._open()
+            f.write(lines)
+            f.flush()
+            if self.fsync:
+                os.fsync(f.fileno())
+            self.count += len(records)
+
+    def append(self, record: Dict[str, Any]) -> None:
+        """追加一条记录"""
+        self.append_many([record])
+
+    def rotate(self) -> None:
+        """将当前日志轮转为待压缩文件，之后的记录写入新日志"""
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+            if os.path.exists(self.path):
+                if os.path.exists(self.rotated_path):
+                    # 上一次压缩未完成，把新记录接在旧的待压缩记录之后
+                    with open(self.path, "r", encoding="utf-8") as src, \
+                            open(self.rotated_path, "a", encoding="utf-8") as dst:
+                        dst.write(src.read())
+                    os.remove(self.path)
+                else:
+                    os.replace(self.path, self.rotated_path)
+            self.count = 0
+
+    def discard_rotated(self) -> None:
+        """快照写入完成后删除待压缩文件"""
+        if os.path.exists(self.rotated_path):
+            os.remove(self.rotated_path)
+
+    def replay(self) -> Iterator[Dict[str, Any]]:
+        """
+        按写入顺序读取全部记录（先待压缩文件，再当前日志）
+
+        读取完成后 count 为读到的记录数：这些记录都尚未并入快照，
+        重新打开的日志据此继续计算距离下次压缩还有多少条。
+        """
+        self.count = 0
+        for path in (self.rotated_path, self.path):
+            if not os.path.exists(path):
+                continue
+            with open(path, "r", encoding="utf-8") as f:
+                for line_no, line in enumerate(f, 1):
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError as e:
+                        # 末尾可能是崩溃时写了一半的记录
+                        logger.warning("跳过损坏的日志记录 %s:%d: %s", path, line_no, e)
+                        continue
+                    self.count += 1
+                    yield record
+
+    def close(self) -> None:
+        """关闭日志文件"""
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+# 二进制快照
+#
+# 文件头（不压缩）: 魔数 MMOSSNAP | 版本 u16 | 压缩方式 u8 | 保留 u8 | last_saved f64
+# 其后是（可能经过压缩的）记录流，每条记录为 u32 长度 + 内容：
+#     标志 u8
+#     标志含 JSON 时：其余部分是整条记忆字典的 JSON
+#     否则：ID（整数ID为 i64，字符串ID为 u32 长度 + UTF-8）
+#           内容（u32 长度 + UTF-8）
+#           标签数 u32，每个标签 u32 长度 + UTF-8
+#           元数据（u32 长度 + JSON，长度为0表示空字典）
+#           importance、created_at、last_accessed f64，access_count i64
+# 字段类型不符合紧凑编码时（如整数形式的 importance）整条记录退回 JSON，
+# 因此解码结果与 JSON 快照中的记忆字典完全一致。
+
+SNAPSHOT_VERSION = 1
+_MAGIC = b"MMOSSNAP"
+_HEADER = struct.Struct("<8sHBxd")
+_LENGTH = struct.Struct("<I")
+_INT_ID = struct.Struct("<q")
+_NUMBERS = struct.Struct("<dddq")
+_COMPRESSIONS = {None: 0, "zlib": 1, "zstd": 2}
+_COMPRESSION_NAMES = {code: name for name, code in _COMPRESSIONS.items()}
+_FLAG_INT_ID = 1
+_FLAG_JSON = 2
+_FIELDS = ("id", "content", "tags", "metadata", "importance",
+           "created_at", "last_accessed", "access_count")
+_INT64_MIN, _INT64_MAX = -(1 << 63), (1 << 63) - 1
+_CHUNK_SIZE = 1 << 20
+# 直接复用编解码器对象，省去 json.dumps/json.loads 每次调用的参数处理
+_encode_json = json.JSONEncoder(ensure_ascii=False, separators=(",", ":")).encode
+_decode_json = json.JSONDecoder().decode
+_raw_decode_json = json.JSONDecoder().raw_decode
+_WHITESPACE = re.compile(r"[ \t\n\r]*")
+# 数字后面可能接续的字符：块在小数点或指数处截断时，已读到的只是数字的前缀
+_NUMBER_TAIL = re.compile(r"[0-9.eE+\-]*")
+
+
+def _is_int64(value: Any) -> bool:
+    return type(value) is int and _INT64_MIN <= value <= _INT64_MAX
+
+
+def _is_compact(data: Dict[str, Any]) -> bool:
+    """记忆字典能否无损地使用紧凑编码"""
+    return (
+        tuple(data) == _FIELDS
+        and (type(data["id"]) is str or _is_int64(data["id"]))
+        and type(data["content"]) is str
+        and type(data["tags"]) is list
+        and all(type(tag) is str for tag in data["tags"])
+        and type(data["metadata"]) is dict
+        and type(data["importance"]) is float
+        and type(data["created_at"]) is float
+        and type(data["last_accessed"]) is float
+        and _is_int64(data["access_count"])
+    )
+
+
+def _pack_str(text: str) -> bytes:
+    raw = text.encode("utf-8")
+    return _LENGTH.pack(len(raw)) + raw
+
+
+def _encode_record(data: Dict[str, Any]) -> bytes:
+    """把一条记忆字典编码为带长度前缀的记录"""
+    if not _is_compact(data):
+        payload = bytes((_FLAG_JSON,)) + _encode_json(data).encode("utf-8")
+        return _LENGTH.pack(len(payload)) + payload
+    memory_id = data["id"]
+    if type(memory_id) is int:
+        parts = [bytes((_FLAG_INT_ID,)), _INT_ID.pack(memory_id)]
+    else:
+        parts = [b"\x00", _pack_str(memory_id)]
+    tags = data["tags"]
+    metadata = data["metadata"]
+    parts.append(_pack_str(data["content"]))
+    parts.append(_LENGTH.pack(len(tags)))
+    parts.extend(_pack_str(tag) for tag in tags)
+    parts.append(_pack_str(_encode_json(metadata)) if metadata else _LENGTH.pack(0))
+    parts.append(_NUMBERS.pack(data["importance"], data["created_at"],
+                               data["last_accessed"], data["access_count"]))
+    payload = b"".join(parts)
+    return _LENGTH.pack(len(payload)) + payload
+
+
+def _decode_record(payload: bytes) -> Dict[str, Any]:
+    """解码一条记录（不含长度前缀）"""
+    flags = payload[0]
+    if flags & ~(_FLAG_INT_ID | _FLAG_JSON):
+        raise ValueError(f"无法识别的快照记录标志: {flags}")
+    if flags & _FLAG_JSON:
+        return _decode_json(payload[1:].decode("utf-8"))
+    unpack_length = _LENGTH.unpack_from
+    if flags & _FLAG_INT_ID:
+        memory_id = _INT_ID.unpack_from(payload, 1)[0]
+        pos = 9
+    else:
+        size = unpack_length(payload, 1)[0]
+        memory_id = payload[5:5 + size].decode("utf-8")
+        pos = 5 + size
+    size = unpack_length(payload, pos)[0]
+    pos += 4
+    content = payload[pos:pos + size].decode("utf-8")
+    pos += size
+    count = unpack_length(payload, pos)[0]
+    pos += 4
+    tags = []
+    for _ in range(count):
+        size = unpack_length(payload, pos)[0]
+        pos += 4
+        tags.append(payload[pos:pos + size].decode("utf-8"))
+        pos += size
+    size = unpack_length(payload, pos)[0]
+    pos += 4
+    metadata = _decode_json(payload[pos:pos + size].decode("utf-8")) if size else {}
+    pos += size
+    importance, created_at, last_accessed, access_count = _NUMBERS.unpack_from(payload, pos)
+    return {
+        "id": memory_id,
+        "content": content,
+        "tags": tags,
+        "metadata": metadata,
+        "importance": importance,
+        "created_at": created_at,
+        "last_accessed": last_accessed,
+        "access_count": access_count
+    }
+
+
+def _zstandard() -> Any:
+    """导入可选依赖 zstandard，仅在使用 zstd 压缩时需要；未安装时抛出 ValueError"""
+    try:
+        import zstandard
+    except ImportError as e:
+        raise ValueError("zstd 压缩的快照需要安装 zstandard") from e
+    return zstandard
+
+
+def _zstd_errors() -> tuple:
+    """zstandard 的解压错误类型；尚未导入 zstandard 时不会出现，返回空元组"""
+    zstandard = sys.modules.get("zstandard")
+    return (zstandard.ZstdError,) if zstandard is not None else ()
+
+
+def _compressor(compression: Optional[str]) -> Any:
+    if compression == "zlib":
+        return zlib.compressobj()
+    if compression == "zstd":
+        return _zstandard().ZstdCompressor().compressobj()
+    return None
+
+
+def _decompressor(compression: Optional[str]) -> Any:
+    if compression == "zlib":
+        return zlib.decompressobj()
+    if compression == "zstd":
+        return _zstandard().ZstdDecompressor().decompressobj()
+    return None
+
+
+def check_snapshot_options(fmt: str, compression: Optional[str]) -> None:
+    """校验快照格式与压缩方式的组合，不支持时抛出 ValueError"""
+    if fmt not in ("json", "binary"):
+        raise ValueError(f"不支持的快照格式: {fmt}")
+    if compression not in _COMPRESSIONS:
+        raise ValueError(f"不支持的压缩方式: {compression}")
+    if compression is not None and fmt != "binary":
+        raise ValueError("只有二进制快照支持压缩")
+
+
+def is_binary_snapshot(path: str) -> bool:
+    """根据文件头判断快照是否为二进制格式"""
+    with open(path, "rb") as f:
+        return f.read(len(_MAGIC)) == _MAGIC
+
+
+def write_snapshot(path: str, memories: Iterable[Dict[str, Any]],
+                   fmt: SnapshotFormat = "json",
+                   compression: Optional[str] = None,
+                   last_saved: Optional[float] = None) -> None:
+    """
+    原子地写入记忆快照
+
+    二进制格式逐条编码并分块写出，不需要把整个文件内容放在内存中。
+
+    参数:
+        path: 快照路径
+        memories: 记忆字典（Memory.to_dict() 的结果）
+        fmt: 快照格式，"json" 或 "binary"
+        compression: 二进制快照的压缩方式，None、"zlib" 或 "zstd"（需要安装 zstandard）
+        last_saved: 写入时间戳，默认为 time.time()
+    """
+    check_snapshot_options(fmt, compression)
+    last_saved = time.time() if last_saved is None else last_saved
+    tmp_path = path + ".tmp"
+    if fmt == "json":
+        data = {
+            "memories": {memory["id"]: memory for memory in memories},
+            "last_saved": last_saved
+        }
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, path)
+        return
+
+    compressor = _compressor(compression)
+    with open(tmp_path, "wb") as f:
+        f.write(_HEADER.pack(_MAGIC, SNAPSHOT_VERSION, _COMPRESSIONS[compression], last_saved))
+        pending: List[bytes] = []
+        pending_size = 0
+
+        def flush() -> None:
+            chunk = b"".join(pending)
+            pending.clear()
+            f.write(compressor.compress(chunk) if compressor else chunk)
+
+        for memory in memories:
+            record = _encode_record(memory)
+            pending.append(record)
+            pending_size += len(record)
+            if pending_size >= _CHUNK_SIZE:
+                flush()
+                pending_size = 0
+        flush()
+        if compressor:
+            f.write(compressor.flush())
+    os.replace(tmp_path, path)
+
+
+def _read_chunks(f: Any, compression: Optional[str]) -> Iterator[bytes]:
+    """按块读取并解压记录流"""
+    decompressor = _decompressor(compression)
+    while True:
+        raw = f.read(_CHUNK_SIZE)
+        if not raw:
+            break
+        chunk = decompressor.decompress(raw) if decompressor else raw
+        if chunk:
+            yield chunk
+    if decompressor and hasattr(decompressor, "flush"):
+        tail = decompressor.flush()
+        if tail:
+            yield tail
+
+
+def _iter_binary(path: str) -> Iterator[Dict[str, Any]]:
+    with open(path, "rb") as f:
+        header = f.read(_HEADER.size)
+        if len(header) < _HEADER.size:
+            raise ValueError(f"快照文件头不完整: {path}")
+        magic, version, compression, _ = _HEADER.unpack(header)
+        if magic != _MAGIC:
+            raise ValueError(f"不是二进制快照: {path}")
+        if version > SNAPSHOT_VERSION:
+            raise ValueError(f"不支持的快照版本 {version}，当前最高支持 {SNAPSHOT_VERSION}")
+        if compression not in _COMPRESSION_NAMES:
+            raise ValueError(f"无法识别的快照压缩方式: {compression}")
+
+        buffer = b""
+        pos = 0
+        for chunk in _read_chunks(f, _COMPRESSION_NAMES[compression]):
+            buffer = buffer[pos:] + chunk
+            pos = 0
+            end = len(buffer)
+            while end - pos >= 4:
+                size = _LENGTH.unpack_from(buffer, pos)[0]
+                if end - pos - 4 < size:
+                    break
+                yield _decode_record(buffer[pos + 4:pos + 4 + size])
+                pos += 4 + size
+        if pos != len(buffer):
+            raise ValueError(f"快照文件不完整: {path}")
+
+
+class _JSONStream:
+    """在分块读取的文本上逐个解析 JSON 值，不需要把整个文件读入内存"""
+
+    def __init__(self, f: Any):
+        self._f = f
+        self._buffer = ""
+        self._pos = 0
+        self._eof = False
+
+    def _fill(self) -> bool:
+        """再读入一块文本，已到文件末尾时返回False"""
+        if self._eof:
+            return False
+        chunk = self._f.read(_CHUNK_SIZE)
+        if not chunk:
+            self._eof = True
+            return False
+        self._buffer = self._buffer[self._pos:] + chunk
+        self._pos = 0
+        return True
+
+    def peek(self) -> str:
+        """跳过空白，返回下一个字符，文件结束时返回空串"""
+        while True:
+            self._pos = _WHITESPACE.match(self._buffer, self._pos).end()
+            if self._pos < len(self._buffer):
+                return self._buffer[self._pos]
+            if not self._fill():
+                return ""
+
+    def expect(self, char: str) -> None:
+        """读取一个指定的结构字符"""
+        found = self.peek()
+        if found != char:
+            raise ValueError(f"快照格式错误：期望 {char!r}，实际为 {found or '文件结尾'!r}")
+        self._pos += 1
+
+    def accept(self, char: str) -> bool:
+        """下一个字符是 char 时读取它并返回True"""
+        if self.peek() == char:
+            self._pos += 1
+            return True
+        return False
+
+    def value(self) -> Any:
+        """解析下一个完整的 JSON 值"""
+        self.peek()
+        while True:
+            try:
+                value, end = _raw_decode_json(self._buffer, self._pos)
+            except json.JSONDecodeError:
+                # 值跨越了块边界，读入下一块后重试
+                if self._fill():
+                    continue
+                raise
+            # 数字在块末尾结束，或块恰好截断在小数点、指数处时，需要读入下一块确认
+            if (isinstance(value, (int, float)) and _NUMBER_TAIL.fullmatch(self._buffer, end)
+                    and self._fill()):
+                continue
+            self._pos = end
+            return value
+
+
+def _iter_json(path: str) -> Iterator[Dict[str, Any]]:
+    """逐条解析 JSON 快照 {"memories": {id: 记忆字典, ...}, ...} 中的记忆"""
+    with open(path, "r", encoding="utf-8") as f:
+        stream = _JSONStream(f)
+        stream.expect("{")
+        if stream.accept("}"):
+            return
+        while True:
+            key = stream.value()
+            stream.expect(":")
+            if key == "memories":
+                stream.expect("{")
+                if not stream.accept("}"):
+                    while True:
+                        stream.value()
+                        stream.expect(":")
+                        yield stream.value()
+                        if not stream.accept(","):
+                            break
+                    stream.expect("}")
+            else:
+                stream.value()
+            if not stream.accept(","):
+                break
+        stream.expect("}")
+
+
+def iter_snapshot(path: str) -> Iterator[Dict[str, Any]]:
+    """
+    按写入顺序逐条读取快照中的记忆字典，自动识别 JSON 与二进制格式
+
+    两种格式都是边读边解析，内存占用与快照大小无关。
+
+    参数:
+        path: 快照路径
+
+    返回:
+        记忆字典的迭代器
+    """
+    if is_binary_snapshot(path):
+        try:
+            yield from _iter_binary(path)
+        except (struct.error, UnicodeDecodeError, zlib.error, *_zstd_errors()) as e:
+            raise ValueError(f"快照文件已损坏: {path}: {e}") from e
+        return
+    yield from _iter_json(path)
+
+
+def convert_snapshot(src_path: str, dst_path: str,
+                     fmt: SnapshotFormat = "binary",
+                     compression: Optional[str] = None) -> None:
+    """
+    在 JSON 与二进制快照之间转换
+
+    参数:
+        src_path: 源快照路径（任一格式）
+        dst_path: 目标快照路径，可以与源路径相同
+        fmt: 目标格式
+        compression: 目标为二进制快照时的压缩方式
+    """
+    write_snapshot(dst_path, iter_snapshot(src_path), fmt, compression)
@@ -0,0 +1,237 @@
+"""
+记忆数值属性的列式存储
+
+MemoryTable 把重要性、创建时间、最近访问时间和访问次数保存为按行对齐的
+NumPy 数组，按这些属性过滤、打分和衰减时可以对整列做向量化计算，
+不必逐个遍历记忆对象。
+"""
+
+from typing import List, Dict, Any, Optional, Iterable, Tuple, TYPE_CHECKING
+
+import numpy as np
+
+from .models import Memory, MemoryId
+
+if TYPE_CHECKING:
+    from .filters import MemoryFilter
+
+
+class MemoryTable:
+    """记忆数值属性的列式表
+
+    删除时把最后一行移到空出的位置，各列始终保持紧凑；
+    ordinal 列记录插入序号，用于按插入顺序返回结果。
+    """
+
+    def __init__(self, capacity: int = 0):
+        """
+        初始化属性表
+
+        参数:
+            capacity: 预分配的行数
+        """
+        self._size = 0
+        self._row_ids: List[MemoryId] = []
+        self._id_to_row: Dict[MemoryId, int] = {}
+        self._next_ordinal = 0
+        self._allocate(capacity)
+
+    def _allocate(self, capacity: int) -> None:
+        self._importance = np.zeros(capacity, dtype=np.float64)
+        self._created_at = np.zeros(capacity, dtype=np.float64)
+        self._last_accessed = np.zeros(capacity, dtype=np.float64)
+        self._access_count = np.zeros(capacity, dtype=np.int64)
+        self._ordinal = np.zeros(capacity, dtype=np.int64)
+
+    def _reserve(self, capacity: int) -> None:
+        """保证各列至少能容纳 capacity 行，按倍数扩容"""
+        if capacity <= self._importance.shape[0]:
+            return
+        capacity = max(capacity, 2 * self._importance.shape[0], 64)
+        for name in ("_importance", "_created_at", "_last_accessed", "_access_count", "_ordinal"):
+            old = getattr(self, name)
+            column = np.zeros(capacity, dtype=old.dtype)
+            column[:self._size] = old[:self._size]
+            setattr(self, name, column)
+
+    def __len__(self) -> int:
+        return self._size
+
+    def __contains__(self, memory_id: MemoryId) -> bool:
+        return memory_id in self._id_to_row
+
+    @property
+    def importance(self) -> np.ndarray:
+        """各行的重要性（只读视图）"""
+        return self._view(self._importance)
+
+    @property
+    def created_at(self) -> np.ndarray:
+        """各行的创建时间（只读视图）"""
+        return self._view(self._created_at)
+
+    @property
+    def last_accessed(self) -> np.ndarray:
+        """各行的最近访问时间（只读视图）"""
+        return self._view(self._last_accessed)
+
+    @property
+    def access_count(self) -> np.ndarray:
+        """各行的访问次数（只读视图）"""
+        return self._view(self._access_count)
+
+    def _view(self, column: np.ndarray) -> np.ndarray:
+        view = column[:self._size]
+        view.flags.writeable = False
+        return view
+
+    def put(self, memory: Memory) -> None:
+        """
+        写入一条记忆的属性，已存在时覆盖，并把记忆关联到本表
+
+        关联后记忆的 access() 与 update_importance() 会同步更新本表。
+
+        参数:
+            memory: 记忆对象
+        """
+        self._write(self._row(memory.id), memory)
+        memory._table = self
+
+    def put_record(self, record: Tuple[Any, ...]) -> None:
+        """写入一条原始记录元组（按 RECORD_FIELDS 排列）的属性，已存在时覆盖"""
+        memory_id, _, _, _, importance, created_at, last_accessed, access_count = record
+        row = self._row(memory_id)
+        self._importance[row] = importance
+        self._created_at[row] = created_at
+        self._last_accessed[row] = last_accessed
+        self._access_count[row] = access_count
+
+    def _row(self, memory_id: MemoryId) -> int:
+        """记忆所在的行，不存在时追加一行"""
+        row = self._id_to_row.get(memory_id)
+        if row is None:
+            row = self._size
+            self._reserve(row + 1)
+            self._size += 1
+            self._row_ids.append(memory_id)
+            self._id_to_row[memory_id] = row
+            self._ordinal[row] = self._next_ordinal
+            self._next_ordinal += 1
+        return row
+
+    def _write(self, row: int, memory: Memory) -> None:
+        self._importance[row] = memory.importance
+        self._created_at[row] = memory.created_at
+        self._last_accessed[row] = memory.last_accessed
+        self._access_count[row] = memory.access_count
+
+    def refresh(self, memory: Memory) -> None:
+        """记忆的属性变化后同步到本表，记忆不在表中时忽略"""
+        row = self._id_to_row.get(memory.id)
+        if row is not None:
+            self._write(row, memory)
+
+    def remove(self, memory_id: MemoryId) -> bool:
+        """
+        移除一条记忆的属性
+
+        参数:
+            memory_id: 记忆ID
+
+        返回:
+            是否曾经存在
+        """
+        row = self._id_to_row.pop(memory_id, None)
+        if row is None:
+            return False
+        last = self._size - 1
+        if row != last:
+            moved = self._row_ids[last]
+            self._row_ids[row] = moved
+            self._id_to_row[moved] = row
+            for column in (self._importance, self._created_at, self._last_accessed,
+                           self._access_count, self._ordinal):
+                column[row] = column[last]
+        self._row_ids.pop()
+        self._size = last
+        return True
+
+    def clear(self) -> None:
+        """清空表"""
+        self._size = 0
+        self._row_ids = []
+        self._id_to_row = {}
+        self._next_ordinal = 0
+        self._allocate(0)
+
+    def extend(self, memories: Iterable[Memory]) -> None:
+        """按顺序写入多条记忆"""
+        memories = list(memories)
+        self._reserve(self._size + len(memories))
+        for memory in memories:
+            self.put(memory)
+
+    def ids(self, rows: Optional[np.ndarray] = None) -> List[MemoryId]:
+        """
+        把行号转换为记忆ID，按插入顺序排列
+
+        参数:
+            rows: 行号数组，为None时表示全部行
+
+        返回:
+            记忆ID列表
+        """
+        if rows is None:
+            rows = np.arange(self._size)
+        rows = rows[np.argsort(self._ordinal[rows], kind="stable")]
+        row_ids = self._row_ids
+        return [row_ids[row] for row in rows.tolist()]
+
+    def in_order(self, memory_ids: Iterable[MemoryId]) -> List[MemoryId]:
+        """将表中的记忆ID按插入顺序排列"""
+        id_to_row = self._id_to_row
+        rows = np.fromiter((id_to_row[memory_id] for memory_id in memory_ids), dtype=np.int64)
+        return self.ids(rows)
+
+    def select(self, memory_filter: "MemoryFilter") -> np.ndarray:
+        """
+        按过滤条件中的创建时间与重要性范围选出行号
+
+        标签与元数据条件不在本表中，由调用方另行处理。
+
+        参数:
+            memory_filter: 过滤条件
+
+        返回:
+            满足条件的行号数组
+        """
+        size = self._size
+        mask = np.ones(size, dtype=bool)
+        if memory_filter.created_after is not None:
+            mask &= self._created_at[:size] >= memory_filter.created_after
+        if memory_filter.created_before is not None:
+            mask &= self._created_at[:size] < memory_filter.created_before
+        if memory_filter.min_importance is not None:
+            mask &= self._importance[:size] >= memory_filter.min_importance
+        if memory_filter.max_importance is not None:
+            mask &= self._importance[:size] <= memory_filter.max_importance
+        return np.flatnonzero(mask)
+
+    def retention_scores(self, half_life: float, now: float) -> np.ndarray:
+        """
+        各行的保留分数：重要性按距最近访问的时间指数衰减
+
+        分数为 importance * 0.5 ** (距最近访问的秒数 / half_life)。
+
+        参数:
+            half_life: 半衰期（秒）
+            now: 当前时间戳
+
+        返回:
+            与行对齐的分数数组
+        """
+        if half_life <= 0:
+            raise ValueError("半衰期必须大于0")
+        size = self._size
+        elapsed = np.maximum(now - self._last_accessed[:size], 0.0)
+        return self._importance[:size] * np.exp2(-elapsed / half_life)
@@ -0,0 +1,358 @@
+"""
+多租户记忆系统
+
+一个进程内托管多个用户/会话的记忆，每个租户对应一个独立的 MMOSMemorySystem 分片。
+分片在首次访问时才加载，超过 max_loaded_tenants 时按 LRU 顺序把最久未使用的
+空闲租户落盘并卸载，常驻内存的分片数因此有上界。正在使用（持有租约）的租户
+不会被卸载，所有租户都在使用时已加载的分片数可以暂时超过上限。
+"""
+
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import List, Dict, Any, Optional, Iterable, Iterator, Union, Tuple
+
+from .aio import run_blocking
+from .config import MMOSConfig
+from .memory_factory import MMOSMemorySystem
+from .memory_manager import MemoryManager
+from .models import Memory
+
+
+class QuotaExceededError(ValueError):
+    """租户的记忆数或向量数超过配额"""
+
+
+class _Tenant:
+    """已加载的租户分片与租约计数"""
+
+    __slots__ = ("system", "leases")
+
+    def __init__(self, system: MMOSMemorySystem):
+        self.system = system
+        self.leases = 0
+
+
+class TenantMemorySystem:
+    """按租户分片的记忆系统
+
+    每个租户的数据存放在 data_path 下以租户ID哈希命名的目录中：
+        memories.json(.log)  记忆快照与追加日志
+        vectors/             启用长期记忆时的磁盘分段向量，重新加载时无需重新嵌入
+    未指定 data_path 时所有租户常驻内存，不做卸载。
+    所有分片共用同一个检索线程池。配额在分片的记忆管理器写入时检查，
+    经 tenant() 或 lease() 取得的分片直接写入时同样受限。
+    """
+
+    def __init__(self, config: Optional[MMOSConfig] = None,
+                 data_path: Optional[str] = None,
+                 max_loaded_tenants: int = 1000,
+                 max_memories_per_tenant: Optional[int] = None,
+                 max_vectors_per_tenant: Optional[int] = None,
+                 retrieval_workers: int = 4):
+        """
+        初始化多租户记忆系统
+
+        参数:
+            config: 所有租户共用的 MMOS 配置
+            data_path: 租户数据根目录，为None时仅在内存中存储且不卸载
+            max_loaded_tenants: 同时加载的租户数上限
+            max_memories_per_tenant: 每个租户的记忆数配额，None表示不限制
+            max_vectors_per_tenant: 每个租户的向量数配额，None表示不限制
+            retrieval_workers: 共用检索线程池的线程数
+        """
+        self.config = config or MMOSConfig()
+        self.data_path = data_path
+        self.max_loaded_tenants = max_loaded_tenants
+        self.max_memories_per_tenant = max_memories_per_tenant
+        self.max_vectors_per_tenant = max_vectors_per_tenant
+        self._tenants: "OrderedDict[str, _Tenant]" = OrderedDict()
+        # 正在加载或卸载的租户 -> 完成事件；磁盘读写在 _lock 之外进行，
+        # 同一租户的加载要等卸载完成，不会有两个实例同时读写同一目录
+        self._busy: Dict[str, threading.Event] = {}
+        self._lock = threading.RLock()
+        self._executor = ThreadPoolExecutor(max_workers=retrieval_workers,
+                                            thread_name_prefix="mmos-retrieval")
+        if data_path:
+            os.makedirs(data_path, exist_ok=True)
+
+    def _tenant_dir(self, tenant_id: str) -> str:
+        """租户数据目录，按哈希前两位分桶，避免单个目录下文件过多"""
+        digest = hashlib.sha256(tenant_id.encode("utf-8")).hexdigest()
+        return os.path.join(self.data_path, digest[:2], digest[2:34])
+
+    def _tenant_config(self, directory: str) -> MMOSConfig:
+        """为租户生成配置：长期记忆的向量存放到租户自己的目录"""
+        config = self.config.model_copy(deep=True)
+        long_memory = config.modules.get("long_memory")
+        if long_memory is not None and long_memory.enabled:
+            params = dict(long_memory.params or {})
+            params["persist_directory"] = os.path.join(directory, "vectors")
+            long_memory.params = params
+        return config
+
+    def _load(self, tenant_id: str) -> MMOSMemorySystem:
+        if not self.data_path:
+            system = MMOSMemorySystem(self.config, executor=self._executor)
+        else:
+            directory = self._tenant_dir(tenant_id)
+            os.makedirs(directory, exist_ok=True)
+            memory_manager = MemoryManager(os.path.join(directory, "memories.json"))
+            system = MMOSMemorySystem(self._tenant_config(directory), memory_manager, self._executor)
+        if self.max_memories_per_tenant is not None or self.max_vectors_per_tenant is not None:
+            system.memory_manager.add_store_guard(lambda: self._check_quota(tenant_id, system))
+        return system
+
+    def _acquire(self, tenant_id: str) -> _Tenant:
+        """为租户增加一个租约，未加载时在锁外加载，并卸载超出上限的空闲租户"""
+        while True:
+            with self._lock:
+                entry = self._tenants.get(tenant_id)
+                if entry is not None:
+                    self._tenants.move_to_end(tenant_id)
+                    entry.leases += 1
+                    return entry
+                busy = self._busy.get(tenant_id)
+                if busy is None:
+                    busy = self._busy[tenant_id] = threading.Event()
+                    break
+            busy.wait()
+        
+        try:
+            system = self._load(tenant_id)
+        except BaseException:
+            with self._lock:
+                del self._busy[tenant_id]
+            busy.set()
+            raise
+        with self._lock:
+            entry = _Tenant(system)
+            entry.leases = 1
+            self._tenants[tenant_id] = entry
+            del self._busy[tenant_id]
+            cold = self._take_cold()
+        busy.set()
+        self._close(cold)
+        return entry
+    
+    def _try_acquire(self, tenant_id: str) -> Optional[_Tenant]:
+        """租户已加载时增加一个租约，否则返回None（不做磁盘读写）"""
+        with self._lock:
+            entry = self._tenants.get(tenant_id)
+            if entry is not None:
+                self._tenants.move_to_end(tenant_id)
+                entry.leases += 1
+            return entry
+    
+    def _release(self, entry: _Tenant) -> List[Tuple[str, _Tenant, threading.Event]]:
+        """归还一个租约，返回因此可以卸载的租户（由调用方在锁外关闭）"""
+        with self._lock:
+            entry.leases -= 1
+            return self._take_cold()
+    
+    def _take_cold(self) -> List[Tuple[str, _Tenant, threading.Event]]:
+        """在持有 _lock 时取出超出上限的最久未使用的空闲租户，并标记为正在卸载"""
+        cold = []
+        if not self.data_path:
+            return cold
+        excess = len(self._tenants) - self.max_loaded_tenants
+        for tenant_id, entry in list(self._tenants.items()):
+            if excess <= 0:
+                break
+            if entry.leases:
+                continue
+            del self._tenants[tenant_id]
+            busy = self._busy[tenant_id] = threading.Event()
+            cold.append((tenant_id, entry, busy))
+            excess -= 1
+        return cold
+    
+    def _close(self, cold: List[Tuple[str, _Tenant, threading.Event]]) -> None:
+        """落盘并关闭 _take_cold 取出的租户"""
+        for tenant_id, entry, busy in cold:
+            try:
+                entry.system.close()
+            finally:
+                with self._lock:
+                    del self._busy[tenant_id]
+                busy.set()
+    
+    @contextmanager
+    def lease(self, tenant_id: str) -> Iterator[MMOSMemorySystem]:
+        """
+        在块内持有租户的记忆系统，期间该租户不会被卸载
+        
+        用法:
+            with tenants.lease("user-1") as system:
+                system.store_memory("...")
+                system.retrieve_memory("...")
+        
+        参数:
+            tenant_id: 租户ID（用户或会话标识）
+        """
+        entry = self._acquire(tenant_id)
+        try:
+            yield entry.system
+        finally:
+            self._close(self._release(entry))
+    
+    def tenant(self, tenant_id: str) -> MMOSMemorySystem:
+        """
+        获取租户的记忆系统，未加载时从磁盘加载
+        
+        返回的分片之后可能因 LRU 被卸载，需要跨多次调用持有时使用 lease()。
+
+        参数:
+            tenant_id: 租户ID（用户或会话标识）
+
+        返回:
+            该租户的 MMOSMemorySystem
+        """
+        with self.lease(tenant_id) as system:
+            return system
+
+    def evict(self, tenant_id: str) -> bool:
+        """
+        将租户落盘并卸载；未指定 data_path、租户未加载或仍有租约时不卸载
+        
+        返回:
+            是否已卸载
+        """
+        if not self.data_path:
+            return False
+        with self._lock:
+            entry = self._tenants.get(tenant_id)
+            if entry is None or entry.leases:
+                return False
+            del self._tenants[tenant_id]
+            busy = self._busy[tenant_id] = threading.Event()
+        self._close([(tenant_id, entry, busy)])
+        return True
+
+    @property
+    def loaded_tenants(self) -> List[str]:
+        """当前已加载的租户，按最近使用从旧到新排列"""
+        with self._lock:
+            return list(self._tenants)
+
+    def _check_quota(self, tenant_id: str, system: MMOSMemorySystem) -> None:
+        """记忆管理器写入一条新记忆前检查配额（写入前检查，持有管理器锁时调用）"""
+        count = system.memory_manager.count()
+        limit = self.max_memories_per_tenant
+        if limit is not None and count + 1 > limit:
+            raise QuotaExceededError(f"租户 {tenant_id} 的记忆数超过配额 {limit}")
+        limit = self.max_vectors_per_tenant
+        if limit is None or "long_memory" not in self.config.get_active_modules():
+            return
+        vector_store = system._loaded_vector_store()
+        if vector_store is None:
+            # 延迟加载的长期记忆模块初始化时会为全部记忆补充向量，不必为此提前初始化
+            vectors = count
+        else:
+            # 已存储的向量，加上批量写入中尚未建立向量的新记忆
+            vectors = len(vector_store) + len(system._pending_memories or ())
+        if vectors + 1 > limit:
+            raise QuotaExceededError(f"租户 {tenant_id} 的向量数超过配额 {limit}")
+
+    def store_memory(self, tenant_id: str, content: str, **kwargs) -> Memory:
+        """
+        为租户存储一条记忆
+
+        参数:
+            tenant_id: 租户ID
+            content: 记忆内容
+            **kwargs: 传给 MMOSMemorySystem.store_memory 的其他参数
+
+        返回:
+            存储的记忆对象
+        """
+        entry = self._acquire(tenant_id)
+        try:
+            return entry.system.store_memory(content, **kwargs)
+        finally:
+            self._close(self._release(entry))
+
+    def store_many(self, tenant_id: str,
+                   items: Iterable[Union[str, Dict[str, Any]]]) -> List[Memory]:
+        """为租户批量存储记忆，超过配额时整批拒绝"""
+        items = list(items)
+        entry = self._acquire(tenant_id)
+        try:
+            return entry.system.store_many(items)
+        finally:
+            self._close(self._release(entry))
+
+    def retrieve_memory(self, tenant_id: str, query: str, **kwargs):
+        """
+        在租户的记忆中检索
+
+        参数:
+            tenant_id: 租户ID
+            query: 查询字符串
+            **kwargs: 传给 MMOSMemorySystem.retrieve_memory 的其他参数
+
+        返回:
+            匹配的记忆列表
+        """
+        with self.lease(tenant_id) as system:
+            return system.retrieve_memory(query, **kwargs)
+
+    async def _aacquire(self, tenant_id: str) -> _Tenant:
+        """_acquire 的异步版本，加载与卸载分片的磁盘读写在线程池中执行"""
+        entry = self._try_acquire(tenant_id)
+        if entry is None:
+            entry = await run_blocking(None, self._acquire, tenant_id)
+        return entry
+
+    async def _arelease(self, entry: _Tenant) -> None:
+        cold = self._release(entry)
+        if cold:
+            await run_blocking(None, self._close, cold)
+
+    async def atenant(self, tenant_id: str) -> MMOSMemorySystem:
+        """tenant 的异步版本，加载与卸载分片的磁盘读写在线程池中执行"""
+        entry = await self._aacquire(tenant_id)
+        await self._arelease(entry)
+        return entry.system
+
+    async def astore_memory(self, tenant_id: str, content: str, **kwargs) -> Memory:
+        """store_memory 的异步版本"""
+        entry = await self._aacquire(tenant_id)
+        system = entry.system
+        try:
+            # 写锁使写入与该租户的异步检索互斥
+            async with system._get_async_lock().write():
+                return await run_blocking(None, lambda: system.store_memory(content, **kwargs))
+        finally:
+            await self._arelease(entry)
+
+    async def astore_many(self, tenant_id: str,
+                          items: Iterable[Union[str, Dict[str, Any]]]) -> List[Memory]:
+        """store_many 的异步版本"""
+        items = list(items)
+        entry = await self._aacquire(tenant_id)
+        system = entry.system
+        try:
+            async with system._get_async_lock().write():
+                return await run_blocking(None, system.store_many, items)
+        finally:
+            await self._arelease(entry)
+
+    async def aretrieve_memory(self, tenant_id: str, query: str, **kwargs):
+        """retrieve_memory 的异步版本"""
+        entry = await self._aacquire(tenant_id)
+        try:
+            return await entry.system.aretrieve_memory(query, **kwargs)
+        finally:
+            await self._arelease(entry)
+
+    def close(self) -> None:
+        """落盘并关闭所有已加载的租户，释放检索线程池"""
+        with self._lock:
+            tenants, self._tenants = self._tenants, OrderedDict()
+        for entry in tenants.values():
+            entry.system.close()
+        self._executor.shutdown(wait=True)
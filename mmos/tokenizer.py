@@ -0,0 +1,340 @@
+"""
+中文分词服务
+
+ChineseTokenizer 按“词 频次 [词性]”格式的词典（空格或制表符分隔，如 test/dict.txt）
+做基于词频的最大概率分词：为句子中的每个位置列出词典中以此开头的词，
+再用动态规划选出词频对数和最大的切分。词典只加载一次，解析结果以纯数据格式
+（词表文本 + 频次数组）缓存在当前用户私有的目录中，之后的进程（包括多个 worker）
+直接读取缓存；相同内容的分词结果也会缓存。
+
+get_tokenizer 返回按参数共享的进程内实例。多进程部署时可在 fork 之前调用
+preload()，子进程共享已加载的词典。
+"""
+
+import hashlib
+import json
+import math
+import os
+import re
+import stat
+import sys
+import tempfile
+import threading
+from array import array
+from collections import OrderedDict
+from typing import List, Dict, Tuple, Optional, Iterable, Union
+
+from .index import _CJK_RANGES, tokenize
+
+_CACHE_VERSION = 2
+# 中日韩字符片段、字母数字片段（允许小数点与百分号）、其余非空白符号
+_PIECES = re.compile(rf"(?P<cjk>[{_CJK_RANGES}]+)|(?P<word>[^\W_{_CJK_RANGES}]+(?:\.\d+)?%?)|(?P<other>[^\s\w])",
+                     re.UNICODE)
+
+
+def load_stopwords(source: Union[str, Iterable[str], None]) -> frozenset:
+    """
+    加载停用词
+
+    参数:
+        source: 停用词文件路径（每行一个，允许用单引号包裹），或停用词序列
+
+    返回:
+        停用词集合
+    """
+    if source is None:
+        return frozenset()
+    if isinstance(source, str):
+        with open(source, "r", encoding="utf-8") as f:
+            lines = f.read().splitlines()
+        words = []
+        for line in lines:
+            line = line.strip()
+            if len(line) >= 2 and line[0] == line[-1] == "'":
+                line = line[1:-1]
+            if line:
+                words.append(line)
+        return frozenset(words)
+    return frozenset(source)
+
+
+def default_cache_dir() -> str:
+    """词典缓存的默认目录：$XDG_CACHE_HOME/mmos，未设置时为 ~/.cache/mmos"""
+    base = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(base, "mmos")
+
+
+def _is_private(path: str) -> bool:
+    """路径属于当前用户且其他用户不可写（不支持用户ID的平台上总是成立）"""
+    if not hasattr(os, "getuid"):
+        return True
+    info = os.lstat(path)
+    return info.st_uid == os.getuid() and not info.st_mode & (stat.S_IWGRP | stat.S_IWOTH)
+
+
+def _read_cache(path: str, source: Tuple[int, int]) -> Optional[Dict[str, int]]:
+    """读取词典缓存，文件不属于当前用户、版本或来源不符、内容损坏时返回None"""
+    try:
+        if not _is_private(os.path.dirname(path)) or not _is_private(path):
+            return None
+        with open(path, "rb") as f:
+            header = json.loads(f.readline())
+            if header.get("version") != _CACHE_VERSION or header.get("source") != list(source):
+                return None
+            words = f.read(header["words_bytes"]).decode("utf-8").split("\n") if header["count"] else []
+            counts = array("q")
+            counts.frombytes(f.read())
+    except (OSError, ValueError, KeyError, TypeError, AttributeError):
+        return None
+    if len(words) != len(counts) or len(counts) != header["count"]:
+        return None
+    if sys.byteorder == "big":
+        counts.byteswap()
+    return dict(zip(words, counts))
+
+
+def _write_cache(path: str, source: Tuple[int, int], freq: Dict[str, int]) -> None:
+    """写入词典缓存：先写同目录下的临时文件再替换，多个进程同时重建时不会读到写了一半的文件"""
+    words = "\n".join(freq).encode("utf-8")
+    counts = array("q", freq.values())
+    if sys.byteorder == "big":
+        counts.byteswap()
+    header = {"version": _CACHE_VERSION, "source": list(source), "count": len(counts), "words_bytes": len(words)}
+    directory = os.path.dirname(path)
+    os.makedirs(directory, mode=0o700, exist_ok=True)
+    if not _is_private(directory):
+        return
+    fd, temp_path = tempfile.mkstemp(prefix=".dict_", dir=directory)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(json.dumps(header).encode("ascii") + b"\n")
+            f.write(words)
+            f.write(counts.tobytes())
+        os.replace(temp_path, path)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+
+
+class ChineseTokenizer:
+    """基于词典与词频的中文分词器
+
+    未登录词按单字切分，字母数字串整体保留，空白被丢弃。没有词典时中文部分
+    按相邻二元组切分（同 mmos.index.tokenize）。
+    """
+
+    def __init__(self, dict_path: Optional[str] = None,
+                 stopwords: Union[str, Iterable[str], None] = None,
+                 cache_dir: Optional[str] = None,
+                 cache_size: int = 10000):
+        """
+        初始化，词典在首次分词或调用 load() 时加载
+
+        参数:
+            dict_path: 词典文件路径，每行“词 频次 [词性]”
+            stopwords: 停用词文件路径或停用词序列，keywords() 会去掉这些词
+            cache_dir: 词典解析结果的缓存目录，默认为 default_cache_dir()；
+                目录或缓存文件不属于当前用户、或其他用户可写时不使用缓存
+            cache_size: 缓存的分词结果条数
+        """
+        self.dict_path = dict_path
+        self.stopwords = load_stopwords(stopwords)
+        self.cache_dir = cache_dir or default_cache_dir()
+        self.cache_size = cache_size
+        self._freq: Optional[Dict[str, int]] = None
+        self._log_total = 0.0
+        self._max_len = 1
+        self._lock = threading.Lock()
+        self._cache: "OrderedDict[str, Tuple[str, ...]]" = OrderedDict()
+        self.stats = {"calls": 0, "cache_hits": 0}
+
+    def _cache_path(self) -> str:
+        key = hashlib.blake2b(os.path.abspath(self.dict_path).encode("utf-8"), digest_size=8).hexdigest()
+        return os.path.join(self.cache_dir, f"dict_{key}.bin")
+
+    def load(self) -> "ChineseTokenizer":
+        """
+        加载词典（已加载时直接返回）
+
+        词典文件的大小与修改时间与缓存记录一致时读取缓存，否则解析词典并重写缓存。
+
+        返回:
+            分词器本身
+        """
+        if self._freq is not None:
+            return self
+        with self._lock:
+            if self._freq is not None:
+                return self
+            if self.dict_path is None:
+                freq: Dict[str, int] = {}
+            else:
+                freq = self._load_dictionary()
+            total = sum(freq.values())
+            self._log_total = math.log(total) if total > 0 else 0.0
+            self._max_len = max(map(len, freq), default=1)
+            self._freq = freq
+        return self
+
+    def _load_dictionary(self) -> Dict[str, int]:
+        info = os.stat(self.dict_path)
+        source = (info.st_size, info.st_mtime_ns)
+        cache_path = self._cache_path()
+        cached = _read_cache(cache_path, source)
+        if cached is not None:
+            return cached
+
+        freq: Dict[str, int] = {}
+        with open(self.dict_path, "r", encoding="utf-8") as f:
+            for line in f:
+                parts = line.split()
+                if not parts:
+                    continue
+                try:
+                    count = int(parts[1]) if len(parts) > 1 else 1
+                except ValueError:
+                    count = 1
+                freq[parts[0]] = freq.get(parts[0], 0) + max(count, 1)
+
+        try:
+            _write_cache(cache_path, source, freq)
+        except OSError:
+            pass  # 缓存只用于加速，写入失败时下次重新解析词典
+        return freq
+
+    def _cut_cjk(self, run: str, out: List[str]) -> None:
+        """最大概率路径切分一段中文"""
+        freq = self._freq
+        if not freq:
+            out.extend(tokenize(run))
+            return
+        length = len(run)
+        max_len = self._max_len
+        log_total = self._log_total
+        # best[i] = (从 i 到结尾的最大对数概率, 从 i 开始的词的结束位置)
+        best: List[Tuple[float, int]] = [(0.0, 0)] * (length + 1)
+        for start in range(length - 1, -1, -1):
+            # 单字总是候选，未登录的单字按频次1计
+            candidate = (math.log(freq.get(run[start], 1)) - log_total + best[start + 1][0], start + 1)
+            for end in range(start + 2, min(length, start + max_len) + 1):
+                count = freq.get(run[start:end])
+                if count:
+                    score = math.log(count) - log_total + best[end][0]
+                    if score > candidate[0]:
+                        candidate = (score, end)
+            best[start] = candidate
+        start = 0
+        while start < length:
+            end = best[start][1]
+            out.append(run[start:end])
+            start = end
+
+    def _cut(self, text: str) -> Tuple[str, ...]:
+        words: List[str] = []
+        for match in _PIECES.finditer(text):
+            run = match.group("cjk")
+            if run is not None:
+                self._cut_cjk(run, words)
+            else:
+                words.append(match.group().lower())
+        return tuple(words)
+
+    def cut(self, text: str) -> List[str]:
+        """
+        分词，相同内容的结果会被缓存
+
+        参数:
+            text: 文本
+
+        返回:
+            词列表
+        """
+        self.load()
+        with self._lock:
+            self.stats["calls"] += 1
+            words = self._cache.get(text)
+            if words is not None:
+                self._cache.move_to_end(text)
+                self.stats["cache_hits"] += 1
+                return list(words)
+        words = self._cut(text)
+        with self._lock:
+            self._cache[text] = words
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return list(words)
+
+    def cut_batch(self, texts: Iterable[str]) -> List[List[str]]:
+        """
+        批量分词，批内重复的内容只切分一次
+
+        参数:
+            texts: 文本序列
+
+        返回:
+            与 texts 对齐的词列表
+        """
+        results: Dict[str, List[str]] = {}
+        output = []
+        for text in texts:
+            if text not in results:
+                results[text] = self.cut(text)
+            output.append(list(results[text]))
+        return output
+
+    def keywords(self, text: str) -> List[str]:
+        """
+        分词并去掉停用词与纯符号
+
+        参数:
+            text: 文本
+
+        返回:
+            词列表
+        """
+        stopwords = self.stopwords
+        return [word for word in self.cut(text) if word not in stopwords and (word[0].isalnum() or len(word) > 1)]
+
+
+_shared: Dict[Tuple, ChineseTokenizer] = {}
+_shared_lock = threading.Lock()
+
+
+def get_tokenizer(dict_path: Optional[str] = None,
+                  stopwords: Optional[str] = None,
+                  cache_dir: Optional[str] = None) -> ChineseTokenizer:
+    """
+    获取按参数共享的分词器实例
+
+    参数:
+        dict_path: 词典文件路径
+        stopwords: 停用词文件路径
+        cache_dir: 词典缓存目录
+
+    返回:
+        分词器（同一进程内相同参数返回同一实例）
+    """
+    key = (dict_path, stopwords, cache_dir)
+    with _shared_lock:
+        tokenizer = _shared.get(key)
+        if tokenizer is None:
+            tokenizer = ChineseTokenizer(dict_path, stopwords, cache_dir)
+            _shared[key] = tokenizer
+    return tokenizer
+
+
+def preload(dict_path: Optional[str] = None,
+            stopwords: Optional[str] = None,
+            cache_dir: Optional[str] = None) -> ChineseTokenizer:
+    """
+    加载共享分词器的词典，在启动 worker 进程之前调用可让子进程共享词典
+
+    参数:
+        dict_path: 词典文件路径
+        stopwords: 停用词文件路径
+        cache_dir: 词典缓存目录
+
+    返回:
+        已加载词典的分词器
+    """
+    return get_tokenizer(dict_path, stopwords, cache_dir).load()
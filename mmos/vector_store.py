@@ -2,103 +2,520 @@
 简单的向量存储模块，用于语义搜索
 """
 
+import threading
+
 import numpy as np
-from typing import List, Dict, Any, Optional, Tuple, Callable
+from typing import List, Dict, Any, Optional, Tuple, Callable, Iterable
 
+from .filters import AttributeIndex, MemoryFilter
 from .models import Memory
 
 
+def _top_k_rows(scores: np.ndarray, k: int) -> np.ndarray:
+    """
+    从分数数组中选出前k个行号
+
+    使用 np.argpartition 做部分排序，再对候选行按(分数降序, 行号升序)排序，
+    与对全部结果做稳定排序得到的顺序完全一致（同分时先插入的在前）。
+
+    参数:
+        scores: 一维分数数组，无效行应为 -inf
+        k: 返回的数量
+
+    返回:
+        排好序的行号数组
+    """
+    n = scores.shape[0]
+    if k <= 0 or n == 0:
+        return np.empty(0, dtype=np.int64)
+    if k < n:
+        candidates = np.argpartition(-scores, k - 1)[:k]
+        kth = scores[candidates].min()
+        # 第k名存在并列时，按行号补齐，保证结果与稳定排序一致
+        above = np.flatnonzero(scores > kth)
+        ties = np.flatnonzero(scores == kth)
+        candidates = np.concatenate([above, ties[:k - above.shape[0]]])
+    else:
+        candidates = np.arange(n)
+    order = np.lexsort((candidates, -scores[candidates]))
+    return candidates[order]
+
+
+def _rerank_rows(matrix: np.ndarray, rows: np.ndarray,
+                 query_vector: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    对候选行逐行 np.dot 重新打分并取前k个
+
+    matrix 保存原始精度的向量时，分数与逐条 np.dot(query_vector, vector) 逐位一致，
+    排序（同分时行号小的在前）因此与逐条计算后稳定排序的结果相同。
+    排序使用原始分数，返回的余弦相似度截断到 [-1, 1]。
+
+    参数:
+        matrix: 向量矩阵
+        rows: 候选行号
+        query_vector: 查询向量
+        k: 返回的数量
+
+    返回:
+        (行号数组, 分数数组)
+    """
+    query_vector = np.asarray(query_vector).ravel()
+    exact = np.fromiter((np.dot(query_vector, matrix[row]) for row in rows.tolist()),
+                        dtype=np.float64, count=rows.shape[0])
+    order = np.lexsort((rows, -exact))[:k]
+    return rows[order], np.clip(exact[order], -1.0, 1.0)
+
+
 class SimpleVectorStore:
-    """简单的向量存储实现"""
-    
-    def __init__(self, 
+    """简单的向量存储实现
+
+    向量保存在一块连续、可扩容的 float32 矩阵中，通过 id↔行号 索引定位。
+    删除操作只留下墓碑标记，墓碑比例过高时再统一压缩。
+    写入与检索在同一把锁下访问矩阵（嵌入在锁外进行），超时后仍在运行的检索
+    不会与之后的写入交错。
+
+    默认只保存 float32 矩阵，初筛与精排都基于它。开启 keep_exact 时另存一份
+    原始精度（float64）的向量用于精排，初筛按 float32 舍入误差的上界放宽候选范围，
+    结果与逐条 np.dot 后稳定排序完全一致，代价是向量内存增加到三倍。
+    """
+
+    # 初始容量与扩容倍数
+    _INITIAL_CAPACITY = 64
+    _GROWTH_FACTOR = 2
+    # 墓碑行超过该比例时触发压缩
+    _COMPACT_RATIO = 0.25
+    # float32 初筛时额外保留的候选数，用于 float64 精排
+    _RERANK_PADDING = 8
+    # 过滤后的行数不超过该比例时只对这些行打分，否则全量打分后屏蔽其余行
+    _SUBSET_SCAN_RATIO = 0.3
+
+    def __init__(self,
                  embedding_function: Optional[Callable[[str], np.ndarray]] = None,
-                 dimension: int = 384):
+                 dimension: int = 384,
+                 batch_embedding_function: Optional[Callable[[List[str]], np.ndarray]] = None,
+                 keep_exact: bool = False):
         """
         初始化向量存储
-        
+
         参数:
             embedding_function: 将文本转换为向量的函数，如果为None则使用随机向量模拟
             dimension: 向量维度，仅在使用随机向量时有效
+            batch_embedding_function: 一次将多条文本转换为 (Q×D) 矩阵的函数，
+                为None时逐条调用 embedding_function
+            keep_exact: 是否另存原始精度（float64）的向量用于精排
         """
-        self.vectors: Dict[str, np.ndarray] = {}  # memory_id -> vector
         self.dimension = dimension
-        
+        self.keep_exact = keep_exact
+        self._matrix: Optional[np.ndarray] = None  # 行向量矩阵，懒分配
+        self._exact: Optional[np.ndarray] = None   # 原始精度的行向量，用于精排，keep_exact 时才分配
+        self._max_norm = 0.0                       # 写入过的向量的最大范数，用于估计初筛误差
+        self._dim = 0                              # 向量维度，首次写入时确定
+        self._alive = np.zeros(0, dtype=bool)      # 行是否有效
+        self._row_ids: List[Optional[str]] = []    # 行号 -> memory_id，墓碑为None
+        self._id_to_row: Dict[str, int] = {}       # memory_id -> 行号
+        self._size = 0                             # 已使用的行数（含墓碑）
+        self._tombstones = 0
+        self._attributes = AttributeIndex()        # 行号 -> 标签/元数据/时间/重要性
+        self._lock = threading.RLock()             # 保护以上全部状态，子类的覆盖方法可重入
+
         if embedding_function:
             self.embedding_function = embedding_function
         else:
             # 如果没有提供嵌入函数，使用随机向量模拟
-            self._rng = np.random.RandomState(42)  # 固定随机种子以保持一致性
             self.embedding_function = self._mock_embedding
-    
+        self.batch_embedding_function = batch_embedding_function
+
     def _mock_embedding(self, text: str) -> np.ndarray:
         """生成模拟的嵌入向量，仅用于演示"""
         # 基于文本内容生成一个伪随机但一致的向量
         # 实际应用中应替换为真实的嵌入模型
-        self._rng.seed(hash(text) % 2**32)
-        vector = self._rng.random(self.dimension) - 0.5  # -0.5~0.5范围的随机值
+        # 每次使用独立的随机数生成器，嵌入在锁外进行，并发调用之间互不影响
+        rng = np.random.RandomState(hash(text) % 2**32)
+        vector = rng.random(self.dimension) - 0.5  # -0.5~0.5范围的随机值
         return vector / np.linalg.norm(vector)  # 归一化
-    
+
+    def _embed_batch(self, texts: List[str]) -> np.ndarray:
+        """将多条文本一次性转换为 (Q×D) 矩阵，保留嵌入函数的原始精度"""
+        if self.batch_embedding_function:
+            vectors = self.batch_embedding_function(texts)
+        else:
+            vectors = [self.embedding_function(text) for text in texts]
+        return np.asarray(vectors).reshape(len(texts), -1)
+
+    @property
+    def vectors(self) -> Dict[str, np.ndarray]:
+        """
+        memory_id -> 向量 的只读视图（按插入顺序）
+
+        开启 keep_exact 时为原始精度（float64）的向量，否则为存储中的 float32 向量。
+        """
+        with self._lock:
+            matrix = self._exact if self._exact is not None else self._matrix
+            return {
+                memory_id: matrix[row]
+                for memory_id, row in self._id_to_row.items()
+            }
+
+    @property
+    def nbytes(self) -> int:
+        """向量数据占用的内存字节数（含预留容量）"""
+        if self._matrix is None:
+            return 0
+        return self._matrix.nbytes + (0 if self._exact is None else self._exact.nbytes)
+
+    def __len__(self) -> int:
+        return len(self._id_to_row)
+
+    def __contains__(self, memory_id: str) -> bool:
+        return memory_id in self._id_to_row
+
+    def missing_ids(self, memory_ids: Iterable[str]) -> List[str]:
+        """
+        批量找出尚未写入向量的记忆ID
+
+        参数:
+            memory_ids: 记忆ID序列
+
+        返回:
+            不在存储中的记忆ID，保持输入顺序
+        """
+        with self._lock:
+            id_to_row = self._id_to_row
+            return [memory_id for memory_id in memory_ids if memory_id not in id_to_row]
+
+    def _allocate(self, capacity: int, dimension: int) -> None:
+        """首次写入时分配存储"""
+        self._dim = dimension
+        self._matrix = np.zeros((capacity, dimension), dtype=np.float32)
+        if self.keep_exact:
+            self._exact = np.zeros((capacity, dimension), dtype=np.float64)
+        self._alive = np.zeros(capacity, dtype=bool)
+
+    def _resize(self, capacity: int) -> None:
+        """扩容到 capacity 行，保留已有数据"""
+        matrix = np.zeros((capacity,) + self._matrix.shape[1:], dtype=self._matrix.dtype)
+        matrix[:self._size] = self._matrix[:self._size]
+        if self._exact is not None:
+            exact = np.zeros((capacity,) + self._exact.shape[1:], dtype=self._exact.dtype)
+            exact[:self._size] = self._exact[:self._size]
+            self._exact = exact
+        alive = np.zeros(capacity, dtype=bool)
+        alive[:self._size] = self._alive[:self._size]
+        self._matrix = matrix
+        self._alive = alive
+
+    def _ensure_capacity(self, rows: int, dimension: int) -> None:
+        """保证矩阵至少能容纳 rows 行"""
+        if self._matrix is None:
+            self._allocate(max(self._INITIAL_CAPACITY, rows), dimension)
+        else:
+            capacity = self._matrix.shape[0]
+            if rows <= capacity:
+                return
+            while capacity < rows:
+                capacity *= self._GROWTH_FACTOR
+            self._resize(capacity)
+        self._attributes.reserve(self._matrix.shape[0])
+
+    def _compact(self) -> None:
+        """移除墓碑行，保持剩余行的相对顺序"""
+        keep = np.flatnonzero(self._alive[:self._size])
+        count = keep.shape[0]
+        self._attributes.compact(keep)
+        self._matrix[:count] = self._matrix[keep]
+        if self._exact is not None:
+            self._exact[:count] = self._exact[keep]
+        self._alive[:count] = True
+        self._alive[count:self._size] = False
+        self._row_ids = [self._row_ids[row] for row in keep]
+        self._id_to_row = {memory_id: row for row, memory_id in enumerate(self._row_ids)}
+        self._size = count
+        self._tombstones = 0
+
+    def _maybe_compact(self) -> None:
+        if self._tombstones and self._tombstones >= self._size * self._COMPACT_RATIO:
+            self._compact()
+
+    def _set_vector(self, memory_id: str, vector: np.ndarray) -> None:
+        """写入向量：已存在则原地覆盖，否则追加到末尾"""
+        vector = np.asarray(vector, dtype=np.float64).ravel()
+        row = self._id_to_row.get(memory_id)
+        if row is None:
+            self._ensure_capacity(self._size + 1, vector.shape[0])
+            row = self._size
+            self._size += 1
+            self._row_ids.append(memory_id)
+            self._id_to_row[memory_id] = row
+            self._alive[row] = True
+        if vector.shape[0] != self._dim:
+            raise ValueError(
+                f"向量维度不一致: 期望 {self._dim}，实际 {vector.shape[0]}"
+            )
+        self._write_row(row, vector)
+        if self._exact is not None:
+            self._exact[row] = vector
+        self._max_norm = max(self._max_norm, float(np.linalg.norm(vector)))
+
+    def _write_row(self, row: int, vector: np.ndarray) -> None:
+        """把向量写入指定行（转换为 float32）"""
+        self._matrix[row] = vector
+
     def add_memory(self, memory: Memory) -> None:
         """
         将记忆添加到向量存储中
-        
+
         参数:
             memory: 要添加的记忆对象
         """
-        vector = self.embedding_function(memory.content)
-        self.vectors[memory.id] = vector
-    
-    def similarity_search(self, query: str, top_k: int = 5) -> List[Tuple[str, float]]:
+        vector = np.asarray(self.embedding_function(memory.content)).reshape(1, -1)
+        with self._lock:
+            self._add_vectors([memory], vector)
+
+    def add_memories(self, memories: List[Memory]) -> None:
+        """
+        批量将记忆添加到向量存储中，所有内容一次性嵌入
+
+        参数:
+            memories: 要添加的记忆对象列表
+        """
+        if not memories:
+            return
+        vectors = self._embed_batch([memory.content for memory in memories])
+        with self._lock:
+            self._add_vectors(memories, vectors)
+
+    def _add_vectors(self, memories: List[Memory], vectors: np.ndarray) -> None:
+        """写入已嵌入的 (N×D) 向量与记忆属性，调用方需持有 self._lock"""
+        self._ensure_capacity(self._size + len(memories), vectors.shape[1])
+        for memory, vector in zip(memories, vectors):
+            self._set_vector(memory.id, vector)
+            self._attributes.set_memory(self._id_to_row[memory.id], memory)
+
+    def _score_rows(self, query_vector: np.ndarray) -> np.ndarray:
+        """计算查询向量与所有行的相似度，墓碑行为 -inf"""
+        query_vector = np.asarray(query_vector, dtype=np.float32).ravel()
+        scores = self._matrix[:self._size] @ query_vector
+        if self._tombstones:
+            scores[~self._alive[:self._size]] = -np.inf
+        return scores
+
+    def _score_matrix(self, query_matrix: np.ndarray) -> np.ndarray:
+        """计算 (Q×D) 查询矩阵与所有行的相似度，返回 (Q×N)，墓碑行为 -inf"""
+        scores = query_matrix.astype(np.float32) @ self._matrix[:self._size].T
+        if self._tombstones:
+            scores[:, ~self._alive[:self._size]] = -np.inf
+        return scores
+
+    def _score_subset(self, rows: np.ndarray, query_vector: np.ndarray) -> np.ndarray:
+        """只计算查询向量与指定行的相似度"""
+        query_vector = np.asarray(query_vector, dtype=np.float32).ravel()
+        return self._matrix[rows] @ query_vector
+
+    def _candidate_pool(self, top_k: int) -> int:
+        """初筛阶段保留的候选数"""
+        return top_k + self._RERANK_PADDING
+
+    def _select_candidates(self, scores: np.ndarray, pool: int,
+                           query_vector: np.ndarray) -> np.ndarray:
+        """
+        按 float32 分数选出精排的候选下标
+
+        保留前 pool 个，以及分数与第 pool 名之差不超过 float32 舍入误差上界的全部下标，
+        保证按原始精度排在前 pool 名的向量一定进入候选。
+
+        参数:
+            scores: float32 分数数组
+            pool: 候选数
+            query_vector: 查询向量
+
+        返回:
+            候选下标数组
+        """
+        candidates = _top_k_rows(scores, pool)
+        if self._exact is None or candidates.shape[0] == 0:
+            return candidates
+        # 点积的舍入误差不超过 (D+2)·u·|q|·|v|（u 为 float32 单位舍入），两侧各计一次并留出余量
+        margin = (4 * (self._dim + 2) * float(np.finfo(np.float32).eps)
+                  * float(np.linalg.norm(query_vector)) * self._max_norm)
+        near = np.flatnonzero(scores >= scores[candidates[-1]] - margin)
+        if near.shape[0] <= candidates.shape[0]:
+            return candidates
+        return np.union1d(candidates, near)
+
+    def _rerank(self, rows: np.ndarray, query_vector: np.ndarray,
+                k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """对候选行精排，返回 (行号数组, 分数数组)"""
+        matrix = self._exact if self._exact is not None else self._matrix
+        return _rerank_rows(matrix, rows, query_vector, k)
+
+    def similarity_search(self, query: str, top_k: int = 5,
+                          memory_filter: Optional[MemoryFilter] = None,
+                          allowed_ids: Optional[Iterable[str]] = None) -> List[Tuple[str, float]]:
         """
         基于语义相似度搜索记忆
-        
+
         参数:
             query: 查询字符串
             top_k: 返回的最大结果数
-            
+            memory_filter: 结构化过滤条件，在打分之前排除不满足条件的记忆；
+                按写入向量时的标签、元数据与重要性判断
+            allowed_ids: 只在这些记忆中检索，None表示不限制；记忆的属性会变化时
+                应由调用方按最新属性过滤后传入（如 MemoryManager.filter_ids 的结果）
+
         返回:
             包含(memory_id, 相似度分数)的列表，按相似度从高到低排序
         """
-        if not self.vectors:
+        if not self._id_to_row:
             return []
-            
+
         query_vector = self.embedding_function(query)
-        
+        with self._lock:
+            if not self._id_to_row:
+                return []
+            rows = self._restrict_rows(memory_filter, allowed_ids)
+            if rows is not None:
+                return self._search_filtered(query_vector, top_k, rows)
+            return self._search_vector(query_vector, top_k)
+
+    def _filter_rows(self, memory_filter: MemoryFilter) -> np.ndarray:
+        """满足过滤条件的有效行号（升序）"""
+        return self._attributes.select(memory_filter, self._alive[:self._size])
+
+    def _rows_of(self, memory_ids: Iterable[str]) -> np.ndarray:
+        """指定记忆中已写入向量的行号（升序）"""
+        id_to_row = self._id_to_row
+        return np.unique(np.fromiter((id_to_row[memory_id] for memory_id in memory_ids if memory_id in id_to_row),
+                                     dtype=np.int64))
+
+    def _restrict_rows(self, memory_filter: Optional[MemoryFilter],
+                       allowed_ids: Optional[Iterable[str]]) -> Optional[np.ndarray]:
+        """过滤条件与 allowed_ids 共同限定的行号（升序），不限制时为None"""
+        rows = None
+        if memory_filter is not None and not memory_filter.is_empty:
+            rows = self._filter_rows(memory_filter)
+        if allowed_ids is not None:
+            allowed = self._rows_of(allowed_ids)
+            rows = allowed if rows is None else np.intersect1d(rows, allowed, assume_unique=True)
+        return rows
+
+    def _search_filtered(self, query_vector: np.ndarray, top_k: int,
+                         rows: np.ndarray) -> List[Tuple[str, float]]:
+        """
+        只在指定行中执行 top-k 搜索
+
+        候选行较少时只对这些行打分；较多时全量打分再屏蔽其余行，
+        两种方式的结果顺序一致。近似索引在过滤时同样走精确搜索。
+        """
+        count = rows.shape[0]
+        if count == 0:
+            return []
+        pool = min(self._candidate_pool(top_k), count)
+        if count <= self._size * self._SUBSET_SCAN_RATIO:
+            # rows 升序，子集内的同分顺序与行号顺序一致
+            candidates = rows[self._select_candidates(self._score_subset(rows, query_vector), pool, query_vector)]
+        else:
+            scores = self._score_rows(query_vector)
+            allowed = np.zeros(self._size, dtype=bool)
+            allowed[rows] = True
+            scores[~allowed] = -np.inf
+            candidates = self._select_candidates(scores, pool, query_vector)
+        rows, exact = self._rerank(candidates, query_vector, min(top_k, count))
+        return [(self._row_ids[row], float(score)) for row, score in zip(rows, exact)]
+
+    def _search_vector(self, query_vector: np.ndarray, top_k: int) -> List[Tuple[str, float]]:
+        """对单个查询向量执行 top-k 搜索"""
+        # 一次矩阵-向量乘法计算全部余弦相似度（向量已归一化）
+        scores = self._score_rows(query_vector)
+        alive = len(self._id_to_row)
+        candidates = self._select_candidates(scores, min(self._candidate_pool(top_k), alive), query_vector)
+        rows, exact = self._rerank(candidates, query_vector, min(top_k, alive))
+        return [(self._row_ids[row], float(score)) for row, score in zip(rows, exact)]
+
+    def similarity_search_batch(self, queries: List[str], top_k: int = 5,
+                                memory_filter: Optional[MemoryFilter] = None,
+                                allowed_ids: Optional[Iterable[str]] = None
+                                ) -> List[List[Tuple[str, float]]]:
+        """
+        批量语义搜索
+
+        所有查询一次性嵌入，并通过一次 (Q×D)·(D×N) 矩阵乘法完成打分。
+
+        参数:
+            queries: 查询字符串列表
+            top_k: 每个查询返回的最大结果数
+            memory_filter: 结构化过滤条件，所有查询共用一次过滤结果
+            allowed_ids: 只在这些记忆中检索，同 similarity_search
+
+        返回:
+            与 queries 一一对应的结果列表，每项格式与 similarity_search 相同
+        """
+        if not queries:
+            return []
+        if not self._id_to_row:
+            return [[] for _ in queries]
+
+        query_matrix = self._embed_batch(queries)
+        with self._lock:
+            if not self._id_to_row:
+                return [[] for _ in queries]
+            rows = self._restrict_rows(memory_filter, allowed_ids)
+            if rows is not None:
+                return [self._search_filtered(query_vector, top_k, rows) for query_vector in query_matrix]
+            return self._search_batch(query_matrix, top_k)
+
+    def _search_batch(self, query_matrix: np.ndarray, top_k: int) -> List[List[Tuple[str, float]]]:
+        """对 (Q×D) 查询矩阵执行 top-k 搜索"""
+        scores = self._score_matrix(query_matrix)
+
+        alive = len(self._id_to_row)
         results = []
-        for memory_id, vector in self.vectors.items():
-            # 计算余弦相似度
-            similarity = np.dot(query_vector, vector)
-            results.append((memory_id, float(similarity)))
-        
-        # 按相似度从高到低排序
-        results.sort(key=lambda x: x[1], reverse=True)
-        return results[:top_k]
-    
+        for query_vector, query_scores in zip(query_matrix, scores):
+            candidates = self._select_candidates(query_scores, min(self._candidate_pool(top_k), alive),
+                                                 query_vector)
+            rows, exact = self._rerank(candidates, query_vector, min(top_k, alive))
+            results.append([(self._row_ids[row], float(score)) for row, score in zip(rows, exact)])
+        return results
+
     def remove_memory(self, memory_id: str) -> bool:
         """
         从向量存储中移除记忆
-        
+
         参数:
             memory_id: 要移除的记忆ID
-            
+
         返回:
             是否成功移除
         """
-        if memory_id in self.vectors:
-            del self.vectors[memory_id]
+        with self._lock:
+            row = self._id_to_row.pop(memory_id, None)
+            if row is None:
+                return False
+            self._attributes.discard(row)
+            self._alive[row] = False
+            self._row_ids[row] = None
+            self._tombstones += 1
+            self._maybe_compact()
             return True
-        return False
-    
+
     def update_memory(self, memory: Memory) -> None:
         """
         更新记忆的向量表示
-        
+
         参数:
             memory: 包含新内容的记忆对象
         """
         self.add_memory(memory)  # 直接覆盖现有向量
-    
+
     def clear(self) -> None:
         """清空向量存储"""
-        self.vectors = {} 
\ No newline at end of file
+        with self._lock:
+            self._matrix = None
+            self._exact = None
+            self._max_norm = 0.0
+            self._dim = 0
+            self._alive = np.zeros(0, dtype=bool)
+            self._row_ids = []
+            self._id_to_row = {}
+            self._size = 0
+            self._tombstones = 0
+            self._attributes.clear()
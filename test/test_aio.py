@@ -0,0 +1,116 @@
+import asyncio
+import threading
+
+import pytest
+
+from mmos import MMOSConfig, MMOSMemorySystem, ModuleConfig
+from mmos.aio import AsyncReadWriteLock, LoopLocal, run_blocking
+from mmos.embedding import EmbeddingService, LocalEmbedder
+
+
+def _system():
+    config = MMOSConfig()
+    config.modules["long_memory"] = ModuleConfig(enabled=True, params={"index": "flat", "dimension": 32})
+    return MMOSMemorySystem(config)
+
+
+def test_run_blocking_runs_off_the_event_loop():
+    async def main():
+        loop_thread = threading.get_ident()
+        worker_thread, value = await run_blocking(None, lambda x, y=0: (threading.get_ident(), x + y), 1, y=2)
+        return loop_thread != worker_thread, value
+
+    assert asyncio.run(main()) == (True, 3)
+
+
+def test_readers_share_and_writers_are_exclusive_and_not_starved():
+    events = []
+
+    async def reader(lock, name, hold):
+        async with lock.read():
+            events.append(("start", name))
+            await asyncio.sleep(hold)
+            events.append(("end", name))
+
+    async def writer(lock, name):
+        async with lock.write():
+            events.append(("start", name))
+            await asyncio.sleep(0.01)
+            events.append(("end", name))
+
+    async def main():
+        lock = AsyncReadWriteLock()
+        first = asyncio.ensure_future(reader(lock, "r1", 0.05))
+        second = asyncio.ensure_future(reader(lock, "r2", 0.05))
+        await asyncio.sleep(0)
+        pending_writer = asyncio.ensure_future(writer(lock, "w"))
+        await asyncio.sleep(0)
+        # 写者等待期间到达的读者排在写者之后
+        late = asyncio.ensure_future(reader(lock, "r3", 0))
+        await asyncio.gather(first, second, pending_writer, late)
+
+    asyncio.run(main())
+    assert events[:2] == [("start", "r1"), ("start", "r2")]
+    writer_start = events.index(("start", "w"))
+    assert events[writer_start + 1] == ("end", "w")
+    assert events.index(("end", "r1")) < writer_start and events.index(("end", "r2")) < writer_start
+    assert events.index(("start", "r3")) > writer_start
+
+
+def test_async_api_matches_sync_results():
+    async def main(system):
+        tea = await system.astore_memory("green tea every morning")
+        await system.astore_many(["black coffee after lunch", "jasmine tea at night"])
+        await system.aupdate_memory(tea.id, content="oolong tea every morning")
+        results = await asyncio.gather(*(system.aretrieve_memory("tea", timeout=None) for _ in range(5)))
+        return tea, results
+
+    system = _system()
+    tea, results = asyncio.run(main(system))
+    expected = [memory.id for memory in system.retrieve_memory("tea", timeout=None)]
+    assert tea.id in expected
+    assert all([memory.id for memory in result] == expected for result in results)
+    assert asyncio.run(system.adelete_memory(tea.id))
+    assert tea.id not in [memory.id for memory in system.retrieve_memory("tea", timeout=None)]
+    system.close()
+
+
+def test_async_api_works_across_event_loops():
+    system = _system()
+    system.max_concurrency = 1
+    embedder = EmbeddingService(LocalEmbedder(16), max_batch_size=1, max_concurrent_requests=1)
+
+    async def main(round_):
+        await system.astore_many([f"tea note {round_}-{i}" for i in range(3)])
+        results = await asyncio.gather(*(system.aretrieve_memory("tea", timeout=None) for _ in range(4)))
+        vectors = await embedder.aembed([f"文本{round_}-{i}" for i in range(4)])
+        return results, vectors
+
+    # 每次 asyncio.run 都是新的事件循环，信号量与读写锁不能沿用上一个循环的
+    for round_ in range(3):
+        results, vectors = asyncio.run(main(round_))
+        assert all(len(result) == 3 * (round_ + 1) for result in results)
+        assert len(vectors) == 4
+    system.close()
+
+
+def test_loop_local_values_and_single_loop_lock():
+    local = LoopLocal(object)
+
+    async def get_twice():
+        return local.get(), local.get()
+
+    first = asyncio.run(get_twice())
+    second = asyncio.run(get_twice())
+    assert first[0] is first[1] and second[0] is second[1]
+    assert first[0] is not second[0]
+
+    lock = AsyncReadWriteLock()
+
+    async def write():
+        async with lock.write():
+            pass
+
+    asyncio.run(write())
+    with pytest.raises(RuntimeError):
+        asyncio.run(write())
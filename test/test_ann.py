@@ -0,0 +1,66 @@
+import threading
+
+import numpy as np
+
+import mmos.ann as ann
+from mmos.ann import IVFVectorStore
+from mmos.models import Memory
+from mmos.vector_store import SimpleVectorStore
+
+
+def _embedding(dimension=16):
+    cache = {}
+    rng = np.random.RandomState(0)
+
+    def embed(text):
+        if text not in cache:
+            vector = rng.randn(dimension)
+            cache[text] = vector / np.linalg.norm(vector)
+        return cache[text]
+    return embed
+
+
+def _memories(start, stop, prefix="m"):
+    memories = []
+    for i in range(start, stop):
+        memory = Memory(f"{prefix}{i}")
+        memory.id = memory.content
+        memories.append(memory)
+    return memories
+
+
+def test_background_training_uses_a_snapshot_and_applies_under_lock(monkeypatch):
+    gate = threading.Event()
+    kmeans = ann.kmeans
+
+    def slow_kmeans(*args, **kwargs):
+        gate.wait(5)
+        return kmeans(*args, **kwargs)
+
+    monkeypatch.setattr(ann, "kmeans", slow_kmeans)
+    embed = _embedding()
+    store = IVFVectorStore(embedding_function=embed, nlist=4, nprobe=4, train_threshold=100)
+    exact = SimpleVectorStore(embedding_function=embed)
+    initial = _memories(0, 120)
+    store.add_memories(initial)
+    exact.add_memories(initial)
+    matrix = store._matrix
+
+    # 训练期间的写入：覆盖已有行、追加新行（触发扩容）
+    changed = [Memory("m3 重写"), *_memories(120, 200)]
+    changed[0].id = "m3"
+    store.add_memories(changed)
+    exact.add_memories(changed)
+    assert store._matrix is not matrix
+    assert not store.is_trained
+    assert store.similarity_search("m150", 1)[0][0] == "m150"
+
+    gate.set()
+    store.wait_for_training()
+    assert store.is_trained
+    size = store._size
+    expected = np.argmax(store._matrix[:size] @ store._centroids.T, axis=1)
+    assert (store._assign[:size] == expected).all()
+    # 扫描全部桶时结果与精确搜索一致
+    for query in ["m3 重写", "m10", "m199"]:
+        assert store.similarity_search(query, 5) == exact.similarity_search(query, 5)
@@ -0,0 +1,54 @@
+import json
+
+import pytest
+
+from mmos.bloom import BloomFilter, ScalableBloomFilter
+
+
+def test_no_false_negatives_and_false_positive_rate_near_target():
+    bloom = BloomFilter(capacity=2000, error_rate=0.01)
+    for i in range(2000):
+        bloom.add(f"词{i}")
+    assert all(f"词{i}" in bloom for i in range(2000))
+    false_positives = sum(f"其他{i}" in bloom for i in range(20000))
+    assert false_positives / 20000 < 0.02
+    # 写入时已被误判为存在的元素不计数
+    assert 1950 <= len(bloom) <= 2000
+
+
+def test_add_reports_new_items_and_rejects_bad_parameters():
+    bloom = BloomFilter(capacity=100)
+    assert bloom.add("上海")
+    assert not bloom.add("上海")
+    assert len(bloom) == 1
+    with pytest.raises(ValueError):
+        BloomFilter(capacity=0)
+    with pytest.raises(ValueError):
+        BloomFilter(error_rate=1.0)
+    with pytest.raises(ValueError):
+        ScalableBloomFilter(error_rate=0.0)
+
+
+def test_scalable_filter_grows_and_keeps_overall_error_rate():
+    bloom = ScalableBloomFilter(error_rate=0.01, initial_capacity=16)
+    for i in range(5000):
+        bloom.add(f"词{i}")
+    assert len(bloom._layers) > 1
+    assert all(f"词{i}" in bloom for i in range(5000))
+    false_positives = sum(f"其他{i}" in bloom for i in range(20000))
+    assert false_positives / 20000 < 0.02
+
+
+def test_round_trip_through_json():
+    bloom = ScalableBloomFilter(initial_capacity=8)
+    for i in range(50):
+        bloom.add(f"词{i}")
+    restored = ScalableBloomFilter.from_dict(json.loads(json.dumps(bloom.to_dict())))
+    assert len(restored) == len(bloom)
+    assert all(f"词{i}" in restored for i in range(50))
+    assert [f"其他{i}" in restored for i in range(500)] == [f"其他{i}" in bloom for i in range(500)]
+
+    data = BloomFilter(capacity=10).to_dict()
+    data["capacity"] = 1000
+    with pytest.raises(ValueError):
+        BloomFilter.from_dict(data)
@@ -0,0 +1,116 @@
+import math
+import random
+import threading
+
+import pytest
+
+from mmos.bm25 import BM25Index
+
+
+def _exhaustive(documents, query, k1=1.5, b=0.75, allowed=None):
+    """逐文档计算 BM25 分数，作为 MaxScore 剪枝结果的参照"""
+    n = len(documents)
+    avgdl = sum(len(tokens) for tokens in documents.values()) / n or 1.0
+    df = {}
+    for tokens in documents.values():
+        for term in set(tokens):
+            df[term] = df.get(term, 0) + 1
+    scores = {}
+    for memory_id, tokens in documents.items():
+        if allowed is not None and memory_id not in allowed:
+            continue
+        score = 0.0
+        for term in set(query):
+            tf = tokens.count(term)
+            if not tf:
+                continue
+            idf = math.log(1.0 + (n - df[term] + 0.5) / (df[term] + 0.5))
+            score += idf * tf * (k1 + 1) / (tf + k1 * (1 - b + b * len(tokens) / avgdl))
+        if score > 0:
+            scores[memory_id] = score
+    return scores
+
+
+def _assert_matches(results, reference, top_k):
+    expected = sorted(reference.values(), reverse=True)[:top_k]
+    assert [score for _, score in results] == pytest.approx(expected)
+    for memory_id, score in results:
+        assert reference[memory_id] == pytest.approx(score)
+
+
+def test_maxscore_matches_exhaustive_scoring():
+    rng = random.Random(0)
+    # 齐夫分布的词表：少数高频词与大量低频词，剪枝在低频词上生效
+    vocabulary = [f"w{i}" for i in range(300)]
+    weights = [1 / (i + 1) for i in range(len(vocabulary))]
+    index = BM25Index(tokenizer=str.split)
+    documents = {}
+    for i in range(600):
+        tokens = rng.choices(vocabulary, weights, k=rng.randint(3, 40))
+        documents[f"d{i}"] = tokens
+        index.add(f"d{i}", " ".join(tokens))
+    # 删除触发重新编号，替换改变文档长度与词频
+    for i in range(0, 600, 3):
+        del documents[f"d{i}"]
+        index.remove(f"d{i}")
+    for i in range(1, 600, 7):
+        tokens = rng.choices(vocabulary, weights, k=rng.randint(3, 40))
+        documents[f"d{i}"] = tokens
+        index.add(f"d{i}", " ".join(tokens))
+    assert len(index) == len(documents)
+
+    for _ in range(200):
+        query = rng.choices(vocabulary, weights, k=rng.randint(1, 6))
+        top_k = rng.choice([1, 5, 20])
+        _assert_matches(index.search(" ".join(query), top_k), _exhaustive(documents, query), top_k)
+
+    allowed = {memory_id for memory_id in documents if int(memory_id[1:]) % 2}
+    for _ in range(50):
+        query = rng.choices(vocabulary, weights, k=rng.randint(1, 6))
+        results = index.search(" ".join(query), 10, allowed_ids=allowed)
+        assert all(memory_id in allowed for memory_id, _ in results)
+        # idf 仍按全部文档计算
+        _assert_matches(results, _exhaustive(documents, query, allowed=allowed), 10)
+
+
+def test_ties_follow_insertion_order_and_cjk_unigrams_match():
+    index = BM25Index()
+    index.add("a", "上海 天气")
+    index.add("b", "上海 天气")
+    index.add("c", "北京")
+    assert [memory_id for memory_id, _ in index.search("上海", 5)] == ["a", "b"]
+    # 默认分词含中文单字，部分命中也能召回
+    assert [memory_id for memory_id, _ in index.search("北", 5)] == ["c"]
+    index.add("a", "北京 烤鸭")
+    assert [memory_id for memory_id, _ in index.search("上海", 5)] == ["b"]
+    assert index.search("不存在的词", 5) == []
+
+
+def test_concurrent_writes_and_searches():
+    index = BM25Index(tokenizer=str.split)
+    errors = []
+
+    def write(offset):
+        try:
+            for i in range(300):
+                index.add(f"{offset}-{i}", f"w{i % 17} w{i % 5} shared")
+                if i % 4 == 0:
+                    index.remove(f"{offset}-{i // 2}")
+        except Exception as error:
+            errors.append(error)
+
+    def search():
+        try:
+            for i in range(300):
+                index.search(f"w{i % 17} shared", 10)
+        except Exception as error:
+            errors.append(error)
+
+    threads = [threading.Thread(target=write, args=(n,)) for n in range(2)]
+    threads += [threading.Thread(target=search) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
+    assert len(index.search("shared", 1000)) == len(index)
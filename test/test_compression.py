@@ -0,0 +1,89 @@
+import random
+
+from mmos.compression import ContextCompressor, count_tokens, split_sentences
+
+_SENTENCES = [
+    "我们下周三去杭州开会。", "酒店订在西湖边，每晚 680 元！", "你还记得上次的报销流程吗？",
+    "不要忘了带笔记本电脑", "The flight leaves at 9.30 am.", "Why was the meeting moved?",
+    "预算还剩 12000 元；", "好的…", "Let me check the calendar", "会议室改到了三楼",
+    "客户说不需要额外的演示。", "We never got the final invoice!", "第二天上午参观工厂，下午返回。",
+]
+
+
+def _conversation(rng, turns):
+    messages = [{"role": "system", "content": "你是一个助理。"}]
+    for turn in range(turns):
+        role = "user" if turn % 2 == 0 else "assistant"
+        count = rng.randint(1, 6)
+        separator = rng.choice(["", " ", "\n"])
+        content = separator.join(rng.choice(_SENTENCES) for _ in range(count))
+        messages.append({"role": role, "content": content})
+    return messages
+
+
+def test_compressed_messages_never_exceed_the_budget():
+    rng = random.Random(7)
+    compressor = ContextCompressor(keep_last_rounds=1)
+    for _ in range(300):
+        messages = _conversation(rng, rng.randint(2, 12))
+        reserved = compressor.count_message_tokens(messages[:1] + messages[-2:])
+        budget = rng.randint(reserved, compressor.count_message_tokens(messages) + 5)
+        result = compressor.compress(messages, budget)
+        assert compressor.count_message_tokens(result) <= budget
+        assert result[0] == messages[0] and result[-1] == messages[-1]
+
+
+def test_budget_holds_for_non_additive_token_counter():
+    # 按整段字符计数：拼接处的空格与省略号都会计入
+    def by_characters(text):
+        return len(text)
+
+    rng = random.Random(11)
+    compressor = ContextCompressor(token_counter=by_characters, keep_last_rounds=1)
+    for _ in range(200):
+        messages = _conversation(rng, rng.randint(2, 10))
+        reserved = compressor.count_message_tokens(messages[:1] + messages[-2:])
+        budget = rng.randint(reserved, compressor.count_message_tokens(messages))
+        assert compressor.count_message_tokens(compressor.compress(messages, budget)) <= budget
+
+
+def test_compression_is_deterministic_and_keeps_sentence_order():
+    messages = _conversation(random.Random(3), 10)
+    budget = ContextCompressor().count_message_tokens(messages) // 2
+    first = ContextCompressor().compress(messages, budget)
+    assert ContextCompressor().compress(messages, budget) == first
+    assert ContextCompressor().compress(list(messages), budget) == first
+
+    originals = {message["content"]: split_sentences(message["content"]) for message in messages}
+    for message in first:
+        if message["content"] in originals:
+            continue
+        pieces = [piece for piece in message["content"].split("…") if piece.strip()]
+        source = next(content for content in originals if all(piece.strip() in content for piece in pieces))
+        positions = [source.index(piece.strip()) for piece in pieces]
+        assert positions == sorted(positions)
+
+
+def test_unchanged_messages_are_analyzed_once():
+    calls = []
+
+    def counting(text):
+        calls.append(text)
+        return count_tokens(text)
+
+    compressor = ContextCompressor(token_counter=counting, keep_last_rounds=1)
+    messages = _conversation(random.Random(5), 8)
+    budget = compressor.count_message_tokens(messages) // 2
+    compressor.compress(messages, budget)
+    analyzed = len(compressor._cache)
+
+    calls.clear()
+    messages.append({"role": "user", "content": "新的问题：明天几点出发？"})
+    messages.append({"role": "assistant", "content": "早上八点。"})
+    compressor.compress(messages, budget)
+    # 新消息各分析一次，旧消息命中缓存
+    assert len(compressor._cache) == analyzed + 2
+    assert "新的问题：明天几点出发？" in calls
+
+    compressor.compress(messages, budget)
+    assert len(compressor._cache) == analyzed + 2
@@ -0,0 +1,126 @@
+import asyncio
+import threading
+from array import array
+
+import pytest
+
+from mmos.embedding import EmbeddingCache, EmbeddingService, LocalEmbedder
+
+
+class _CountingEmbedder:
+    """记录每次调用的输入，可设置为抛出异常的 LocalEmbedder"""
+
+    def __init__(self, dimension=32):
+        self.embedder = LocalEmbedder(dimension)
+        self.calls = []
+        self.error = None
+
+    def __call__(self, texts):
+        self.calls.append(list(texts))
+        if self.error is not None:
+            raise self.error
+        return self.embedder(texts)
+
+
+def _float32(vectors):
+    return [array("f", vector) for vector in vectors]
+
+
+def _dot(a, b):
+    return sum(x * y for x, y in zip(a, b))
+
+
+def test_local_embedder_is_deterministic_and_normalized():
+    embed = LocalEmbedder(64)
+    first, second = embed(["我喜欢猫", "我喜欢猫"])
+    assert first == second
+    assert abs(_dot(first, first) - 1.0) < 1e-9
+    cat, dog, stock = embed(["我喜欢猫", "我喜欢狗", "特斯拉股价"])
+    assert _dot(cat, dog) > _dot(cat, stock)
+
+
+def test_duplicates_and_cached_texts_are_embedded_once():
+    embedder = _CountingEmbedder()
+    service = EmbeddingService(embedder)
+    vectors = service.embed(["猫", "狗", "猫"])
+    assert embedder.calls == [["猫", "狗"]]
+    assert vectors[0] == vectors[2] == _float32(embedder.embedder(["猫"]))[0]
+    assert service.embed(["狗", "鱼"])[0] == vectors[1]
+    assert embedder.calls[-1] == ["鱼"]
+    assert service.stats["cache_hits"] == 1
+    # 缓存以 float32 的 array 存放向量
+    assert all(isinstance(vector, array) and vector.typecode == "f"
+               for vector in service.cache._entries.values())
+
+
+def test_batches_respect_size_and_token_limits():
+    embedder = _CountingEmbedder()
+    service = EmbeddingService(embedder, max_batch_size=2, max_batch_tokens=5)
+    service.embed(["一", "二", "三", "四五六七八"])
+    assert embedder.calls == [["一", "二"], ["三"], ["四五六七八"]]
+
+
+def test_disk_cache_survives_restart(tmp_path):
+    path = str(tmp_path / "cache" / "embeddings.db")
+    embedder = _CountingEmbedder()
+    service = EmbeddingService(embedder, model_name="local", cache=EmbeddingCache(path=path))
+    expected = service.embed(["持久化的向量", "另一条"])
+    service.cache.close()
+
+    restarted = _CountingEmbedder()
+    service = EmbeddingService(restarted, model_name="local", cache=EmbeddingCache(path=path))
+    assert service.embed(["另一条", "持久化的向量"]) == expected[::-1]
+    assert restarted.calls == []
+    # 模型名参与缓存键，换模型后不会读到旧向量
+    other = EmbeddingService(restarted, model_name="other", cache=service.cache)
+    other.embed(["另一条"])
+    assert restarted.calls == [["另一条"]]
+    service.cache.close()
+
+
+def test_failed_request_is_not_cached_and_can_be_retried():
+    embedder = _CountingEmbedder()
+    embedder.error = RuntimeError("接口不可用")
+    service = EmbeddingService(embedder)
+    with pytest.raises(RuntimeError):
+        service.embed(["猫"])
+    assert len(service.cache) == 0
+    assert not service._inflight
+
+    embedder.error = None
+    assert service.embed(["猫"]) == _float32(embedder.embedder(["猫"]))
+    assert len(embedder.calls) == 2
+
+
+def test_concurrent_requests_share_one_call():
+    started = threading.Event()
+    release = threading.Event()
+    embedder = _CountingEmbedder()
+
+    def slow(texts):
+        started.set()
+        release.wait(5)
+        return embedder(texts)
+
+    service = EmbeddingService(slow)
+    results = []
+    owner = threading.Thread(target=lambda: results.append(service.embed(["猫"])))
+    owner.start()
+    started.wait(5)
+    waiter = threading.Thread(target=lambda: results.append(service.embed(["猫"])))
+    waiter.start()
+    release.set()
+    owner.join(5)
+    waiter.join(5)
+    assert results[0] == results[1]
+    assert embedder.calls == [["猫"]]
+    assert service.stats["inflight_hits"] == 1
+
+
+def test_async_embed_matches_sync():
+    embedder = _CountingEmbedder()
+    service = EmbeddingService(embedder, max_batch_size=1)
+    vectors = asyncio.run(service.aembed(["猫", "狗", "猫"]))
+    assert vectors == _float32(embedder.embedder(["猫", "狗", "猫"]))
+    assert sorted(text for call in embedder.calls for text in call) == ["狗", "猫"]
+    assert service.embed(["狗"]) == [vectors[1]]
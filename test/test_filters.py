@@ -0,0 +1,104 @@
+import random
+
+import numpy as np
+
+from mmos import MemoryManager
+from mmos.filters import AttributeIndex, MemoryFilter
+from mmos.models import Memory
+from mmos.vector_store import SimpleVectorStore
+
+_TAGS = ["工作", "生活", "旅行", "健康"]
+_CITIES = ["上海", "北京", "杭州"]
+
+
+def _random_memory(rng, i):
+    memory = Memory(f"记忆{i}", tags=rng.sample(_TAGS, rng.randint(0, 2)),
+                    metadata={"city": rng.choice(_CITIES), "level": rng.randint(1, 3), "raw": [1, 2]},
+                    importance=rng.choice([0.1, 0.3, 0.5, 0.7, 0.9]))
+    memory.id = f"m{i}"
+    memory.created_at = 1000.0 + rng.randint(0, 100)
+    return memory
+
+
+def _random_filter(rng):
+    options = {}
+    if rng.random() < 0.4:
+        options["tags"] = rng.sample(_TAGS, rng.randint(1, 2))
+    if rng.random() < 0.3:
+        options["any_tags"] = rng.sample(_TAGS, rng.randint(1, 3))
+    if rng.random() < 0.4:
+        city = rng.sample(_CITIES, rng.randint(1, 2))
+        options["metadata"] = {"city": city if len(city) > 1 else city[0]}
+        if rng.random() < 0.3:
+            options["metadata"]["level"] = rng.randint(1, 3)
+    if rng.random() < 0.4:
+        options["created_after"] = 1000.0 + rng.randint(0, 60)
+    if rng.random() < 0.3:
+        options["created_before"] = 1040.0 + rng.randint(0, 60)
+    if rng.random() < 0.4:
+        options["min_importance"] = rng.choice([0.2, 0.5, 0.7])
+    if rng.random() < 0.2:
+        options["max_importance"] = rng.choice([0.3, 0.5])
+    return MemoryFilter(**options)
+
+
+def test_attribute_masks_match_per_memory_checks():
+    rng = random.Random(0)
+    memories = [_random_memory(rng, i) for i in range(400)]
+    index = AttributeIndex()
+    for row, memory in enumerate(memories):
+        index.set_memory(row, memory)
+    alive = np.ones(len(memories), dtype=bool)
+    for row in rng.sample(range(len(memories)), 100):
+        alive[row] = False
+        index.discard(row)
+
+    for _ in range(300):
+        memory_filter = _random_filter(rng)
+        expected = [row for row, memory in enumerate(memories) if alive[row] and memory_filter.matches(memory)]
+        assert index.select(memory_filter, alive).tolist() == expected
+
+    # 压缩重排行号后结果不变
+    keep = np.flatnonzero(alive)
+    index.compact(keep)
+    survivors = [memories[row] for row in keep]
+    for _ in range(100):
+        memory_filter = _random_filter(rng)
+        expected = [row for row, memory in enumerate(survivors) if memory_filter.matches(memory)]
+        assert index.select(memory_filter, np.ones(len(survivors), dtype=bool)).tolist() == expected
+
+
+def test_records_round_trip_and_unhashable_metadata_is_ignored():
+    memory = Memory("内容", tags=["工作"], metadata={"city": "上海", "raw": [1, 2]}, importance=0.8)
+    index = AttributeIndex()
+    index.set_memory(0, memory)
+    record = index.record(0)
+    assert record == {"tags": ["工作"], "metadata": {"city": "上海"},
+                      "created_at": memory.created_at, "importance": 0.8}
+    rebuilt = AttributeIndex.from_records([record])
+    alive = np.ones(1, dtype=bool)
+    assert rebuilt.select(MemoryFilter(metadata={"city": ["北京", "上海"]}), alive).tolist() == [0]
+    assert rebuilt.select(MemoryFilter(metadata={"raw": [1, 2]}), alive).tolist() == []
+    assert MemoryFilter().is_empty and not MemoryFilter(min_importance=0.0).is_empty
+
+
+def test_filtered_vector_search_and_manager_agree_with_brute_force(tmp_path):
+    rng = random.Random(1)
+    memories = [_random_memory(rng, i) for i in range(300)]
+    store = SimpleVectorStore(dimension=16)
+    store.add_memories(memories)
+    manager = MemoryManager(str(tmp_path / "memories.json"))
+    for memory in memories:
+        manager.store(memory.content, tags=memory.tags, metadata=memory.metadata, importance=memory.importance)
+
+    for _ in range(100):
+        memory_filter = _random_filter(rng)
+        allowed = [memory.id for memory in memories if memory_filter.matches(memory)]
+        # 过滤后的检索等价于只在满足条件的记忆上做精确检索
+        results = store.similarity_search("查询", 10, memory_filter=memory_filter)
+        assert results == store.similarity_search("查询", 10, allowed_ids=allowed)
+        assert {memory_id for memory_id, _ in results} <= set(allowed)
+        assert len(results) == min(10, len(allowed))
+        expected = [memory.id for memory in manager.get_all() if memory_filter.matches(memory)]
+        assert manager.filter_ids(memory_filter) == expected
+    manager.close()
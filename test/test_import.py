@@ -0,0 +1,21 @@
+import json
+import os
+import subprocess
+import sys
+
+# import mmos 时不应加载的可选或较重的依赖
+HEAVY_MODULES = ["numpy", "openai", "hnswlib", "pydantic", "chromadb", "sklearn", "dotenv", "zstandard"]
+
+
+def test_import_mmos_stays_light():
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ, PYTHONPATH=root + os.pathsep + os.environ.get("PYTHONPATH", ""))
+    probe = f"import mmos, sys, json; print(json.dumps([m for m in {HEAVY_MODULES!r} if m in sys.modules]))"
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", probe], env=env, check=True,
+                            capture_output=True, text=True)
+    assert json.loads(result.stdout) == []
+    # -X importtime 把每个导入的模块写到 stderr，最后一列为模块名
+    imported = {line.rsplit("|", 1)[-1].strip().split(".")[0]
+                for line in result.stderr.splitlines() if line.startswith("import time:")}
+    assert "mmos" in imported
+    assert imported.isdisjoint(HEAVY_MODULES)
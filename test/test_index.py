@@ -0,0 +1,38 @@
+import random
+
+from mmos import MemoryManager
+from mmos.index import substring_tokens
+
+
+def _manager(contents):
+    manager = MemoryManager()
+    for content in contents:
+        manager.store(content)
+    return manager
+
+
+def test_edge_words_and_single_characters_use_index():
+    manager = _manager(["I write cpython extensions", "我喜欢猫", "machine learning notes"])
+    for query in ["python", "猫", "machine learning", "thon ext"]:
+        assert substring_tokens(query), query
+        assert manager._text_index.search(query) is not None, query
+
+
+def test_indexed_retrieve_matches_linear_scan():
+    rng = random.Random(3)
+    words = ["python", "cpython", "pythonic", "go", "golang", "学习", "机器学习", "猫", "data", "database"]
+    manager = _manager(
+        " ".join(rng.choice(words) for _ in range(rng.randint(1, 5))) + rng.choice(["", "。", " 猫狗"])
+        for _ in range(300)
+    )
+    for query in ["python", "thon", "Pyth", "on go", "猫", "学", "机器", "go", "data", "ythonic go", "猫狗"]:
+        expected = [m.id for m in manager.memories.values() if query.lower() in m.content.lower()]
+        assert [m.id for m in manager.retrieve(query, limit=1000)] == expected, query
+
+
+def test_updated_content_is_reindexed():
+    manager = _manager(["blue shirts"])
+    memory = manager.get_all()[0]
+    manager.update(memory.id, content="green tea")
+    assert manager.retrieve("shirts") == []
+    assert [m.id for m in manager.retrieve("tea")] == [memory.id]
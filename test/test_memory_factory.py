@@ -0,0 +1,163 @@
+import threading
+
+import pytest
+
+from mmos import MemoryManager, MMOSConfig, MMOSMemorySystem, ModuleConfig
+
+
+def _system(memory_manager=None):
+    config = MMOSConfig()
+    config.modules["long_memory"] = ModuleConfig(enabled=True, params={"index": "flat", "dimension": 32})
+    return MMOSMemorySystem(config, memory_manager=memory_manager)
+
+
+def _keyword_hits(system, query):
+    return [memory_id for memory_id, _ in system.sparse_index.search(query, 10)]
+
+
+def _vector_top(system, query):
+    return system.vector_store.similarity_search(query, 1)[0][0]
+
+
+def _assert_indexes_match_manager(system):
+    ids = {memory.id for memory in system.memory_manager.get_all()}
+    assert len(system.sparse_index) == len(ids)
+    assert all(memory_id in system.sparse_index for memory_id in ids)
+    assert len(system.vector_store) == len(ids)
+    assert system.vector_store.missing_ids(ids) == []
+
+
+def test_update_and_delete_keep_both_indexes_in_sync():
+    system = _system()
+    tea = system.store_memory("green tea every morning")
+    coffee = system.store_memory("black coffee after lunch")
+    system.update_memory(tea.id, content="jasmine tea in the evening")
+
+    assert _keyword_hits(system, "morning") == []
+    assert _keyword_hits(system, "jasmine") == [tea.id]
+    assert _vector_top(system, "jasmine tea in the evening") == tea.id
+
+    system.delete_memory(coffee.id)
+    assert _keyword_hits(system, "coffee") == []
+    assert coffee.id not in system.vector_store
+    assert [m.id for m in system.retrieve_memory("coffee", timeout=None)] == [tea.id]
+    _assert_indexes_match_manager(system)
+    system.close()
+
+
+def test_failed_batch_leaves_indexes_unchanged():
+    system = _system()
+    kept = system.store_memory("weekly team meeting on monday")
+
+    with pytest.raises(RuntimeError):
+        with system.batch():
+            system.store_memory("draft that never commits")
+            system.update_memory(kept.id, content="meeting moved to friday")
+            raise RuntimeError("中断")
+
+    assert _keyword_hits(system, "draft") == []
+    assert _keyword_hits(system, "friday") == []
+    assert _keyword_hits(system, "monday") == [kept.id]
+    assert _vector_top(system, "weekly team meeting on monday") == kept.id
+    _assert_indexes_match_manager(system)
+
+    with system.batch():
+        added = system.store_memory("quarterly planning in april")
+        system.update_memory(kept.id, content="meeting moved to friday")
+    assert _keyword_hits(system, "april") == [added.id]
+    assert _keyword_hits(system, "friday") == [kept.id]
+    _assert_indexes_match_manager(system)
+    system.close()
+
+
+def test_clear_and_reopen_rebuild_indexes(tmp_path):
+    path = str(tmp_path / "memories.json")
+    system = _system(MemoryManager(path))
+    memories = system.store_many([f"note number {i} about topic{i % 3}" for i in range(9)])
+    system.delete_memory(memories[0].id)
+    system.update_memory(memories[1].id, content="rewritten note about gardening")
+    system.memory_manager.close()
+
+    reopened = _system(MemoryManager(path))
+    _assert_indexes_match_manager(reopened)
+    assert _keyword_hits(reopened, "gardening") == [memories[1].id]
+    assert memories[0].id not in reopened.vector_store
+
+    reopened.memory_manager.clear()
+    assert len(reopened.sparse_index) == 0
+    assert len(reopened.vector_store) == 0
+    assert reopened.retrieve_memory("note", timeout=None) == []
+    reopened.close()
+
+
+def test_failing_source_is_logged_and_skipped(caplog):
+    system = _system()
+    kept = system.store_memory("green tea every morning")
+
+    def broken(query, top_k, allowed_ids=None):
+        raise RuntimeError("向量检索不可用")
+
+    system.vector_store.similarity_search = broken
+    with caplog.at_level("WARNING", logger="mmos.memory_factory"):
+        results = system.retrieve_memory("tea", timeout=None)
+    assert [m.id for m in results] == [kept.id]
+    assert "vector" in caplog.text and "向量检索不可用" in caplog.text
+    system.close()
+
+
+def test_timed_out_searches_do_not_race_writers():
+    system = _system()
+    memories = system.store_many([f"note number {i} about topic{i % 5}" for i in range(200)])
+    errors = []
+
+    def search():
+        try:
+            for i in range(50):
+                system.retrieve_memory(f"topic{i % 5}", timeout=0)
+        except Exception as error:
+            errors.append(error)
+
+    threads = [threading.Thread(target=search) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    # 删除触发压缩、追加触发扩容，都会重排矩阵
+    for memory in memories[:150]:
+        system.delete_memory(memory.id)
+    system.store_many([f"later note {i}" for i in range(300)])
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    _assert_indexes_match_manager(system)
+    system.close()
+
+
+def test_return_scores_reports_each_source_and_fused_score():
+    system = _system()
+    tea = system.store_memory("green tea every morning")
+    system.store_memory("black coffee after lunch")
+
+    results = system.retrieve_memory("green tea every morning", limit=1, timeout=None, return_scores=True)
+    assert [memory.id for memory, _ in results] == [tea.id]
+    scores = results[0][1]
+    assert set(scores) == {"keyword", "vector", "fused"}
+    assert scores["fused"] == pytest.approx(1 / 61 + 1 / 61)
+    system.close()
+
+
+def test_indexing_lazily_loaded_memories_keeps_them_unbuilt(tmp_path):
+    path = str(tmp_path / "memories.json")
+    system = _system(MemoryManager(path))
+    stored = system.store_many([f"note number {i} about topic{i % 3}" for i in range(6)])
+    # 延迟构建只作用于快照中的记录
+    system.memory_manager.save_to_storage()
+    system.close()
+
+    manager = MemoryManager(path, lazy_load=True)
+    reopened = _system(manager)
+    # 建立检索索引只读原始记录，不构建 Memory 对象
+    assert all(type(value) is tuple for value in manager._raw_memories())
+    assert sorted(_keyword_hits(reopened, "topic1")) == sorted([stored[1].id, stored[4].id])
+    assert _vector_top(reopened, "note number 2 about topic2") == stored[2].id
+    _assert_indexes_match_manager(reopened)
+    reopened.close()
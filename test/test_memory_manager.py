@@ -0,0 +1,113 @@
+import os
+
+import pytest
+
+from mmos import MemoryManager
+
+
+def _state(manager):
+    return {memory.id: (memory.content, sorted(memory.tags), memory.importance)
+            for memory in manager.get_all()}
+
+
+def test_failed_batch_rolls_back_memory_indexes_and_log(tmp_path):
+    path = str(tmp_path / "memories.json")
+    manager = MemoryManager(path)
+    existing = manager.store("原始内容", tags=["a"])
+    events = []
+    manager.add_listener(lambda op, memory_id, memory: events.append((op, memory_id)))
+    before = _state(manager)
+
+    with pytest.raises(RuntimeError):
+        with manager.batch():
+            manager.store("批量中新增")
+            manager.update(existing.id, content="批量中修改", tags=["b"])
+            manager.delete(existing.id)
+            raise RuntimeError("中断")
+
+    assert _state(manager) == before
+    assert [m.id for m in manager.retrieve("原始")] == [existing.id]
+    assert manager.retrieve("批量") == []
+    assert [m.id for m in manager.get_by_tags(["a"])] == [existing.id]
+    assert manager.get_by_tags(["b"]) == []
+    assert events == []
+    manager.close()
+    assert _state(MemoryManager(path)) == before
+
+
+def test_committed_batch_persists_and_notifies(tmp_path):
+    path = str(tmp_path / "memories.json")
+    manager = MemoryManager(path)
+    existing = manager.store("原始内容")
+    events = []
+    manager.add_listener(lambda op, memory_id, memory: events.append((op, memory_id)))
+
+    with manager.batch():
+        added = manager.store("批量中新增")
+        manager.update(existing.id, content="批量中修改")
+        assert events == []
+    assert events == [("update", existing.id)]
+    expected = _state(manager)
+    manager.close()
+
+    reopened = MemoryManager(path)
+    assert _state(reopened) == expected
+    assert {m.id for m in reopened.retrieve("批量中")} == {added.id, existing.id}
+    reopened.close()
+
+
+def test_batch_writes_the_log_once_at_the_outermost_exit(tmp_path):
+    path = str(tmp_path / "memories.json")
+    manager = MemoryManager(path, compact_threshold=1000)
+    manager.store("批量之前")
+    log_size = os.path.getsize(path + ".log")
+
+    with manager.batch():
+        outer = manager.store("外层新增")
+        # 内层异常被外层捕获时不回滚，以最外层为准
+        with pytest.raises(KeyError):
+            with manager.batch():
+                inner = manager.store("内层新增")
+                raise KeyError("内层中断")
+        assert os.path.getsize(path + ".log") == log_size
+    assert os.path.getsize(path + ".log") > log_size
+    expected = _state(manager)
+    assert {outer.id, inner.id} <= set(expected)
+    manager.close()
+    assert _state(MemoryManager(path)) == expected
+
+
+def test_store_many_accepts_strings_and_keyword_dicts(tmp_path):
+    path = str(tmp_path / "memories.json")
+    manager = MemoryManager(path)
+    memories = manager.store_many(["纯文本", {"content": "带标签", "tags": ["偏好"], "importance": 0.8}])
+    assert [m.content for m in memories] == ["纯文本", "带标签"]
+    assert [m.id for m in manager.get_by_tags(["偏好"])] == [memories[1].id]
+    expected = _state(manager)
+    manager.close()
+    assert _state(MemoryManager(path)) == expected
+
+
+def test_failed_load_keeps_previous_state(tmp_path):
+    path = str(tmp_path / "memories.json")
+    manager = MemoryManager(path)
+    for i in range(5):
+        manager.store(f"第{i}条记忆")
+    manager.save_to_storage()
+    expected = _state(manager)
+    with open(path, "r", encoding="utf-8") as f:
+        text = f.read()
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(text[:len(text) * 2 // 3])
+
+    # 重新加载失败时保持加载前的记忆与索引
+    manager.load_from_storage()
+    assert _state(manager) == expected
+    assert len(manager.retrieve("记忆")) == 5
+    manager.close()
+
+    # 启动时加载失败则为空，不保留读到一半的记忆
+    broken = MemoryManager(path)
+    assert broken.count() == 0
+    assert broken.retrieve("记忆") == []
+    broken.close()
@@ -0,0 +1,97 @@
+import numpy as np
+import pytest
+
+from mmos.models import Memory
+from mmos.quantization import QuantizedVectorStore
+from mmos.vector_store import SimpleVectorStore
+
+_DIMENSION = 32
+
+
+def _clustered(count, seed, centers):
+    rng = np.random.RandomState(seed)
+    vectors = centers[np.arange(count) % centers.shape[0]] + 0.6 * rng.randn(count, _DIMENSION)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+@pytest.fixture(scope="module")
+def corpus():
+    centers = np.random.RandomState(0).randn(20, _DIMENSION)
+    data = {f"m{i}": vector for i, vector in enumerate(_clustered(3000, 1, centers))}
+    queries = {f"q{i}": vector for i, vector in enumerate(_clustered(100, 2, centers))}
+    vectors = {**data, **queries}
+    memories = []
+    for memory_id in data:
+        memory = Memory(memory_id)
+        memory.id = memory_id
+        memories.append(memory)
+    exact = SimpleVectorStore(embedding_function=vectors.__getitem__)
+    exact.add_memories(memories)
+    return vectors, memories, list(queries), exact
+
+
+def _recall(store, exact, queries, k=10):
+    hits = 0
+    for query in queries:
+        expected = {memory_id for memory_id, _ in exact.similarity_search(query, k)}
+        hits += len(expected & {memory_id for memory_id, _ in store.similarity_search(query, k)})
+    return hits / (k * len(queries))
+
+
+# pq 精排时用解码后的向量召回有限，传入 rerank_vectors 用原始向量精排后大幅提升
+@pytest.mark.parametrize("precision, rerank_with_originals, minimum", [
+    ("float16", False, 0.99),
+    ("int8", False, 0.95),
+    ("pq", False, 0.35),
+    ("pq", True, 0.8),
+])
+def test_recall_against_exact_search(corpus, precision, rerank_with_originals, minimum):
+    vectors, memories, queries, exact = corpus
+    rerank_vectors = None
+    if rerank_with_originals:
+        def rerank_vectors(memory_ids):
+            return np.stack([vectors[memory_id] for memory_id in memory_ids])
+    store = QuantizedVectorStore(embedding_function=vectors.__getitem__, precision=precision,
+                                 pq_train_threshold=1000, rerank_vectors=rerank_vectors)
+    store.add_memories(memories)
+    assert store.is_lossy
+    assert store.nbytes < exact.nbytes
+    assert _recall(store, exact, queries) >= minimum
+
+
+def test_pq_stays_exact_until_trained_and_encodes_existing_vectors(corpus):
+    vectors, memories, queries, exact = corpus
+    store = QuantizedVectorStore(embedding_function=vectors.__getitem__, precision="pq", pq_train_threshold=500)
+    store.add_memories(memories[:499])
+    assert not store.is_lossy
+    partial = SimpleVectorStore(embedding_function=vectors.__getitem__)
+    partial.add_memories(memories[:499])
+    assert [memory_id for memory_id, _ in store.similarity_search(queries[0], 5)] == \
+        [memory_id for memory_id, _ in partial.similarity_search(queries[0], 5)]
+
+    store.add_memories(memories[499:])
+    assert store.is_lossy
+    assert store._matrix.dtype == np.uint8 and store._matrix.shape[1] == 8
+    # 训练后写入、删除与清空都基于码字
+    store.remove_memory("m0")
+    assert "m0" not in store and len(store) == len(memories) - 1
+    store.clear()
+    assert not store.is_lossy and store.similarity_search(queries[0], 5) == []
+
+
+def test_int8_scores_are_clipped_cosines(corpus):
+    vectors, memories, queries, _ = corpus
+    store = QuantizedVectorStore(embedding_function=vectors.__getitem__, precision="int8")
+    store.add_memories(memories[:200])
+    for _, score in store.similarity_search("m5", 5):
+        assert -1.0 <= score <= 1.0
+    assert store.similarity_search("m5", 1)[0][0] == "m5"
+
+
+def test_invalid_precision_and_dimension_are_rejected():
+    with pytest.raises(ValueError):
+        QuantizedVectorStore(precision="float8")
+    store = QuantizedVectorStore(precision="pq", pq_m=5, dimension=32)
+    memory = Memory("内容")
+    with pytest.raises(ValueError):
+        store.add_memory(memory)
@@ -0,0 +1,33 @@
+import pytest
+
+from mmos.retrieval import fuse, reciprocal_rank_fusion, weighted_score_fusion
+
+
+def test_rrf_rewards_agreement_between_sources():
+    results = {
+        "keyword": [("a", 9.0), ("b", 5.0), ("c", 1.0)],
+        "vector": [("b", 0.9), ("d", 0.8), ("a", 0.1)],
+    }
+    fused = reciprocal_rank_fusion(results)
+    assert [memory_id for memory_id, _ in fused] == ["b", "a", "d", "c"]
+    assert fused[0][1] == pytest.approx(1 / 62 + 1 / 61)
+    # 权重为0的来源不影响排序
+    assert [memory_id for memory_id, _ in reciprocal_rank_fusion(results, {"vector": 0.0})] == ["a", "b", "c", "d"]
+
+
+def test_weighted_fusion_normalizes_each_source():
+    results = {
+        "keyword": [("a", 30.0), ("b", 20.0), ("c", 10.0)],
+        "vector": [("c", 0.9), ("a", 0.5)],
+    }
+    fused = dict(weighted_score_fusion(results, {"vector": 2.0}))
+    assert fused == pytest.approx({"a": 1.0, "b": 0.5, "c": 2.0})
+    # 单条结果或全部同分时归一化为1
+    assert weighted_score_fusion({"keyword": [("x", 3.0), ("y", 3.0)]}) == [("x", 1.0), ("y", 1.0)]
+
+
+def test_ties_keep_first_seen_order_and_unknown_method_fails():
+    results = {"keyword": [("a", 1.0)], "vector": [("b", 1.0)]}
+    assert [memory_id for memory_id, _ in fuse(results)] == ["a", "b"]
+    with pytest.raises(ValueError):
+        fuse(results, "max")
@@ -0,0 +1,69 @@
+from mmos.memory.short_memory.short_memory import test_cases
+from mmos.segmentation import TopicSegmenter
+
+
+def _identical(texts):
+    """把任意两轮都视为完全相同的嵌入函数"""
+    return [[1.0, 0.0] for _ in texts]
+
+
+def test_prefilter_keeps_follow_ups_in_current_topic():
+    for case in test_cases:
+        turns = [message["content"] for message in case["messages"] if message["role"] == "user"]
+        replies = [message["content"] for message in case["messages"] if message["role"] == "assistant"] + [""]
+        segmenter = TopicSegmenter(_identical, similarity_threshold=0.5, prefilter_error_rate=0.01)
+        labels = segmenter.update(turns, replies)
+        assert (labels[-1] == labels[0]) == case["expected_result"], turns
+
+
+def test_prefilter_rejects_unrelated_turn_without_embedding():
+    calls = []
+
+    def embed(texts):
+        calls.append(list(texts))
+        return _identical(texts)
+
+    segmenter = TopicSegmenter(embed, prefilter_error_rate=0.01)
+    assert segmenter.update(["如何煮意大利面"], ["水开后煮8分钟加盐"]) == [0]
+    assert segmenter.update(["如何煮意大利面", "特斯拉股票今天涨了吗"]) == [0, 1]
+    assert calls == []
+    assert segmenter.stats["rejected"] == 2
+    assert segmenter.update(["如何煮意大利面", "特斯拉股票今天涨了吗", "那它明天呢"]) == [0, 1, 1]
+    assert sorted(text for batch in calls for text in batch) == ["特斯拉股票今天涨了吗", "那它明天呢"]
+
+
+def test_rewritten_earlier_turn_restarts_segmentation():
+    vectors = {"猫": [1.0, 0.0], "狗": [0.0, 1.0]}
+    calls = []
+
+    def embed(texts):
+        calls.append(list(texts))
+        return [vectors[text[0]] for text in texts]
+
+    segmenter = TopicSegmenter(embed)
+    assert segmenter.update(["猫粮", "狗绳", "猫砂"]) == [0, 1, 0]
+    assert segmenter.update(["猫粮", "狗绳", "猫砂", "狗粮"]) == [0, 1, 0, 1]
+    assert calls[-1] == ["狗粮"]
+    # 中间一轮被改写而最后一轮不变，也要整体重新切分
+    assert segmenter.update(["猫粮", "猫抓板", "猫砂", "狗粮"]) == [0, 0, 0, 1]
+    assert calls[-1] == ["猫粮", "猫抓板", "猫砂", "狗粮"]
+
+    restored = TopicSegmenter.from_dict(segmenter.to_dict(), embed)
+    assert restored.update(["猫粮", "猫抓板", "猫砂", "狗粮", "猫窝"]) == [0, 0, 0, 1, 0]
+    assert calls[-1] == ["猫窝"]
+
+
+def test_short_memory_with_local_service_needs_no_openai_client():
+    from mmos.embedding import EmbeddingService, LocalEmbedder
+    from mmos.memory.short_memory.short_memory import ShortMemory
+
+    short_memory = ShortMemory(EmbeddingService(LocalEmbedder(64)))
+    messages = [
+        {"role": "user", "content": "我喜欢猫"},
+        {"role": "assistant", "content": "猫很可爱"},
+        {"role": "user", "content": "特斯拉股价"},
+    ]
+    segments = short_memory.split_message(messages, instant_count=0, similarity_threshold=0.5)
+    assert [[item["content"] for item in segment] for segment in segments] == \
+        [["我喜欢猫", "猫很可爱"], ["特斯拉股价"]]
+    assert short_memory._client is None and short_memory._async_client is None
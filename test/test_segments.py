@@ -0,0 +1,100 @@
+import os
+
+import numpy as np
+import pytest
+
+from mmos.filters import MemoryFilter
+from mmos.models import Memory
+from mmos.segments import SegmentedVectorStore
+from mmos.vector_store import SimpleVectorStore
+
+
+def _embedding(dimension=16):
+    def embed(text):
+        vector = np.random.RandomState(sum(map(ord, text))).randn(dimension)
+        return vector / np.linalg.norm(vector)
+    return embed
+
+
+def _memories(start, stop):
+    memories = []
+    for i in range(start, stop):
+        memory = Memory(f"记忆{i}", tags=["偶数" if i % 2 == 0 else "奇数"])
+        memory.id = f"m{i}"
+        memories.append(memory)
+    return memories
+
+
+def _assert_same_results(actual, expected):
+    # 封存段按 float32 保存，分数与原始精度的计算只差舍入误差
+    assert [memory_id for memory_id, _ in actual] == [memory_id for memory_id, _ in expected]
+    assert [score for _, score in actual] == pytest.approx([score for _, score in expected], abs=1e-6)
+
+
+def _store(directory, **kwargs):
+    return SegmentedVectorStore(str(directory), embedding_function=_embedding(), **kwargs)
+
+
+def test_reopen_restores_vectors_deletes_and_attributes(tmp_path):
+    store = _store(tmp_path, seal_threshold=20, max_segments=3)
+    exact = SimpleVectorStore(embedding_function=_embedding())
+    memories = _memories(0, 95)
+    store.add_memories(memories[:50])
+    for memory in memories[50:]:
+        store.add_memory(memory)
+    exact.add_memories(memories)
+    for memory_id in ["m3", "m40", "m90"]:
+        store.remove_memory(memory_id)
+        exact.remove_memory(memory_id)
+    assert len(store.segments) <= 3
+    store.flush()
+
+    reopened = _store(tmp_path)
+    assert len(reopened) == len(exact) == 92
+    # 打开时只映射文件，.ids 在第一次返回结果时才读取
+    assert all(segment._ids is None for segment in reopened.segments)
+    assert reopened.missing_ids(["m3", "m4", "m90", "new"]) == ["m3", "m90", "new"]
+    assert all(segment._ids is None for segment in reopened.segments)
+    for query in ["记忆7", "记忆88", "另一个查询"]:
+        _assert_same_results(reopened.similarity_search(query, 5), exact.similarity_search(query, 5))
+        even = MemoryFilter(tags=["偶数"])
+        _assert_same_results(reopened.similarity_search(query, 5, memory_filter=even),
+                             exact.similarity_search(query, 5, memory_filter=even))
+
+
+def test_replaced_vectors_shadow_sealed_ones_after_reopen(tmp_path):
+    store = _store(tmp_path, seal_threshold=10)
+    store.add_memories(_memories(0, 10))
+    assert len(store.segments) == 1
+    replaced = Memory("完全不同的内容")
+    replaced.id = "m5"
+    store.add_memory(replaced)
+    store.flush()
+
+    reopened = _store(tmp_path)
+    assert len(reopened) == 10
+    assert reopened.similarity_search("完全不同的内容", 1)[0][0] == "m5"
+    assert reopened.similarity_search("完全不同的内容", 1)[0][1] > 0.999
+
+
+def test_other_process_changes_are_seen_on_refresh_and_clear_retires_files(tmp_path):
+    writer = _store(tmp_path, seal_threshold=1000)
+    reader = _store(tmp_path)
+    writer.add_memories(_memories(0, 30))
+    writer.flush()
+    assert len(reader) == 0
+    reader.refresh()
+    assert len(reader) == 30
+
+    writer.remove_memory("m1")
+    writer.flush()
+    reader.refresh()
+    assert "m1" not in reader and "m2" in reader
+
+    writer.clear()
+    reader.refresh()
+    assert len(reader) == 0
+    # 清空后的段文件至少再过一代清单才删除
+    writer.flush()
+    writer.flush()
+    assert not [name for name in os.listdir(tmp_path) if name.endswith(".vec")]
@@ -0,0 +1,121 @@
+import json
+import sys
+
+import pytest
+
+import mmos.storage as storage
+from mmos import MemoryManager
+
+
+def _state(manager):
+    return {memory.id: (memory.content, sorted(memory.tags), memory.importance)
+            for memory in manager.get_all()}
+
+
+def _records():
+    return [{"id": str(i), "content": "记录\"\\" + "x" * (i * 7 % 23), "tags": ["a"],
+             "metadata": {"n": 12345.678, "e": 1.5e-7, "neg": -42}, "importance": 0.5,
+             "created_at": 1712345678.123456, "last_accessed": 1.0, "access_count": i}
+            for i in range(20)]
+
+
+@pytest.mark.parametrize("chunk_size", range(1, 17))
+def test_json_snapshot_parses_across_any_chunk_boundary(tmp_path, monkeypatch, chunk_size):
+    monkeypatch.setattr(storage, "_CHUNK_SIZE", chunk_size)
+    path = str(tmp_path / "snapshot.json")
+    records = _records()
+    documents = [
+        {"memories": {r["id"]: r for r in records}, "last_saved": 1234567.891},
+        {"last_saved": 12345, "memories": {r["id"]: r for r in records}, "x": [1, {"a": 2e10}]},
+        {},
+        {"memories": {}},
+    ]
+    for document in documents:
+        for indent in (None, 2):
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(document, f, indent=indent, ensure_ascii=False)
+            assert list(storage.iter_snapshot(path)) == list(document.get("memories", {}).values())
+
+
+@pytest.mark.parametrize("text", ['{"memories": {"a": {"id": "a"}', '{"memories": {"a": {"id": "a"} "b": 1}}'])
+def test_malformed_json_snapshot_raises_value_error(tmp_path, monkeypatch, text):
+    monkeypatch.setattr(storage, "_CHUNK_SIZE", 5)
+    path = str(tmp_path / "snapshot.json")
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(text)
+    with pytest.raises(ValueError):
+        list(storage.iter_snapshot(path))
+
+
+def test_log_replay_restores_state(tmp_path):
+    path = str(tmp_path / "memories.json")
+    manager = MemoryManager(path, compact_threshold=1000)
+    kept = manager.store("喜欢喝绿茶", tags=["偏好"])
+    edited = manager.store("住在上海")
+    removed = manager.store("临时记录")
+    manager.update(edited.id, content="住在杭州", importance=0.9)
+    manager.delete(removed.id)
+    expected = _state(manager)
+    manager.close()
+
+    reopened = MemoryManager(path)
+    assert _state(reopened) == expected
+    assert [m.id for m in reopened.retrieve("杭州")] == [edited.id]
+    assert reopened.retrieve("上海") == []
+    assert [m.id for m in reopened.get_by_tags(["偏好"])] == [kept.id]
+    reopened.close()
+
+
+def test_compaction_then_more_writes_round_trip(tmp_path):
+    path = str(tmp_path / "memories.json")
+    manager = MemoryManager(path, compact_threshold=5)
+    memories = [manager.store(f"第{i}条记忆") for i in range(12)]
+    manager.delete(memories[3].id)
+    manager.update(memories[7].id, tags=["重要"])
+    expected = _state(manager)
+    manager.close()
+
+    reopened = MemoryManager(path, snapshot_format="binary")
+    assert _state(reopened) == expected
+    reopened.store("压缩后写入")
+    reopened.save_to_storage()
+    expected = _state(reopened)
+    reopened.close()
+    assert _state(MemoryManager(path)) == expected
+
+
+def test_torn_log_tail_is_skipped_and_logged(tmp_path, caplog):
+    path = str(tmp_path / "memories.json")
+    manager = MemoryManager(path, compact_threshold=1000)
+    for i in range(3):
+        manager.store(f"第{i}条记忆")
+    expected = _state(manager)
+    manager.close()
+    # 模拟崩溃时写了一半的记录
+    with open(path + ".log", "a", encoding="utf-8") as f:
+        f.write('{"op":"put","memory":{"id":"x","cont')
+
+    with caplog.at_level("WARNING", logger="mmos.storage"):
+        reopened = MemoryManager(path)
+    assert _state(reopened) == expected
+    assert "跳过损坏的日志记录" in caplog.text
+    reopened.close()
+
+
+def _zstd_snapshot(tmp_path):
+    path = tmp_path / "memories.bin"
+    header = storage._HEADER.pack(storage._MAGIC, storage.SNAPSHOT_VERSION, storage._COMPRESSIONS["zstd"], 0.0)
+    path.write_bytes(header + b"\x00not zstd data" * 16)
+    return str(path)
+
+
+def test_zstd_snapshot_without_zstandard_raises_value_error(tmp_path, monkeypatch):
+    monkeypatch.setitem(sys.modules, "zstandard", None)
+    with pytest.raises(ValueError, match="zstandard"):
+        list(storage.iter_snapshot(_zstd_snapshot(tmp_path)))
+
+
+def test_corrupt_zstd_snapshot_raises_value_error(tmp_path):
+    pytest.importorskip("zstandard")
+    with pytest.raises(ValueError, match="已损坏"):
+        list(storage.iter_snapshot(_zstd_snapshot(tmp_path)))
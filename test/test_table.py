@@ -0,0 +1,92 @@
+import pickle
+import random
+
+import numpy as np
+import pytest
+
+from mmos import MemoryManager
+from mmos.filters import MemoryFilter
+from mmos.models import Memory
+from mmos.table import MemoryTable
+
+
+def _columns(table, memories):
+    """按表的行序取出记忆的属性，用于与表中的列逐项比较"""
+    by_id = {memory.id: memory for memory in memories}
+    rows = [by_id[memory_id] for memory_id in table._row_ids]
+    return (np.array([memory.importance for memory in rows]),
+            np.array([memory.access_count for memory in rows]))
+
+
+def test_columns_stay_aligned_through_swap_removal():
+    rng = random.Random(0)
+    table = MemoryTable()
+    memories = {}
+    order = []
+    for step in range(500):
+        if memories and rng.random() < 0.3:
+            memory_id = rng.choice(list(memories))
+            assert table.remove(memory_id)
+            del memories[memory_id]
+            order.remove(memory_id)
+        else:
+            memory = Memory(f"记忆{step}", importance=rng.random())
+            memory.access_count = step
+            table.put(memory)
+            memories[memory.id] = memory
+            order.append(memory.id)
+    assert len(table) == len(memories)
+    importance, access_count = _columns(table, memories.values())
+    assert (table.importance == importance).all()
+    assert (table.access_count == access_count).all()
+    # ids() 按插入顺序返回，与行序无关
+    assert table.ids() == order
+    assert not table.remove("不存在")
+
+
+def test_memory_changes_are_mirrored_and_views_are_read_only():
+    table = MemoryTable()
+    memory = Memory("内容", importance=0.2)
+    table.put(memory)
+    memory.update_importance(0.9)
+    memory.access()
+    assert table.importance.tolist() == [0.9]
+    assert table.access_count.tolist() == [memory.access_count]
+    with pytest.raises(ValueError):
+        table.importance[0] = 0.0
+    # 反序列化的副本不再关联原表
+    copy = pickle.loads(pickle.dumps(memory))
+    copy.update_importance(0.1)
+    assert table.importance.tolist() == [0.9]
+
+
+def test_put_record_matches_put_and_select_uses_ranges():
+    records = [(f"m{i}", f"内容{i}", [], {}, i / 10, 1000.0 + i, 2000.0 + i, i) for i in range(10)]
+    from_records = MemoryTable()
+    from_memories = MemoryTable()
+    for record in records:
+        from_records.put_record(record)
+        from_memories.put(Memory.from_record(record))
+    for column in ("importance", "created_at", "last_accessed", "access_count"):
+        assert (getattr(from_records, column) == getattr(from_memories, column)).all()
+    selected = from_records.ids(from_records.select(MemoryFilter(created_after=1003.0, max_importance=0.6)))
+    assert selected == ["m3", "m4", "m5", "m6"]
+
+
+def test_forget_uses_retention_scores(tmp_path):
+    manager = MemoryManager(str(tmp_path / "memories.json"))
+    now = 1_000_000.0
+    kept = manager.store("重要且最近访问", importance=0.9)
+    faded = manager.store("很久没访问", importance=0.9)
+    minor = manager.store("不重要", importance=0.1)
+    for memory, accessed in ((kept, now), (faded, now - 30 * 86400), (minor, now)):
+        memory.last_accessed = accessed
+        manager.table.refresh(memory)
+
+    scores = manager.table.retention_scores(half_life=7 * 86400, now=now)
+    assert scores.tolist() == pytest.approx([0.9, 0.9 * 0.5 ** (30 / 7), 0.1])
+    assert manager.forget(0.2, half_life=7 * 86400, now=now) == [faded.id, minor.id]
+    assert [memory.id for memory in manager.get_all()] == [kept.id]
+    with pytest.raises(ValueError):
+        manager.table.retention_scores(half_life=0, now=now)
+    manager.close()
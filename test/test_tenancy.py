@@ -0,0 +1,124 @@
+import threading
+
+import pytest
+
+from mmos import MMOSConfig, ModuleConfig
+from mmos.tenancy import QuotaExceededError, TenantMemorySystem
+
+
+def _config(long_memory=False):
+    config = MMOSConfig()
+    if long_memory:
+        config.modules["long_memory"] = ModuleConfig(enabled=True, params={"index": "flat", "dimension": 16})
+    return config
+
+
+def test_tenants_are_isolated_and_reloaded_after_eviction(tmp_path):
+    tenants = TenantMemorySystem(_config(), data_path=str(tmp_path), max_loaded_tenants=2)
+    for name in ["alice", "bob", "carol"]:
+        tenants.store_memory(name, f"{name} likes green tea")
+    # 超过上限时卸载最久未使用的空闲租户
+    assert tenants.loaded_tenants == ["bob", "carol"]
+
+    results = tenants.retrieve_memory("alice", "tea", timeout=None)
+    assert [memory.content for memory in results] == ["alice likes green tea"]
+    assert tenants.loaded_tenants == ["carol", "alice"]
+    assert tenants.evict("carol") and tenants.loaded_tenants == ["alice"]
+    assert not tenants.evict("carol")
+    assert [memory.content for memory in tenants.retrieve_memory("carol", "tea", timeout=None)] == \
+        ["carol likes green tea"]
+    tenants.close()
+
+    reopened = TenantMemorySystem(_config(), data_path=str(tmp_path))
+    assert reopened.tenant("bob").memory_manager.count() == 1
+    reopened.close()
+
+
+def test_leased_tenants_are_not_evicted(tmp_path):
+    tenants = TenantMemorySystem(_config(), data_path=str(tmp_path), max_loaded_tenants=1)
+    with tenants.lease("alice") as alice:
+        tenants.store_memory("bob", "bob's note")
+        assert tenants.loaded_tenants == ["alice"]
+        assert not tenants.evict("alice")
+        alice.store_memory("alice's note")
+    # 租约归还后才按上限卸载
+    tenants.store_memory("carol", "carol's note")
+    assert tenants.loaded_tenants == ["carol"]
+    assert tenants.tenant("alice").memory_manager.count() == 1
+    tenants.close()
+
+
+def test_memory_quota_rejects_whole_batches(tmp_path):
+    tenants = TenantMemorySystem(_config(), data_path=str(tmp_path), max_memories_per_tenant=3)
+    tenants.store_many("alice", ["一", "二"])
+    with pytest.raises(QuotaExceededError):
+        tenants.store_many("alice", ["三", "四"])
+    assert tenants.tenant("alice").memory_manager.count() == 2
+    tenants.store_memory("alice", "三")
+    with pytest.raises(QuotaExceededError):
+        tenants.store_memory("alice", "四")
+    # 配额按租户计算
+    tenants.store_many("bob", ["一", "二", "三"])
+    tenants.close()
+
+
+def test_quota_applies_to_writes_through_lease_and_tenant(tmp_path):
+    tenants = TenantMemorySystem(_config(), data_path=str(tmp_path), max_memories_per_tenant=2)
+    with tenants.lease("alice") as alice:
+        alice.store_memory("一")
+        with pytest.raises(QuotaExceededError):
+            alice.store_many(["二", "三"])
+        alice.memory_manager.store("二")
+        with pytest.raises(QuotaExceededError):
+            alice.memory_manager.store("三")
+    with pytest.raises(QuotaExceededError):
+        tenants.tenant("alice").store_memory("三")
+    assert tenants.tenant("alice").memory_manager.count() == 2
+    tenants.close()
+
+
+def test_concurrent_writes_never_exceed_the_quota():
+    tenants = TenantMemorySystem(_config(), max_memories_per_tenant=50)
+    rejected = []
+
+    def write():
+        for i in range(30):
+            try:
+                tenants.store_memory("alice", f"记忆{i}")
+            except QuotaExceededError:
+                rejected.append(i)
+
+    threads = [threading.Thread(target=write) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert tenants.tenant("alice").memory_manager.count() == 50
+    assert len(rejected) == 4 * 30 - 50
+    tenants.close()
+
+
+def test_vector_quota_applies_when_long_memory_is_enabled(tmp_path):
+    tenants = TenantMemorySystem(_config(long_memory=True), data_path=str(tmp_path),
+                                 max_vectors_per_tenant=2)
+    tenants.store_many("alice", ["green tea", "black coffee"])
+    with pytest.raises(QuotaExceededError):
+        tenants.store_memory("alice", "oolong")
+    tenants.close()
+
+
+def test_vector_quota_counts_stored_vectors(tmp_path):
+    tenants = TenantMemorySystem(_config(long_memory=True), data_path=str(tmp_path),
+                                 max_vectors_per_tenant=2)
+    with tenants.lease("alice") as alice:
+        # 直接写入记忆管理器的记忆不建立向量，不占用向量配额
+        alice.memory_manager.store("plain note")
+        tea = alice.store_memory("green tea")
+        alice.store_memory("black coffee")
+        assert len(alice.vector_store) == 2
+        with pytest.raises(QuotaExceededError):
+            alice.store_memory("oolong")
+        alice.delete_memory(tea.id)
+        alice.store_memory("oolong")
+        assert alice.memory_manager.count() == 3
+    tenants.close()
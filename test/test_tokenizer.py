@@ -0,0 +1,84 @@
+import os
+
+import pytest
+
+from mmos import tokenizer as tokenizer_module
+from mmos.tokenizer import ChineseTokenizer, get_tokenizer
+
+_DICTIONARY = """\
+北京 500 NS
+大学 800 NN
+北京大学 300 NT
+生 200 NN
+大学生 400 NN
+活 100 VV
+生活 600 NN
+增长 300 VV
+"""
+
+
+@pytest.fixture
+def dict_path(tmp_path):
+    path = tmp_path / "dict.txt"
+    path.write_text(_DICTIONARY, encoding="utf-8")
+    return str(path)
+
+
+def test_max_probability_segmentation(dict_path, tmp_path):
+    tokenizer = ChineseTokenizer(dict_path, cache_dir=str(tmp_path / "cache"))
+    assert tokenizer.cut("北京大学生活") == ["北京大学", "生活"]
+    assert tokenizer.cut("北京大学生") == ["北京", "大学生"]
+    # 未登录字按单字切分，字母数字串（含小数与百分号）整体保留并转为小写
+    assert tokenizer.cut("营收增长3.5% GPT4 好") == ["营", "收", "增长", "3.5%", "gpt4", "好"]
+
+
+def test_without_dictionary_falls_back_to_bigrams(tmp_path):
+    tokenizer = ChineseTokenizer(cache_dir=str(tmp_path / "cache"))
+    assert tokenizer.cut("北京大学") == ["北京", "京大", "大学"]
+
+
+def test_results_are_cached_and_keywords_drop_stopwords(dict_path, tmp_path):
+    tokenizer = ChineseTokenizer(dict_path, stopwords=["生活"], cache_dir=str(tmp_path / "cache"))
+    first = tokenizer.cut("北京大学生活")
+    first.append("被修改")
+    assert tokenizer.cut("北京大学生活") == ["北京大学", "生活"]
+    assert tokenizer.stats == {"calls": 2, "cache_hits": 1}
+    assert tokenizer.cut_batch(["北京", "北京"]) == [["北京"], ["北京"]]
+    assert tokenizer.stats["calls"] == 3
+    assert tokenizer.keywords("北京大学生活！") == ["北京大学"]
+
+
+def test_dictionary_cache_is_reused_and_invalidated(dict_path, tmp_path, monkeypatch):
+    cache_dir = str(tmp_path / "cache")
+    ChineseTokenizer(dict_path, cache_dir=cache_dir).load()
+    assert [name for name in os.listdir(cache_dir) if name.endswith(".bin")]
+
+    parsed = []
+    original = tokenizer_module._write_cache
+    monkeypatch.setattr(tokenizer_module, "_write_cache",
+                        lambda *args: parsed.append(args) or original(*args))
+    assert ChineseTokenizer(dict_path, cache_dir=cache_dir).cut("北京大学生活") == ["北京大学", "生活"]
+    assert parsed == []
+
+    # 词典变化后重新解析
+    with open(dict_path, "a", encoding="utf-8") as f:
+        f.write("北京大学生活 100000 NN\n")
+    os.utime(dict_path, ns=(0, 1))
+    assert ChineseTokenizer(dict_path, cache_dir=cache_dir).cut("北京大学生活") == ["北京大学生活"]
+    assert len(parsed) == 1
+
+
+@pytest.mark.skipif(not hasattr(os, "getuid"), reason="需要支持用户ID的平台")
+def test_cache_in_a_shared_writable_directory_is_ignored(dict_path, tmp_path):
+    cache_dir = tmp_path / "shared"
+    cache_dir.mkdir()
+    os.chmod(cache_dir, 0o777)
+    tokenizer = ChineseTokenizer(dict_path, cache_dir=str(cache_dir))
+    assert tokenizer.cut("北京大学生活") == ["北京大学", "生活"]
+    assert os.listdir(cache_dir) == []
+
+
+def test_get_tokenizer_shares_instances(dict_path, tmp_path):
+    cache_dir = str(tmp_path / "cache")
+    assert get_tokenizer(dict_path, cache_dir=cache_dir) is get_tokenizer(dict_path, cache_dir=cache_dir)
+    assert get_tokenizer(dict_path, cache_dir=cache_dir) is not get_tokenizer(None, cache_dir=cache_dir)
@@ -0,0 +1,58 @@
+import numpy as np
+import pytest
+
+from mmos.ann import create_vector_store
+from mmos.models import Memory
+from mmos.vector_store import SimpleVectorStore
+
+
+def _store(keep_exact, count=300, dimension=24):
+    rng = np.random.RandomState(0)
+    vectors = {}
+    for i in range(count):
+        vector = rng.randn(dimension)
+        vectors[f"m{i}"] = vector / np.linalg.norm(vector)
+    queries = {f"q{i}": vector / np.linalg.norm(vector) for i, vector in enumerate(rng.randn(5, dimension))}
+    table = {**vectors, **queries}
+    store = SimpleVectorStore(lambda text: table[text], dimension=dimension, keep_exact=keep_exact)
+    memories = []
+    for memory_id in vectors:
+        memory = Memory(memory_id)
+        memory.id = memory_id
+        memories.append(memory)
+    store.add_memories(memories)
+    return store, vectors, queries
+
+
+def _stable_top(vectors, query, k):
+    scored = [(memory_id, float(np.dot(query, vector))) for memory_id, vector in vectors.items()]
+    scored.sort(key=lambda item: -item[1])
+    return scored[:k]
+
+
+def test_float32_copy_only_by_default():
+    store, vectors, queries = _store(keep_exact=False)
+    assert store._exact is None
+    assert store.nbytes == store._matrix.nbytes
+    assert next(iter(store.vectors.values())).dtype == np.float32
+    for query in queries.values():
+        results = store._search_vector(query, 10)
+        expected = _stable_top(vectors, query, 10)
+        assert [memory_id for memory_id, _ in results] == [memory_id for memory_id, _ in expected]
+        assert [score for _, score in results] == pytest.approx([score for _, score in expected], abs=1e-6)
+
+
+def test_keep_exact_matches_stable_float64_ranking():
+    store, vectors, queries = _store(keep_exact=True)
+    assert store.nbytes == store._matrix.nbytes + store._exact.nbytes
+    exported = store.vectors
+    assert all(exported[memory_id].dtype == np.float64 and (exported[memory_id] == vector).all()
+               for memory_id, vector in vectors.items())
+    for name, query in queries.items():
+        assert store.similarity_search(name, 10) == _stable_top(vectors, query, 10)
+
+
+def test_create_vector_store_passes_keep_exact():
+    assert not create_vector_store({"index": "flat"}).keep_exact
+    assert create_vector_store({"index": "flat", "keep_exact": True}).keep_exact
+    assert create_vector_store({"index": "ivf", "keep_exact": True}).keep_exact